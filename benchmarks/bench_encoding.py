@@ -0,0 +1,37 @@
+import time
+from jocoin.blockstruct import BlockStruct
+from jocoin.serialization import serialize, deserialize
+from .chaingen import make_keys, build_chain
+
+BLOCKS = 200
+TXS_PER_BLOCK = 20
+
+
+def per_block(f, blocks):
+    start = time.perf_counter()
+    results = [f(block) for block in blocks]
+    return results, (time.perf_counter() - start) / len(blocks) * 1e6
+
+
+def fresh(blocks):
+    # Copies whose txs have not cached their encoding yet
+    return [BlockStruct.from_bytes(block.encoded()) for block in blocks]
+
+
+if __name__ == "__main__":
+    keys = make_keys(32)
+    chain = build_chain(BLOCKS, TXS_PER_BLOCK, keys)
+    blocks = list(chain.block_iter())[:-1]
+    json_data, json_encode = per_block(serialize, fresh(blocks))
+    _, json_decode = per_block(lambda data: BlockStruct.from_json(deserialize(data)), json_data)
+    binary_data, binary_encode = per_block(lambda block: block.encoded(), fresh(blocks))
+    _, cached_encode = per_block(lambda block: block.encoded(), blocks)
+    _, binary_decode = per_block(BlockStruct.from_bytes, binary_data)
+    json_size = sum(len(data.encode('utf-8')) for data in json_data) / len(blocks)
+    binary_size = sum(len(data) for data in binary_data) / len(blocks)
+    print("{} blocks of about {} txs".format(len(blocks), TXS_PER_BLOCK + 1))
+    print("{:<24} {:>12} {:>12}".format("", "json", "binary"))
+    print("{:<24} {:>12.0f} {:>12.0f}".format("size (bytes/block)", json_size, binary_size))
+    print("{:<24} {:>12.1f} {:>12.1f}".format("encode (us/block)", json_encode, binary_encode))
+    print("{:<24} {:>12} {:>12.1f}".format("encode, cached txs", "", cached_encode))
+    print("{:<24} {:>12.1f} {:>12.1f}".format("decode (us/block)", json_decode, binary_decode))
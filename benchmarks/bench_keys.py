@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import time
+import jocoin.crypto as jc
+
+LENGTHS = [512, 1024, 2048]
+ROUNDS = 3
+STARTS = 10
+
+
+def list_sieve(n):
+    # How the prime table used to be built, on every import
+    primes = [2]
+    candidates = list(range(3, n, 2))
+    while True:
+        p = candidates.pop(0)
+        if p > (n ** (1/2)):
+            primes.append(p)
+            break
+        candidates = [c for c in candidates if c % p != 0]
+        primes.append(p)
+    return primes + candidates
+
+
+def elapsed(f, *args):
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def startup_time(code):
+    # Seconds for a fresh interpreter to run `code`, as each CLI command does
+    start = time.perf_counter()
+    for i in range(STARTS):
+        subprocess.run([sys.executable, "-c", code], check=True)
+    return (time.perf_counter() - start) / STARTS
+
+
+def keygen_time(length, workers):
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        jc.gen_keys(length, workers)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    print("{:>28} {:>10}".format("startup", "ms"))
+    for name, code in [("python", "pass"), ("import jocoin.crypto", "import jocoin.crypto")]:
+        print("{:>28} {:>10.1f}".format(name, startup_time(code) * 1000))
+    print("{:>28} {:>10.1f}".format("prime table, old sieve", elapsed(list_sieve, jc.PRIME_LIMIT) * 1000))
+    print("{:>28} {:>10.1f}".format("prime table, new sieve", elapsed(jc.sieve, jc.PRIME_LIMIT) * 1000))
+    workers = sorted(set([0, os.cpu_count()]))
+    print()
+    # gen_keys' length is that of each prime, so n has twice as many bits
+    print("{:>8} {}".format("length", "".join("{:>16}".format("{} workers (s)".format(w)) for w in workers)))
+    for length in LENGTHS:
+        print("{:>8} {}".format(length, "".join("{:>16.2f}".format(keygen_time(length, w)) for w in workers)))
+
+
+if __name__ == "__main__":
+    main()
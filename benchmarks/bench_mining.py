@@ -0,0 +1,69 @@
+import os
+import time
+from jocoin.hashing import hash_
+from jocoin.mining import MiningPool
+from .chaingen import make_keys, build_chain, make_transfers, make_block
+
+TX_COUNTS = [0, 10, 50]
+DURATION = 1.0
+
+
+def hashrate(step):
+    # Hashes per second for a function advancing the nonce by one
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        for i in range(100):
+            step(count)
+            count += 1
+    return count / (time.perf_counter() - start)
+
+
+def block_serialization(block):
+    # Hashing as it was done before headers: the whole block, txs and all,
+    #   re-serialized for every nonce
+    def step(nonce):
+        return hash_(block.with_nonce(nonce))
+    return step
+
+
+def header_serialization(block):
+    def step(nonce):
+        return hash_(block.with_nonce(nonce).header())
+    return step
+
+
+def pool_hashrate(block, workers):
+    pool = MiningPool(workers)
+    pool.start()
+    try:
+        # Warm up so process startup is not counted
+        start = time.perf_counter()
+        pool.mine(block, 0, lambda: time.perf_counter() - start < DURATION / 4)
+        before = pool.hashes.value
+        start = time.perf_counter()
+        pool.mine(block, 0, lambda: time.perf_counter() - start < DURATION)
+        return (pool.hashes.value - before) / (time.perf_counter() - start)
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    keys = make_keys(8)
+    chain = build_chain(10, 5, keys)
+    print("{:>6} {:>14} {:>14} {:>14} {:>8}".format("txs", "block (H/s)", "header (H/s)", "midstate (H/s)", "speedup"))
+    # Only the serialized size matters here, so the block need not be valid
+    transfers = make_transfers(chain, keys, len(keys))
+    for count in TX_COUNTS:
+        txs = (transfers * count)[:count]
+        block = make_block(chain, txs, keys[0])
+        old = hashrate(block_serialization(block))
+        header = hashrate(header_serialization(block))
+        new = hashrate(block.nonce_hasher())
+        print("{:>6} {:>14.0f} {:>14.0f} {:>14.0f} {:>7.1f}x".format(count, old, header, new, new / old))
+
+    print()
+    print("{:>8} {:>14}".format("workers", "pool (H/s)"))
+    block = make_block(chain, transfers, keys[0])
+    for workers in sorted(set([1, 2, 4, os.cpu_count()])):
+        print("{:>8} {:>14.0f}".format(workers, pool_hashrate(block, workers)))
@@ -0,0 +1,175 @@
+import asyncio
+import socket
+import socketserver
+import statistics
+import threading
+import time
+import jocoin.network as nw
+from jocoin.chain import BlockChain
+from jocoin.client import Client
+from .chaingen import make_keys
+
+CONCURRENCY = [1, 100, 400]
+SEQUENTIAL = 1000
+PAYLOAD_MB = [1, 4, 16]
+# A peer sending its GOSSIP payload this slowly, in seconds
+SLOW_SEND = 1.0
+# Requests taking longer than this count as failed
+REQUEST_TIMEOUT = 5
+
+
+class SerialListener:
+    # The listener as it was: socketserver, one connection at a time
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            message = str(self.rfile.readline().strip(), "utf-8")
+            data = nw.deserialize(self.rfile.readline().strip())
+            response = self.server.client.dispatch_incoming_message(message, data)
+            self.wfile.write(nw.format_object_for_transmission(response))
+
+    def __init__(self, client, listen_addr):
+        self.server = socketserver.TCPServer(listen_addr, self.Handler)
+        self.server.client = client
+        self.address = self.server.server_address
+
+    def start(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def slow_gossip(peer):
+    # A peer on a slow link: the message arrives a piece at a time
+    pieces = [b"GOSSIP\n", b"{}", b"\n"]
+    with socket.create_connection(peer) as sock:
+        for piece in pieces:
+            sock.sendall(piece)
+            time.sleep(SLOW_SEND / len(pieces))
+        nw.readline(sock)
+
+
+async def line_request(peer, message_type, raw_data):
+    # A message in the line format, which both listeners understand
+    reader, writer = await asyncio.open_connection(*peer)
+    try:
+        writer.write(nw.format_string_for_transmission(message_type) + nw.format_object_for_transmission(raw_data))
+        await writer.drain()
+        return nw.deserialize(await reader.readline())
+    finally:
+        writer.close()
+
+
+async def timed_balance(peer, pubkey):
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(line_request(peer, nw.BALANCE, pubkey), REQUEST_TIMEOUT)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    return time.perf_counter() - start
+
+
+def latencies(listener_class, client, n):
+    listener = listener_class(client, ("localhost", 0))
+    threading.Thread(target=listener.start, daemon=True).start()
+    slow = threading.Thread(target=slow_gossip, args=(listener.address,))
+    slow.start()
+    time.sleep(0.05)
+
+    async def run_all():
+        return await asyncio.gather(*[timed_balance(listener.address, client.pubkey) for i in range(n)])
+    try:
+        return asyncio.run(run_all())
+    finally:
+        slow.join()
+        listener.stop()
+
+
+def connect_per_message(peer, message_type, raw_data):
+    # How every message was sent before connections were pooled
+    with socket.create_connection(peer) as sock:
+        sock.sendall(nw.format_string_for_transmission(message_type) + nw.format_object_for_transmission(raw_data))
+        return nw.deserialize(nw.readline(sock))
+
+
+def old_readline(sock, bufsize=4096):
+    # The reader from before framing: rescans the whole buffer per chunk
+    buf = ''
+    data = True
+    while data:
+        data = str(sock.recv(bufsize), "utf-8")
+        buf += data
+        if '\n' in buf:
+            return buf.splitlines()[0]
+
+
+def sequential_requests(client):
+    listener = nw.JoCoinListener(client, ("localhost", 0))
+    threading.Thread(target=listener.start, daemon=True).start()
+    peer = listener.address
+    rows = []
+    try:
+        start = time.perf_counter()
+        for i in range(SEQUENTIAL):
+            connect_per_message(peer, nw.BALANCE, client.pubkey)
+        rows.append(("connect per message", time.perf_counter() - start))
+        start = time.perf_counter()
+        for i in range(SEQUENTIAL):
+            nw.send_message(peer, nw.BALANCE, client.pubkey)
+        rows.append(("pooled", time.perf_counter() - start))
+        start = time.perf_counter()
+        nw.send_pipelined(peer, [(nw.BALANCE, client.pubkey)] * SEQUENTIAL)
+        rows.append(("pipelined", time.perf_counter() - start))
+    finally:
+        listener.stop()
+    return rows
+
+
+def read_payload(data, read):
+    # Time to read a message off a socket
+    a, b = socket.socketpair()
+    writer = threading.Thread(target=a.sendall, args=(data,))
+    writer.start()
+    start = time.perf_counter()
+    read(b)
+    elapsed = time.perf_counter() - start
+    writer.join()
+    a.close()
+    b.close()
+    return elapsed
+
+
+def read_frame(sock):
+    length = nw.FRAME_LENGTH.unpack(nw.recv_exactly(sock, nw.FRAME_LENGTH.size))[0]
+    return nw.recv_exactly(sock, length)
+
+
+def main():
+    keys = make_keys(1)
+    client = Client(keys[0]["pubkey"], keys[0]["privkey"], [], ("localhost", 0))
+    client.chain = BlockChain.empty()
+    print("BALANCE latency while one peer sends GOSSIP over {:.1f}s".format(SLOW_SEND))
+    print("{:>8} {:>10} {:>10} {:>10} {:>8}".format("clients", "listener", "p50 ms", "p99 ms", "failed"))
+    for n in CONCURRENCY:
+        for name, listener_class in [("serial", SerialListener), ("asyncio", nw.JoCoinListener)]:
+            results = latencies(listener_class, client, n)
+            times = sorted(t for t in results if t is not None)
+            p50 = statistics.median(times) * 1000 if times else float("nan")
+            p99 = times[min(len(times) - 1, int(len(times) * 0.99))] * 1000 if times else float("nan")
+            print("{:>8} {:>10} {:>10.1f} {:>10.1f} {:>8}".format(n, name, p50, p99, len(results) - len(times)))
+    print()
+    print("{} BALANCE requests, one after another".format(SEQUENTIAL))
+    for name, elapsed in sequential_requests(client):
+        print("{:>20} {:>8.1f} ms".format(name, elapsed * 1000))
+    print()
+    print("{:>8} {:>12} {:>12}".format("MB", "readline ms", "framed ms"))
+    for mb in PAYLOAD_MB:
+        payload = b"x" * (mb * 1024 * 1024)
+        line_ms = read_payload(payload + b"\n", old_readline) * 1000
+        framed_ms = read_payload(nw.format_frame(payload), read_frame) * 1000
+        print("{:>8} {:>12.1f} {:>12.1f}".format(mb, line_ms, framed_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import time
+import tracemalloc
+from jocoin.hashing import hash_
+from jocoin.tx import Tx, TxInput, TxOutput
+from .chaingen import make_keys, build_chain
+
+BLOCKS = 2000
+TXS_PER_BLOCK = 10
+PASSES = 3
+
+
+class OldValueComparable:
+    # The value objects as they were before they got __slots__ and caching
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.__dict__ == other.__dict__
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(sorted(self.__dict__.items())))
+
+
+class OldTxOutput(OldValueComparable):
+    def __init__(self, out_addr, amount):
+        self.out_addr = out_addr
+        self.amount = amount
+
+    def as_json(self):
+        return self.__dict__
+
+
+class OldTxInput(OldValueComparable):
+    def __init__(self, block_hash, tx_index, tx_out_index):
+        self.block_hash = block_hash
+        self.tx_index = tx_index
+        self.tx_out_index = tx_out_index
+
+    def as_json(self):
+        return self.__dict__
+
+
+class OldTx:
+    def __init__(self, from_addr, signature, inputs, outputs):
+        self.from_addr = from_addr
+        self.signature = signature
+        self.inputs = inputs
+        self.outputs = outputs
+
+    def as_json(self):
+        return {"from_addr": self.from_addr, "signature": self.signature, "inputs": self.inputs, "outputs": self.outputs}
+
+    def txid(self):
+        return hash_(self)
+
+
+def copy_new(tx):
+    return Tx(tx.from_addr, tx.signature, [TxInput(*i.outpoint()) for i in tx.inputs],
+              [TxOutput(o.out_addr, o.amount) for o in tx.outputs])
+
+
+def copy_old(tx):
+    return OldTx(tx.from_addr, tx.signature, [OldTxInput(*i.outpoint()) for i in tx.inputs],
+                 [OldTxOutput(o.out_addr, o.amount) for o in tx.outputs])
+
+
+def memory_per_tx(txs, copy):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    copies = [copy(tx) for tx in txs]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return copies, (after - before) / len(txs)
+
+
+def per_item(f, items):
+    start = time.perf_counter()
+    f(items)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def txids(txs):
+    for tx in txs:
+        tx.txid()
+
+
+if __name__ == "__main__":
+    keys = make_keys(32)
+    chain = build_chain(BLOCKS, TXS_PER_BLOCK, keys)
+    txs = [tx for block in chain.block_iter() for tx in block.txs]
+    old, old_memory = memory_per_tx(txs, copy_old)
+    new, new_memory = memory_per_tx(txs, copy_new)
+    print("chain: {} blocks, {} txs".format(chain.length(), len(txs)))
+    print("{:<28} {:>12} {:>12}".format("", "old", "new"))
+    print("{:<28} {:>12.0f} {:>12.0f}".format("memory per tx (bytes)", old_memory, new_memory))
+    for i in range(PASSES):
+        print("{:<28} {:>12.2f} {:>12.2f}".format("txid pass {} (us/tx)".format(i + 1), per_item(txids, old), per_item(txids, new)))
+    old_outputs = [o for tx in old for o in tx.outputs]
+    new_outputs = [o for tx in new for o in tx.outputs]
+    print("{:<28} {:>12.2f} {:>12.2f}".format("set of outputs (us/output)", per_item(set, old_outputs), per_item(set, new_outputs)))
@@ -0,0 +1,34 @@
+import time
+from jocoin.chain import BlockChain
+from jocoin.blockstruct import BlockStruct
+from jocoin.tx import Tx
+from .chaingen import make_keys, build_chain
+
+LENGTHS = [50, 100, 200]
+
+
+def sibling(chain, h, miner):
+    # A block on the same parent as h, so that a child of it forces a reorg
+    parent_hash = chain.blocks[h].last_hash
+    parent = chain.blocks[parent_hash]
+    return BlockStruct(parent.id + 1, parent_hash, [Tx.coinbase(miner["pubkey"])], 0)
+
+
+if __name__ == "__main__":
+    keys = make_keys(8)
+    print("{:>8} {:>18} {:>18}".format("length", "reorg (ms)", "rebuild (ms)"))
+    for length in LENGTHS:
+        chain = build_chain(length, 3, keys)
+        side = sibling(chain, chain.current_hash, keys[1])
+        tip = BlockStruct(side.id + 1, side.hash(), [Tx.coinbase(keys[1]["pubkey"])], 0)
+        chain.add_block(side)
+        start = time.perf_counter()
+        chain.add_block(tip)
+        reorg = time.perf_counter() - start
+        assert chain.current_hash == tip.hash()
+        # What switching chains used to cost: validating the new one from genesis
+        blocks = {h: chain.blocks[h] for h in chain.hash_iter()}
+        start = time.perf_counter()
+        BlockChain(chain.current_hash, blocks)
+        rebuild = time.perf_counter() - start
+        print("{:>8} {:>18.3f} {:>18.3f}".format(length, reorg * 1000, rebuild * 1000))
@@ -0,0 +1,29 @@
+import time
+from jocoin.tx import TxInput, TxOutput
+from jocoin.user import make_tx_with_fee
+from .chaingen import make_keys
+
+LENGTHS = [512, 1024]
+TXS = 200
+
+
+def signing_rate(key, receiver, privkey):
+    # Transfers signed per second, as a wallet service would make them
+    start = time.perf_counter()
+    for i in range(TXS):
+        inputs = [(TxInput(i + 1, 0, 0), 10.0)]
+        make_tx_with_fee(inputs, privkey, key["pubkey"], [TxOutput(receiver["pubkey"], 1.0)], 0.5)
+    return TXS / (time.perf_counter() - start)
+
+
+def main():
+    print("{:>8} {:>14} {:>14} {:>8}".format("length", "(n, d) tx/s", "CRT tx/s", "speedup"))
+    for length in LENGTHS:
+        key, receiver = make_keys(2, length)
+        plain = signing_rate(key, receiver, key["privkey"][:2])
+        crt = signing_rate(key, receiver, key["privkey"])
+        print("{:>8} {:>14.0f} {:>14.0f} {:>7.1f}x".format(length, plain, crt, crt / plain))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import threading
+import time
+import jocoin.network as nw
+from jocoin import signature
+from jocoin.chain import BlockChain
+from jocoin.client import Client
+from .chaingen import make_keys, build_chain
+
+BLOCKS = 100
+# Signature checks at this key length make connecting blocks take a while
+KEY_LENGTH = 1024
+TXS_PER_BLOCK = 8
+READERS = [1, 4, 16]
+# Seconds each reader waits between queries
+READ_INTERVAL = 0.001
+
+
+def locked_balance(client, pubkey):
+    # How BALANCE was answered before snapshots: under the chain lock
+    with client.chain_lock:
+        return client.chain.holdings_for(pubkey)
+
+
+def snapshot_balance(client, pubkey):
+    return client.dispatch_incoming_message(nw.BALANCE, list(pubkey))
+
+
+def run(blocks, keys, query, n_readers):
+    # Connect `blocks` while n_readers threads ask for balances. Returns
+    #   the seconds taken to connect them and the query latencies
+    signature.verified.clear()
+    client = Client(keys[0]["pubkey"], keys[0]["privkey"], [], ("localhost", 0))
+    client.chain = BlockChain.empty()
+    client.publish_snapshot()
+    writing = True
+    latencies = [[] for i in range(n_readers)]
+
+    def reader(i):
+        pubkey = keys[i % len(keys)]["pubkey"]
+        while writing:
+            start = time.perf_counter()
+            query(client, pubkey)
+            latencies[i].append(time.perf_counter() - start)
+            time.sleep(READ_INTERVAL)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(n_readers)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    for block in blocks:
+        with client.chain_lock:
+            client.add_block(block)
+    elapsed = time.perf_counter() - start
+    writing = False
+    for t in threads:
+        t.join()
+    return elapsed, sorted(latency for reader in latencies for latency in reader)
+
+
+def main():
+    keys = make_keys(8, KEY_LENGTH)
+    chain = build_chain(BLOCKS, TXS_PER_BLOCK, keys)
+    blocks = list(chain.block_iter())[::-1][1:]
+    print("Connecting {} blocks of {} txs while answering BALANCE queries".format(BLOCKS, TXS_PER_BLOCK))
+    print("{:>8} {:>10} {:>12} {:>10} {:>10} {:>10}".format("readers", "reads", "connect (s)", "queries", "p50 ms", "p99 ms"))
+    for n in READERS:
+        for name, query in [("locked", locked_balance), ("snapshot", snapshot_balance)]:
+            elapsed, times = run(blocks, keys, query, n)
+            p50 = times[len(times) // 2] * 1000
+            p99 = times[min(len(times) - 1, int(len(times) * 0.99))] * 1000
+            print("{:>8} {:>10} {:>12.2f} {:>10} {:>10.3f} {:>10.3f}".format(n, name, elapsed, len(times), p50, p99))
+
+
+if __name__ == "__main__":
+    main()
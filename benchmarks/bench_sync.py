@@ -0,0 +1,62 @@
+import threading
+import time
+import jocoin.network as nw
+from jocoin import signature
+from jocoin.client import Client
+from .chaingen import make_keys, build_chain
+
+BLOCKS = 1500
+TXS_PER_BLOCK = 4
+PEERS = [1, 3]
+# Each peer's upload speed, as seconds per block sent
+SECONDS_PER_BLOCK = 0.002
+
+
+class ServingPeer(Client):
+    # A peer with the whole chain that sends blocks at a limited rate
+    def dispatch_incoming_message(self, message, data):
+        response = super().dispatch_incoming_message(message, data)
+        if message in (nw.GETBLOCKS, nw.GETDATA):
+            time.sleep(len(response) * SECONDS_PER_BLOCK)
+        return response
+
+
+def start_peers(chain, keys, n):
+    peers = []
+    for i in range(n):
+        peer = ServingPeer(keys[0]["pubkey"], keys[0]["privkey"], [], ("localhost", 0))
+        peer.chain = chain
+        listener = nw.JoCoinListener(peer, ("localhost", 0))
+        peer.address = listener.address
+        threading.Thread(target=listener.start, daemon=True).start()
+        peers.append((peer, listener))
+    return peers
+
+
+def sync_time(chain, keys, n_peers, headers_first):
+    peers = start_peers(chain, keys, n_peers)
+    node = Client(keys[1]["pubkey"], keys[1]["privkey"], [peer.address for peer, listener in peers], ("localhost", 0))
+    node.chain = type(chain).empty()
+    if not headers_first:
+        node.HEADERS_FIRST_MIN = float("inf")
+    signature.verified.clear()
+    start = time.perf_counter()
+    node.get_initial_state()
+    elapsed = time.perf_counter() - start
+    assert node.chain.current_hash == chain.current_hash
+    for peer, listener in peers:
+        listener.stop()
+    return elapsed
+
+
+def main():
+    keys = make_keys(8)
+    chain = build_chain(BLOCKS, TXS_PER_BLOCK, keys)
+    print("Initial sync of {} blocks, peers sending {:.0f} blocks/s each".format(BLOCKS, 1 / SECONDS_PER_BLOCK))
+    print("{:>6} {:>16} {:>16}".format("peers", "one peer (s)", "headers-first (s)"))
+    for n in PEERS:
+        print("{:>6} {:>16.2f} {:>16.2f}".format(n, sync_time(chain, keys, n, False), sync_time(chain, keys, n, True)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import random
+import threading
+import time
+import jocoin.chain
+import jocoin.client
+from jocoin.chain import BlockChain
+from jocoin.client import Client
+from jocoin.tx import TxOutput
+from jocoin.user import make_tx
+from .chaingen import make_keys
+
+# About a second per block at ~1M hashes/s
+TARGET = (1 << 256) // 1000000
+TRIALS = 10
+DEBOUNCES = [float("inf"), 0.5, 0.1]
+
+
+def confirmation_latency(debounce, keys):
+    client = Client(keys[0]["pubkey"], keys[0]["privkey"], [], ("localhost", 0))
+    client.TEMPLATE_DEBOUNCE = debounce
+    client.chain = BlockChain.empty()
+    running = True
+
+    def mining_loop():
+        while running:
+            client.keep_mining = True
+            block = client.mine()
+            if block:
+                with client.chain_lock:
+                    client.add_block(block)
+
+    miner = threading.Thread(target=mining_loop, daemon=True)
+    miner.start()
+    latencies = []
+    for i in range(TRIALS):
+        while True:
+            with client.chain_lock:
+                inputs = client.chain.valid_inputs_for(client.pubkey)
+            if inputs:
+                break
+            time.sleep(0.1)
+        # Arrive part way through a mining round
+        time.sleep(random.random())
+        tx = make_tx(inputs, client.privkey, client.pubkey, [TxOutput(keys[1]["pubkey"], 1.0)])
+        with client.chain_lock:
+            client.add_tx(tx)
+            start = time.perf_counter()
+        while True:
+            with client.chain_lock:
+                confirmed = tx.txid() not in client.mempool
+            if confirmed:
+                break
+            time.sleep(0.01)
+        latencies.append(time.perf_counter() - start)
+    running = False
+    client.keep_mining = False
+    miner.join()
+    return sum(latencies) / len(latencies)
+
+
+if __name__ == "__main__":
+    jocoin.chain.DIFFICULTY = jocoin.client.DIFFICULTY = TARGET
+    keys = make_keys(2)
+    random.seed(1)
+    print("{:>10} {:>16}".format("debounce", "confirm (s)"))
+    for debounce in DEBOUNCES:
+        label = "never" if debounce == float("inf") else "{:.1f}s".format(debounce)
+        print("{:>10} {:>16.2f}".format(label, confirmation_latency(debounce, keys)))
@@ -0,0 +1,25 @@
+import time
+from .chaingen import make_keys, build_chain, make_transfers, make_block
+
+LENGTHS = [25, 50, 100, 200, 400]
+TXS_PER_BLOCK = 5
+ROUNDS = 20
+
+
+def time_validation(chain, block):
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        chain.validate_block(block)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+if __name__ == "__main__":
+    keys = make_keys(8)
+    chain = build_chain(0, TXS_PER_BLOCK, keys)
+    print("{:>8} {:>16}".format("length", "validate (ms)"))
+    for length in LENGTHS:
+        while chain.length() < length:
+            txs = make_transfers(chain, keys, TXS_PER_BLOCK, offset=chain.length())
+            chain.add_block(make_block(chain, txs, keys[chain.length() % len(keys)]))
+        block = make_block(chain, make_transfers(chain, keys, TXS_PER_BLOCK), keys[0])
+        print("{:>8} {:>16.3f}".format(length, time_validation(chain, block) * 1000))
@@ -0,0 +1,56 @@
+import os
+import time
+from jocoin.blockstruct import BlockStruct
+import jocoin.signature as signature
+from jocoin.chain import BlockChain
+from jocoin.tx import Tx, TxInput, TxOutput
+from jocoin.user import make_tx
+from jocoin.verify import VerifierPool
+from .chaingen import make_keys
+
+TXS = 400
+ROUNDS = 3
+
+
+def signed_txs(keys, count):
+    # Only the signatures are checked, so the inputs need not exist
+    txs = []
+    for i in range(count):
+        key = keys[i % len(keys)]
+        inputs = [(TxInput(i + 1, 0, 0), 10.0)]
+        txs.append(make_tx(inputs, key["privkey"], key["pubkey"], [TxOutput(keys[0]["pubkey"], 1.0)]))
+    return txs
+
+
+def throughput(chain, blocks, cached=False):
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        if not cached:
+            signature.verified.clear()
+        if chain.verify_signatures(blocks):
+            raise RuntimeError("Generated a bad signature")
+    return ROUNDS * sum(len(b.txs) for b in blocks) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    # Node-sized keys: 1024-bit moduli
+    keys = make_keys(4, length=512)
+    txs = signed_txs(keys, TXS)
+    # Ten blocks, as a sync batch would hand to reorganize
+    blocks = [BlockStruct(2, 0, txs[i:i + TXS // 10], 0) for i in range(0, TXS, TXS // 10)]
+    chain = BlockChain.empty()
+    serial = throughput(chain, blocks)
+    print("{:>8} {:>14} {:>8}".format("workers", "txs/s", "speedup"))
+    print("{:>8} {:>14.0f} {:>7.1f}x".format("serial", serial, 1.0))
+    # As for a block whose txs were all in our tx pool
+    rate = throughput(chain, blocks, cached=True)
+    print("{:>8} {:>14.0f} {:>7.1f}x".format("cached", rate, rate / serial))
+    for workers in sorted(set([1, 2, 4, os.cpu_count()])):
+        pool = VerifierPool(workers)
+        pool.start()
+        try:
+            chain.verifier = pool
+            rate = throughput(chain, blocks)
+        finally:
+            pool.stop()
+        print("{:>8} {:>14.0f} {:>7.1f}x".format(workers, rate, rate / serial))
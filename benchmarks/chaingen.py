@@ -0,0 +1,46 @@
+import random
+import jocoin.chain
+import jocoin.crypto as jc
+from jocoin.chain import BlockChain
+from jocoin.blockstruct import BlockStruct
+from jocoin.tx import Tx, TxOutput
+from jocoin.user import make_tx
+
+# Any hash is a valid proof of work, so blocks can be built without mining
+EASY_DIFFICULTY = 1 << 256
+
+
+def make_keys(count, length=256, seed=0):
+    random.seed(seed)
+    return [jc.gen_keys(length) for i in range(count)]
+
+
+def make_transfers(chain, keys, count, offset=0, amount=1.0):
+    # One transfer per key in turn, never spending an output twice
+    txs = []
+    used = set()
+    for i in range(count):
+        sender = keys[(offset + i) % len(keys)]
+        receiver = keys[(offset + i + 1) % len(keys)]
+        inputs = [(inp, amt) for inp, amt in chain.valid_inputs_for(sender["pubkey"]) if inp.outpoint() not in used]
+        if sum(amt for inp, amt in inputs) < amount:
+            continue
+        tx = make_tx(inputs, sender["privkey"], sender["pubkey"], [TxOutput(receiver["pubkey"], amount)])
+        used.update(inp.outpoint() for inp in tx.inputs)
+        txs.append(tx)
+    return txs
+
+
+def make_block(chain, txs, miner):
+    last = chain.last_block()
+    return BlockStruct(last.id + 1, last.hash(), txs + [Tx.coinbase(miner["pubkey"])], 0)
+
+
+def build_chain(n_blocks, txs_per_block, keys):
+    jocoin.chain.DIFFICULTY = EASY_DIFFICULTY
+    chain = BlockChain.empty()
+    for i in range(n_blocks):
+        txs = make_transfers(chain, keys, txs_per_block, offset=i)
+        if not chain.add_block(make_block(chain, txs, keys[i % len(keys)])):
+            raise RuntimeError("Generated an invalid block")
+    return chain
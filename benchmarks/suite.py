@@ -0,0 +1,215 @@
+import json
+import platform
+import subprocess
+import sys
+import threading
+import time
+from optparse import OptionParser
+import jocoin.network as nw
+from jocoin import signature
+from jocoin.chain import BlockChain
+from jocoin.client import Client
+from jocoin.hashing import hash_
+from jocoin.serialization import serialize, deserialize
+from jocoin.user import find_inputs
+from .chaingen import make_keys, build_chain, make_transfers, make_block
+
+# Each benchmark runs for at least this many seconds, and at least once
+MIN_TIME = 1.0
+
+
+def measure(f, setup=None, number=1):
+    # Timings for calling f(setup()) repeatedly, `number` times per timing
+    #   for functions too quick to time one call at a time; only f is timed
+    times = []
+    total = 0.0
+    while total < MIN_TIME or not times:
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        for i in range(number):
+            f(arg)
+        times.append((time.perf_counter() - start) / number)
+        total += times[-1] * number
+    times.sort()
+    return {
+        "calls": len(times) * number,
+        "mean_ms": 1000 * total / (len(times) * number),
+        "median_ms": 1000 * times[len(times) // 2],
+        "per_second": len(times) * number / total
+    }
+
+
+class Fixture:
+    # A deterministic chain of `blocks` blocks of `txs` transfers between
+    #   `keys` keys, plus a valid next block and a batch of pool txs
+    def __init__(self, blocks, txs, keys):
+        self.keys = make_keys(keys)
+        self.chain = build_chain(blocks, txs, self.keys)
+        self.transfers = make_transfers(self.chain, self.keys, txs, offset=blocks)
+        self.block = make_block(self.chain, self.transfers, self.keys[0])
+        self.chain_json = serialize(self.chain.as_json())
+
+    def client(self, chain=None):
+        client = Client(self.keys[0]["pubkey"], self.keys[0]["privkey"], [], ("localhost", 0))
+        client.chain = chain if chain is not None else self.chain
+        return client
+
+
+def bench_hash(fixture):
+    tx = fixture.transfers[0]
+    header = fixture.block.header()
+    return {
+        "tx": measure(lambda arg: hash_(tx), number=1000),
+        "header": measure(lambda arg: hash_(header), number=1000),
+    }
+
+
+def bench_mine(fixture):
+    # Client.mine at a difficulty it never meets, for MIN_TIME seconds
+    client = fixture.client()
+    client.calculate_difficulty = lambda: 0
+    calls = []
+    deadline = time.perf_counter() + MIN_TIME
+    def keep_going():
+        calls.append(None)
+        return time.perf_counter() < deadline
+    client.keep_going = keep_going
+    start = time.perf_counter()
+    client.mine()
+    elapsed = time.perf_counter() - start
+    # Each call after the first follows a batch of nonces
+    return {"hashes_per_second": (len(calls) - 1) * client.NONCE_BATCH / elapsed}
+
+
+def bench_validate_block(fixture):
+    def validate(arg):
+        signature.verified.clear()
+        fixture.chain.validate_block(fixture.block)
+    return measure(validate)
+
+
+def bench_inputs(fixture):
+    chain = fixture.chain
+    pubkey = fixture.keys[0]["pubkey"]
+    all_inputs = chain.valid_inputs_for(pubkey)
+    total = sum(amount for i, amount in all_inputs) / 2
+    return {
+        "chain_find_inputs": measure(lambda arg: chain.find_inputs()),
+        "holdings": measure(lambda arg: chain.holdings()),
+        "valid_inputs_for": measure(lambda arg: chain.valid_inputs_for(pubkey)),
+        "user_find_inputs": measure(lambda arg: find_inputs(all_inputs, total), number=100),
+    }
+
+
+def bench_chain_from_json(fixture):
+    # What a node receiving a whole chain as JSON does, signatures and all
+    def load(data):
+        signature.verified.clear()
+        BlockChain.from_json(deserialize(data))
+    return measure(load, lambda: fixture.chain_json)
+
+
+def bench_merge_txs(fixture):
+    def setup():
+        signature.verified.clear()
+        return fixture.client(BlockChain.from_json(deserialize(fixture.chain_json)))
+    return measure(lambda client: client.merge_txs(fixture.transfers), setup)
+
+
+def bench_network(fixture):
+    client = fixture.client()
+    client.publish_snapshot()
+    listener = nw.JoCoinListener(client, ("localhost", 0))
+    threading.Thread(target=listener.start, daemon=True).start()
+    try:
+        peer = listener.address
+        pubkey = fixture.keys[0]["pubkey"]
+        # From genesis, so each request gets a full batch of blocks
+        locator = [list(client.chain.hash_iter())[-1]]
+        return {
+            "balance": measure(lambda arg: nw.request_balance(peer, pubkey)),
+            "inputs": measure(lambda arg: nw.request_inputs(peer, pubkey)),
+            "blocks": measure(lambda arg: nw.request_blocks(peer, locator, client.BLOCK_BATCH)),
+        }
+    finally:
+        nw.pool.close()
+        listener.stop()
+
+
+BENCHMARKS = [
+    ("hash", bench_hash),
+    ("mine", bench_mine),
+    ("validate_block", bench_validate_block),
+    ("inputs", bench_inputs),
+    ("chain_from_json", bench_chain_from_json),
+    ("merge_txs", bench_merge_txs),
+    ("network", bench_network),
+]
+
+
+def rates(results, prefix=""):
+    # {"network.balance": calls per second, ...}, to compare runs by
+    flat = {}
+    for name, result in results.items():
+        if "per_second" in result:
+            flat[prefix + name] = result["per_second"]
+        elif "hashes_per_second" in result:
+            flat[prefix + name] = result["hashes_per_second"]
+        else:
+            flat.update(rates(result, prefix + name + "."))
+    return flat
+
+
+def compare(old, new):
+    old_rates = rates(old["results"])
+    print("{:>32} {:>14} {:>14} {:>8}".format("benchmark", "before (/s)", "after (/s)", "change"), file=sys.stderr)
+    for name, rate in rates(new["results"]).items():
+        if name in old_rates:
+            print("{:>32} {:>14.1f} {:>14.1f} {:>+7.0%}".format(name, old_rates[name], rate, rate / old_rates[name] - 1), file=sys.stderr)
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = OptionParser(usage="python -m benchmarks.suite [options] [<benchmark> ...]")
+    parser.add_option("-b", "--blocks", type="int", dest="blocks", default=50, help="blocks in the generated chain")
+    parser.add_option("-t", "--txs", type="int", dest="txs", default=10, help="transfers per block")
+    parser.add_option("-k", "--keys", type="int", dest="keys", default=8, help="keys sending and receiving them")
+    parser.add_option("-o", "--output", dest="output", metavar="FILE", help="write the results here as well as to stdout")
+    parser.add_option("-c", "--compare", dest="compare", metavar="FILE", help="compare with the results of an earlier run")
+    (options, args) = parser.parse_args()
+    names = [name for name, bench in BENCHMARKS]
+    for name in args:
+        if name not in names:
+            parser.error("Unknown benchmark {}; choose from {}".format(name, ", ".join(names)))
+
+    fixture = Fixture(options.blocks, options.txs, options.keys)
+    results = {}
+    for name, bench in BENCHMARKS:
+        if not args or name in args:
+            print("Running {}".format(name), file=sys.stderr)
+            results[name] = bench(fixture)
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "time": time.time(),
+        "params": {"blocks": options.blocks, "txs": options.txs, "keys": options.keys},
+        "results": results,
+    }
+    out = json.dumps(report, indent=2)
+    print(out)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(out + "\n")
+    if options.compare:
+        with open(options.compare) as f:
+            compare(json.loads(f.read()), report)
+
+
+if __name__ == "__main__":
+    main()
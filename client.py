@@ -1,10 +1,12 @@
 import optparse
+import os
 import json
 import sys
 import jocoin.network as jnw
 import jocoin.crypto as jcc
-from jocoin.tx import TxInput, TxOutput
-from jocoin.user import make_tx
+from jocoin.tx import Tx, TxInput, TxOutput
+from jocoin.user import STRATEGIES
+from jocoin.wallet import Wallet
 
 
 def read_keyfile(fn):
@@ -18,11 +20,16 @@ Available commands:
     genkeys: Generate public/private keys and output to stdout
     balance <keyfile>: Get the balance for the account linked to the key in <keyfile>
     inputs <keyfile>: Get the available inputs for the account linked to the key in <keyfile>
-    transfer <your keyfile> <to_keyfile> <amount>: Transfer <amount> from your account to <to_keyfile>'s account"""
+    transfer <your keyfile> <to_keyfile> <amount>: Transfer <amount> from your account to <to_keyfile>'s account,
+        keeping track of your unspent outputs in <your keyfile>.wallet
+    history <keyfile> [<offset>]: List transactions to and from the account linked to the key in <keyfile> (the node must run with -i)
+    stats: Show the node's counters, timings and state"""
 
     parser = optparse.OptionParser(usage=usage)
     parser.add_option("-H", "--host", help="server address", dest="server_addr", default="localhost")
     parser.add_option("-p", "--port", help="server port", type="int", dest="server_port", default=9999)
+    parser.add_option("-s", "--select", help="how transfers pick inputs: {} (default exact)".format(", ".join(STRATEGIES)),
+                      choices=list(STRATEGIES), dest="select", default="exact")
 
     (options, args) = parser.parse_args()
 
@@ -34,7 +41,7 @@ Available commands:
     server_addr = (options.server_addr, options.server_port)
 
     if command == "genkeys":
-        print(json.dumps(jcc.gen_keys()))
+        print(json.dumps(jcc.gen_keys(workers=os.cpu_count())))
     elif command == "balance":
         if len(args) != 2:
             parser.print_help()
@@ -54,7 +61,28 @@ Available commands:
         from_key = read_keyfile(args[1])
         to_key = read_keyfile(args[2])
         amount = float(args[3])
-        inputs = [(TxInput.from_json(x), y) for x, y in jnw.request_inputs(server_addr, from_key['pubkey'])]
+        wallet = Wallet.load(from_key['pubkey'], args[1] + ".wallet")
+        wallet.sync(server_addr)
+        wallet.save()
         outputs = [TxOutput(to_key['pubkey'], amount)]
-        tx = make_tx(inputs, from_key['privkey'], from_key['pubkey'], outputs)
-        print(jnw.request_transfer(server_addr, tx))
+        tx = wallet.make_tx(from_key['privkey'], outputs, select=STRATEGIES[options.select])
+        result = jnw.request_transfer(server_addr, tx)
+        if result == "SUCCESS":
+            # Hold back the outputs it spent until it is in a block
+            wallet.save()
+        print(result)
+    elif command == "stats":
+        print(json.dumps(jnw.request_stats(server_addr), indent=2))
+    elif command == "history":
+        if len(args) not in (2, 3):
+            parser.print_help()
+            sys.exit()
+        key = read_keyfile(args[1])
+        offset = int(args[2]) if len(args) == 3 else 0
+        page = jnw.request_history(server_addr, key['pubkey'], offset)
+        if page is None:
+            print("The node does not keep an address index")
+            sys.exit(1)
+        for entry in page["txs"]:
+            print("{}: {}".format(entry["height"], Tx.from_json(entry["tx"])))
+        print("{}-{} of {}".format(offset + 1, offset + len(page["txs"]), page["total"]))
@@ -0,0 +1,71 @@
+class AddressIndex:
+    # Optional per-address view of the main chain, for wallets and
+    #   explorers: each address's balance as a running total, and the txs
+    #   paying to or spending from it, oldest first. The chain keeps it up
+    #   to date as blocks are connected and disconnected (see
+    #   BlockChain.enable_address_index); unspent outputs by address are
+    #   already indexed by the UtxoSet
+    def __init__(self):
+        self.balances = {}
+        # out_addr -> [(block_hash, tx_index)]
+        self.history = {}
+
+    def balance(self, out_addr):
+        return self.balances.get(out_addr, 0.0)
+
+    def history_for(self, out_addr):
+        return self.history.get(out_addr, [])
+
+    def connect(self, block_hash, blk, spent):
+        # spent: the (output_id, (out_addr, amount)) pairs the block spent,
+        #   in input order, as returned by BlockChain.apply_block
+        for output_id, (out_addr, amount) in spent:
+            self.add(out_addr, -amount)
+        miner = blk.miner()
+        for tx_index, (tx, fee) in enumerate(zip(blk.txs, tx_fees(blk, spent))):
+            for outp in tx.outputs:
+                self.add(outp.out_addr, outp.amount)
+            if fee > 0:
+                self.add(miner, fee)
+            for out_addr in touched(tx, miner, fee):
+                self.history.setdefault(out_addr, []).append((block_hash, tx_index))
+
+    def disconnect(self, block_hash, blk, spent):
+        # The reverse of connect, for the block at the tip
+        miner = blk.miner()
+        for tx, fee in zip(blk.txs, tx_fees(blk, spent)):
+            for outp in tx.outputs:
+                self.add(outp.out_addr, -outp.amount)
+            if fee > 0:
+                self.add(miner, -fee)
+            for out_addr in touched(tx, miner, fee):
+                entries = self.history[out_addr]
+                entries.pop()
+                if not entries:
+                    del self.history[out_addr]
+        for output_id, (out_addr, amount) in spent:
+            self.add(out_addr, amount)
+
+    def add(self, out_addr, amount):
+        balance = self.balances.get(out_addr, 0.0) + amount
+        if balance:
+            self.balances[out_addr] = balance
+        else:
+            self.balances.pop(out_addr, None)
+
+
+def tx_fees(blk, spent):
+    # The fee each tx in blk pays, from the amounts its inputs spent
+    amounts = iter([amount for output_id, (out_addr, amount) in spent])
+    return [0.0 if tx.is_coinbase() else sum(next(amounts) for inp in tx.inputs) - tx.amt_out() for tx in blk.txs]
+
+def touched(tx, miner, fee):
+    # Addresses whose history includes tx, each once and in a fixed order
+    #   so that disconnect pops what connect pushed: the recipients, the
+    #   sender, and the miner if tx pays a fee
+    out_addrs = [outp.out_addr for outp in tx.outputs]
+    if not tx.is_coinbase():
+        out_addrs.append(tx.from_addr)
+    if fee > 0:
+        out_addrs.append(miner)
+    return list(dict.fromkeys(out_addrs))
@@ -0,0 +1,113 @@
+def invert_lowest_one(n):
+    return n & (n - 1)
+
+def skip_height(height):
+    # Height that a block's skip pointer jumps back to. Chosen (as in BTC)
+    #   so that any ancestor can be reached in O(log n) jumps
+    if height < 2:
+        return 0
+    if height & 1:
+        return invert_lowest_one(invert_lowest_one(height - 1)) + 1
+    return invert_lowest_one(height)
+
+
+class IndexEntry:
+    __slots__ = ["hash", "parent", "height", "work", "skip"]
+
+    def __init__(self, hash, parent, work):
+        self.hash = hash
+        self.parent = parent
+        self.work = work
+        if parent is None:
+            self.height = 0
+            self.skip = None
+        else:
+            self.height = parent.height + 1
+            self.skip = parent.ancestor(skip_height(self.height))
+
+    def ancestor(self, height):
+        # The block at `height` on the chain ending in this block
+        if height > self.height or height < 0:
+            return None
+        walk = self
+        while walk.height > height:
+            h_skip = skip_height(walk.height)
+            h_skip_prev = skip_height(walk.height - 1)
+            # Take the skip pointer unless it overshoots, or the parent's
+            #   skip pointer would get us closer
+            if walk.skip is not None and (h_skip == height or (h_skip > height and not (h_skip_prev < h_skip - 2 and h_skip_prev >= height))):
+                walk = walk.skip
+            else:
+                walk = walk.parent
+        return walk
+
+
+class BlockIndex:
+    # Height, work and ancestry of every known block, plus the main chain
+    #   as a list of hashes by height
+    def __init__(self):
+        self.entries = {}
+        self.main_chain = []
+
+    def add(self, h, parent_hash, work):
+        parent = self.entries[parent_hash] if parent_hash is not None else None
+        entry = IndexEntry(h, parent, work + (parent.work if parent else 0))
+        self.entries[h] = entry
+        return entry
+
+    def __getitem__(self, h):
+        return self.entries[h]
+
+    def __contains__(self, h):
+        return h in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def tip(self):
+        return self.main_chain[-1]
+
+    def tip_height(self):
+        return len(self.main_chain) - 1
+
+    def at_height(self, height):
+        # Hash of the main chain block at `height`, or None
+        if 0 <= height < len(self.main_chain):
+            return self.main_chain[height]
+        return None
+
+    def on_main_chain(self, h):
+        entry = self.entries.get(h)
+        return entry is not None and self.at_height(entry.height) == h
+
+    def push(self, h):
+        # Extend the main chain by one block
+        self.main_chain.append(h)
+
+    def pop(self):
+        return self.main_chain.pop()
+
+    def set_tip(self, h):
+        # Point the main chain at an arbitrary block
+        fork = self.fork_point(self.tip(), h) if self.main_chain else None
+        height = fork.height + 1 if fork else 0
+        del self.main_chain[height:]
+        entry = self.entries[h]
+        branch = []
+        while entry is not None and entry.height >= height:
+            branch.append(entry.hash)
+            entry = entry.parent
+        self.main_chain.extend(reversed(branch))
+
+    def fork_point(self, a, b):
+        # Last block the chains ending in `a` and `b` have in common, found
+        #   by binary search on height
+        a, b = self.entries[a], self.entries[b]
+        lo, hi = 0, min(a.height, b.height)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if a.ancestor(mid) is b.ancestor(mid):
+                lo = mid
+            else:
+                hi = mid - 1
+        return a.ancestor(lo)
@@ -1,40 +1,165 @@
-from .hashing import hash_
+from .encoding import VERSION, Writer, Reader, DecodeError, varint_bytes
+from .hashing import hash_bytes, prefix_hasher
+from .merkle import merkle_root, merkle_proof
 from .serialization import fmt_h
 from .tx import Tx
+from .util import Immutable
 
 
-class BlockStruct:
-    def __init__(self, id, last_hash, txs, nonce):
-        self.id = id
-        self.last_hash = last_hash
-        self.txs = txs
-        self.nonce = nonce
+class BlockHeader(Immutable):
+    # The fixed-size part of a block; the block hash (and so the proof of
+    #   work) covers only this, with the txs committed to via merkle_root
+    __slots__ = ["id", "last_hash", "merkle_root", "nonce", "_hash"]
+    FIELDS = ["id", "last_hash", "merkle_root", "nonce"]
+
+    def __init__(self, id, last_hash, merkle_root, nonce):
+        self.set_fields(id=id, last_hash=last_hash, merkle_root=merkle_root, nonce=nonce, _hash=None)
+
+    def as_json(self):
+        return {
+            "id": self.id,
+            "last_hash": self.last_hash,
+            "merkle_root": self.merkle_root,
+            "nonce": self.nonce
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        # Binary messages decode straight to headers
+        if isinstance(data, cls):
+            return data
+        return cls(**data)
+
+    def encode_prefix(self, w):
+        # Everything but the nonce, which comes last so that mining can
+        #   hash the rest once
+        w.byte(VERSION)
+        w.varint(self.id)
+        w.optional(w.hash, self.last_hash)
+        w.hash(self.merkle_root)
+
+    def encode(self, w):
+        self.encode_prefix(w)
+        w.optional(w.varint, self.nonce)
+
+    def encoded(self):
+        w = Writer()
+        self.encode(w)
+        return w.getvalue()
+
+    @classmethod
+    def decode(cls, r):
+        r.version()
+        return cls(r.varint(), r.optional(r.hash), r.hash(), r.optional(r.varint))
+
+    def hash(self):
+        if self._hash is None:
+            self.set_fields(_hash=hash_bytes(self.encoded()))
+        return self._hash
+
+    def nonce_hasher(self):
+        # f(nonce) == hash of this header with that nonce, without re-encoding it
+        w = Writer()
+        self.encode_prefix(w)
+        return prefix_hasher(w.getvalue(), lambda nonce: b'\x01' + varint_bytes(nonce))
+
+
+class BlockStruct(Immutable):
+    __slots__ = ["id", "last_hash", "txs", "nonce", "merkle_root", "_header"]
+    FIELDS = ["id", "last_hash", "txs", "nonce", "merkle_root"]
+
+    def __init__(self, id, last_hash, txs, nonce, merkle_root=None):
+        txs = tuple(txs)
+        if merkle_root is None:
+            merkle_root = merkle_root_of(txs)
+        self.set_fields(id=id, last_hash=last_hash, txs=txs, nonce=nonce, merkle_root=merkle_root,
+                        _header=BlockHeader(id, last_hash, merkle_root, nonce))
     
     def as_json(self):
         return {
             "id": self.id,
             "txs": self.txs,
             "nonce": self.nonce,
-            "last_hash": self.last_hash
+            "last_hash": self.last_hash,
+            "merkle_root": self.merkle_root
         }
 
     @classmethod
     def from_json(cls, data):
+        # Binary messages decode straight to blocks
+        if isinstance(data, cls):
+            return data
         data["txs"] = [Tx.from_json(tx) for tx in data["txs"]]
         return cls(**data)
     
+    def encode(self, w):
+        # The header, then the txs, each in its cached encoding
+        self._header.encode(w)
+        w.varint(len(self.txs))
+        for tx in self.txs:
+            tx.encode(w)
+
+    def encoded(self):
+        w = Writer()
+        self.encode(w)
+        return w.getvalue()
+
+    @classmethod
+    def decode(cls, r):
+        header = BlockHeader.decode(r)
+        txs = [Tx.decode(r) for i in range(r.varint())]
+        return cls(header.id, header.last_hash, txs, header.nonce, header.merkle_root)
+
+    @classmethod
+    def from_bytes(cls, data):
+        r = Reader(data)
+        block = cls.decode(r)
+        if not r.at_end():
+            raise DecodeError("Trailing data after block")
+        return block
+
     @classmethod
     def genesis(cls):
         return cls(1, None, [], None)
 
+    def with_nonce(self, nonce):
+        return BlockStruct(self.id, self.last_hash, self.txs, nonce, self.merkle_root)
+
+    def header(self):
+        return self._header
+
+    def hash(self):
+        return self._header.hash()
+
+    def nonce_hasher(self):
+        return self._header.nonce_hasher()
+
+    def tx_hashes(self):
+        return [tx.txid() for tx in self.txs]
+
+    def compute_merkle_root(self):
+        return merkle_root_of(self.txs)
+
+    def tx_proof(self, tx_index):
+        # Proof that txs[tx_index] is committed to by this block's header
+        return merkle_proof(self.tx_hashes(), tx_index)
+
     def coinbase(self):
-        return [tx for tx in self.txs if tx.is_coinbase()][0]
+        # Valid blocks have exactly one coinbase, as their last tx
+        return self.txs[-1]
 
     def miner(self):
         return self.coinbase().outputs[0].out_addr
     
     def __repr__(self):
-        return "Block<{}>[{}]".format(fmt_h(hash_(self)), self.txs)
+        return "Block<{}>[{}]".format(fmt_h(self.hash()), list(self.txs))
 
     def __eq__(self, other):
-        return self.last_hash == other.last_hash and self.txs == other.txs and self.nonce == other.nonce
+        return self.last_hash == other.last_hash and self.merkle_root == other.merkle_root and self.txs == other.txs and self.nonce == other.nonce
+
+    def __hash__(self):
+        return hash(self.hash())
+
+
+def merkle_root_of(txs):
+    return merkle_root([tx.txid() for tx in txs])
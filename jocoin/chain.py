@@ -1,24 +1,72 @@
-from collections import defaultdict
-from .hashing import hash_
+from collections import defaultdict, OrderedDict
 from .serialization import fmt_h
 from .tx import Tx, TxInput, InvalidTransactionException, COINBASE_AMT
 from .blockstruct import BlockStruct
+from .blockindex import BlockIndex
+from .utxos import UtxoSet
+from .snapshot import ChainSnapshot
+from .addrindex import AddressIndex
+from .utxosnapshot import UtxoSnapshot
+from .store import CorruptStoreException
+from .verify import verify_signature
+from . import signature
 
 DIFFICULTY = 1 << 235
 
 class InvalidBlockException(Exception):
     pass
 
+class BodyMismatchException(InvalidBlockException):
+    # The txs don't match the header's merkle root. Says nothing about the
+    #   block the header commits to, only about this copy of its body
+    pass
+
+def check_header(header):
+    # The proof of work, which needs nothing but the header
+    header_hash = header.hash()
+    if not header_hash < DIFFICULTY:
+        raise InvalidBlockException("Invalid nonce: {} is not less than {}".format(header_hash, DIFFICULTY))
+
+def block_work(target):
+    # Expected number of hashes needed to find a block below target
+    return (1 << 256) // target
+
 class BlockChain:
     FEE_INDEX = -1
+    # Most blocks kept while waiting for their parent to arrive
+    MAX_ORPHANS = 100
+    # Connected blocks whose spent outputs are kept in memory; undo data for
+    #   older blocks is rebuilt from the blocks they spent from
+    UNDO_DEPTH = 100
+
     def __init__(self, current_hash, blocks):
         ordered = list(self.block_iter_(current_hash, blocks))
         ordered.reverse()
         gen = BlockStruct.genesis()
-        gen_hash = hash_(gen)
+        gen_hash = gen.hash()
         if gen_hash in blocks and blocks[gen_hash] == gen:
-            self.current_hash = gen_hash
+            # Every block known to connect to genesis, on the main chain or not
             self.blocks = {gen_hash: gen}
+            # Height, total work and ancestors of each block, and the main chain
+            self.index = BlockIndex()
+            self.index.add(gen_hash, None, 0)
+            self.index.push(gen_hash)
+            # Unspent outputs: (block_hash, tx_index, out_index) -> (out_addr, amount)
+            self.utxos = UtxoSet()
+            # Block hash -> outputs spent by that block, for disconnecting it
+            self.undo = OrderedDict()
+            # Block hash -> block, for blocks whose parent we don't have yet
+            self.orphans = OrderedDict()
+            # Blocks that failed validation, and their descendants
+            self.invalid = set()
+            self.store = None
+            # Checks signatures on other processes if set (a VerifierPool)
+            self.verifier = None
+            # Balances and tx history by address, if enabled
+            self.address_index = None
+            # If the chain was started from a UTXO snapshot, its base block.
+            #   The blocks before it were not validated here and may be missing
+            self.snapshot_base = None
             for block in ordered[1:]:
                 self.add_block(block)
         else:
@@ -27,12 +75,100 @@ class BlockChain:
     @classmethod
     def empty(cls):
         gen = BlockStruct.genesis()
-        current_hash = hash_(gen)
+        current_hash = gen.hash()
         blocks = {current_hash: gen}
         return cls(current_hash, blocks)
 
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        # Start at a UtxoSnapshot's base block, with only its headers for
+        #   the blocks before it. The headers' proof of work is checked, but
+        #   the outputs are taken on trust until SnapshotValidation has
+        #   replayed the blocks
+        chain = cls.empty()
+        parent, parent_id = chain.current_hash, chain.last_block().id
+        for header in snapshot.headers:
+            check_header(header)
+            if header.last_hash != parent or header.id != parent_id + 1:
+                raise InvalidBlockException("Snapshot header {} does not follow the one before it".format(header.id))
+            parent, parent_id = header.hash(), header.id
+            chain.index.add(parent, header.last_hash, block_work(DIFFICULTY))
+        base = snapshot.base
+        if base.hash() != parent or base.merkle_root != base.compute_merkle_root():
+            raise InvalidBlockException("Snapshot block does not match its header")
+        chain.blocks[parent] = base
+        chain.index.set_tip(parent)
+        chain.utxos = UtxoSet(snapshot.utxos)
+        chain.snapshot_base = parent
+        return chain
+
+    @classmethod
+    def from_store(cls, store):
+        # Resume from the chain state saved in `store` without re-validating
+        #   the blocks in it
+        snapshot = store.read_snapshot()
+        if snapshot is not None:
+            chain = cls.from_snapshot(UtxoSnapshot.decode(snapshot))
+        else:
+            chain = cls.empty()
+        # Genesis, and a snapshot's base block
+        for h, block in chain.blocks.items():
+            store[h] = block
+        chain.blocks = store
+        chain.store = store
+        # Parents are stored before their children, except for blocks from
+        #   before a snapshot, which are stored after it by SnapshotValidation
+        pending = [(h, parent) for h, parent in store.parents.items() if parent is not None and h not in chain.index]
+        while pending:
+            later = []
+            for h, parent in pending:
+                if parent in chain.index:
+                    chain.index.add(h, parent, block_work(DIFFICULTY))
+                else:
+                    later.append((h, parent))
+            if len(later) == len(pending):
+                raise CorruptStoreException("Stored blocks do not connect to genesis")
+            pending = later
+        state = store.load_chainstate()
+        if state is not None:
+            current_hash, utxos = state
+            chain.utxos = UtxoSet(utxos)
+            chain.index.set_tip(current_hash)
+        tip = store.tip()
+        if tip is not None and tip != chain.current_hash:
+            # Catch up with the blocks connected since the chain state was saved
+            chain.reorganize(tip, validate=False)
+        return chain
+
+    def enable_address_index(self):
+        # Start keeping an AddressIndex, built from the main chain so far
+        if self.snapshot_base is not None:
+            raise ValueError("An address index needs every block, not a UTXO snapshot")
+        index = AddressIndex()
+        # Genesis has no txs and is never connected
+        for h in reversed(list(self.hash_iter())[:-1]):
+            blk = self.blocks[h]
+            index.connect(h, blk, self.rebuild_undo(blk))
+        self.address_index = index
+
+    def flush(self):
+        if self.store is not None:
+            self.store.save_chainstate(self.current_hash, self.utxos)
+
+    @property
+    def current_hash(self):
+        return self.index.tip()
+
+    def height(self):
+        return self.index.tip_height()
+
     def length(self):
-        return len(list(self.block_iter()))
+        return self.height() + 1
+
+    def block_at(self, height):
+        # The main chain block at `height`, or None
+        h = self.index.at_height(height)
+        return self.blocks[h] if h is not None else None
 
     def as_json(self):
         return {
@@ -46,7 +182,7 @@ class BlockChain:
         return cls(**data)
     
     def block_iter(self):
-        return self.block_iter_(self.current_hash, self.blocks)
+        return (self.blocks[h] for h in self.hash_iter())
 
     @staticmethod
     def block_iter_(last_hash, blocks):
@@ -56,91 +192,342 @@ class BlockChain:
             yield b
             h = b.last_hash
 
+    def hash_iter(self, tip=None):
+        # Like block_iter, but yields the hashes without loading the blocks
+        if tip is None:
+            yield from reversed(self.index.main_chain)
+            return
+        entry = self.index[tip]
+        while entry is not None:
+            yield entry.hash
+            entry = entry.parent
+
+    def locator(self):
+        # Hashes from the tip back to genesis, dense near the tip and
+        #   exponentially sparser further back, so that a peer can find
+        #   the last block we have in common in a single request
+        locator = []
+        height, step = self.height(), 1
+        while height > 0:
+            locator.append(self.index.at_height(height))
+            if len(locator) >= 10:
+                step *= 2
+            height -= step
+        locator.append(self.index.at_height(0))
+        return locator
+
+    def blocks_after(self, locator, limit):
+        # The (up to) `limit` blocks following the first locator hash that
+        #   is on our main chain
+        for h in locator:
+            if self.index.on_main_chain(h):
+                break
+        else:
+            return []
+        start = self.index[h].height + 1
+        blocks = []
+        for height in range(start, min(start + limit, self.length())):
+            h = self.index.at_height(height)
+            if h not in self.blocks:
+                # Before a UTXO snapshot's base block
+                break
+            blocks.append(self.blocks[h])
+        return blocks
+
+    def headers_after(self, locator, limit):
+        return [block.header() for block in self.blocks_after(locator, limit)]
+
     def amt_in(self, tx):
         return sum(self.output_size(inp) for inp in tx.inputs)
+
+    def fee(self, tx):
+        return self.amt_in(tx) - tx.amt_out()
         
     def find_inputs(self):
         valid_inputs = defaultdict(list)
-        inputs = set()
-        for block in self.block_iter():
-            block_hash = hash_(block)
-            for tx_index, tx in enumerate(block.txs):
-                # An output is a valid input unless it's been consumed by another transaction
-                for output_index, outp in enumerate(tx.outputs):
-                    output_id = (block_hash, tx_index, output_index)
-                    if output_id not in inputs:
-                        valid_inputs[outp.out_addr].append(output_id)
-                # Transaction fees
-                # TODO: better way?
-                output_id = (block_hash, tx_index, self.FEE_INDEX)
-                amt_in = self.amt_in(tx)
-                if output_id not in inputs and self.amt_in(tx) > tx.amt_out():
-                    valid_inputs[block.miner()].append(output_id)
-                for inp in tx.inputs:
-                    inputs.add((inp.block_hash, inp.tx_index, inp.tx_out_index))
+        for output_id, (out_addr, amount) in self.utxos.items():
+            valid_inputs[out_addr].append(output_id)
         return {x: [TxInput(*i) for i in valid_inputs[x]] for x in valid_inputs}
     
     def output_size(self, tx):
+        utxo = self.utxos.get(tx.outpoint())
+        if utxo is not None:
+            return utxo[1]
+        # Spent output, look it up in the block itself
         if tx.tx_out_index == self.FEE_INDEX:
             tx_output = self.blocks[tx.block_hash].txs[tx.tx_index]
             return self.amt_in(tx_output) - tx_output.amt_out()
         return self.blocks[tx.block_hash].txs[tx.tx_index].outputs[tx.tx_out_index].amount
     
     def holdings(self):
-        valid_inputs = self.find_inputs()
-        return {user: sum(self.output_size(x) for x in valid_inputs[user]) for user in valid_inputs}
+        holdings = defaultdict(float)
+        for out_addr, amount in self.utxos.values():
+            holdings[out_addr] += amount
+        return dict(holdings)
+
+    def holdings_for(self, pubkey):
+        return self.utxos.balance(pubkey)
 
     def valid_inputs_for(self, pubkey):
-        valid_inputs = self.find_inputs()
-        return [(i, self.output_size(i)) for i in valid_inputs.get(pubkey, [])]
+        return [(TxInput(*output_id), amount) for output_id, amount in self.utxos.outputs_for(pubkey).items()]
                 
+    def snapshot(self):
+        balances = dict(self.address_index.balances) if self.address_index is not None else None
+        return ChainSnapshot(self.current_hash, self.height(), self.utxos.snapshot(), balances)
+
     def last_block(self):
         return self.blocks[self.current_hash]
             
-    def validate_block(self, block):
-        # Doesn't handle missed blocks (yet)
+    def check_block(self, block):
+        # Checks that don't depend on where the block sits in the chain
+        check_header(block.header())
+        # The header only commits to the txs through the merkle root
+        if block.merkle_root != block.compute_merkle_root():
+            raise BodyMismatchException("Merkle root does not match transactions")
+        if not block.txs or not block.txs[-1].is_coinbase():
+            raise InvalidBlockException("Block does not end with a coinbase")
+        if any(tx.is_coinbase() for tx in block.txs[:-1]):
+            raise InvalidBlockException("Block has more than one coinbase")
+        txids = block.tx_hashes()
+        if len(set(txids)) != len(txids):
+            raise InvalidBlockException("Block contains duplicate transactions")
+
+    def verify_signatures(self, blocks):
+        # Check the signatures of all the txs in `blocks` in one go, apart
+        #   from the ordered UTXO checks, so they can be spread over the
+        #   verifier's processes. Txs already verified, e.g. when they
+        #   entered the tx pool, are skipped. Returns the txids that failed
+        txs = [tx for blk in blocks for tx in blk.txs if not tx.is_coinbase() and tx.txid() not in signature.verified]
+        if self.verifier is not None:
+            results = self.verifier.verify(txs)
+        else:
+            results = [verify_signature(tx) for tx in txs]
+        bad = set()
+        for tx, ok in zip(txs, results):
+            if ok:
+                signature.verified.add(tx.txid())
+            else:
+                bad.add(tx.txid())
+        return bad
+
+    def validate_block(self, block, bad_signatures=None):
+        # Full validation of a block as the next one on the main chain.
+        #   bad_signatures is the result of verify_signatures, if the
+        #   caller already checked this block's signatures
         if block.last_hash != self.current_hash:
             raise InvalidBlockException("Last hash does not match last block in chain")
-        # Validate nonce
-        if not hash_(block) < DIFFICULTY:
-            raise InvalidBlockException("Invalid nonce: {} is not less than {}".format(hash_(block), DIFFICULTY))
+        if block.id != self.last_block().id + 1:
+            raise InvalidBlockException("Block id does not follow the last block in chain")
+        self.check_block(block)
+        if bad_signatures is None:
+            bad_signatures = self.verify_signatures([block])
         # Validate transactions
+        # Outputs spent by earlier transactions in this block
+        spent = set()
         for tx in block.txs:
             try:
-                self.validate_tx(tx)
+                self.validate_tx(tx, spent, bad_signatures)
             except InvalidTransactionException as e:
                 raise InvalidBlockException("Invalid transaction in block {}: {}".format(tx, e))
     
     def add_block(self, blk):
-        try:
-            self.validate_block(blk)
-            h = hash_(blk)
-            self.blocks[h] = blk
-            self.current_hash = h
+        # Add a block to the tree of known blocks, switching the main chain
+        #   over to it if it ends up with the most work. Returns False if
+        #   the block is invalid or can't be connected yet
+        h = blk.hash()
+        if h in self.invalid:
+            return False
+        if h in self.blocks:
             return True
+        try:
+            self.check_block(blk)
+            if blk.last_hash not in self.blocks:
+                self.add_orphan(h, blk)
+                return False
+            if blk.last_hash in self.invalid:
+                raise InvalidBlockException("Block extends an invalid block")
+            if blk.id != self.blocks[blk.last_hash].id + 1:
+                raise InvalidBlockException("Block id does not follow its parent")
+        except BodyMismatchException as e:
+            # Anyone can relay a valid header with the wrong txs, so this
+            #   must not stop us accepting the real block later
+            print("Invalid block body: {} {}".format(blk, e))
+            return False
         except InvalidBlockException as e:
+            self.invalid.add(h)
             print("Invalid block: {} {}".format(blk, e))
             return False
+        self.blocks[h] = blk
+        entry = self.index.add(h, blk.last_hash, block_work(DIFFICULTY))
+        valid = True
+        if entry.work > self.index[self.current_hash].work:
+            valid = self.reorganize(h)
+        # Blocks that were waiting for this one
+        children = [(oh, orphan) for oh, orphan in self.orphans.items() if orphan.last_hash == h]
+        for oh, orphan in children:
+            del self.orphans[oh]
+            self.add_block(orphan)
+        return valid
+
+    def add_orphan(self, h, blk):
+        self.orphans[h] = blk
+        if len(self.orphans) > self.MAX_ORPHANS:
+            self.orphans.popitem(last=False)
+
+    def fork_point(self, a, b):
+        # Last block two chain tips have in common
+        return self.index.fork_point(a, b).hash
+
+    def reorganize(self, new_tip, validate=True):
+        # Move the main chain to end at new_tip, disconnecting blocks back to
+        #   the fork point and connecting the new branch. If a block on the
+        #   new branch turns out to be invalid, go back to the old tip
+        old_tip = self.current_hash
+        fork = self.fork_point(old_tip, new_tip)
+        if self.snapshot_base is not None and self.index[fork].height < self.index[self.snapshot_base].height:
+            # We have neither the blocks nor the outputs from before the base block
+            print("Not switching to {}: it forks off before the snapshot block".format(fmt_h(new_tip)))
+            return False
+        branch = []
+        for h in self.hash_iter(new_tip):
+            if h == fork:
+                break
+            branch.append(h)
+        branch.reverse()
+        if validate:
+            # Signatures for the whole branch at once, e.g. a batch of
+            #   blocks during sync
+            bad_signatures = self.verify_signatures([self.blocks[h] for h in branch])
+        while self.current_hash != fork:
+            self.disconnect_tip()
+        for i, h in enumerate(branch):
+            blk = self.blocks[h]
+            if validate:
+                try:
+                    self.validate_block(blk, bad_signatures)
+                except InvalidBlockException as e:
+                    print("Invalid block: {} {}".format(blk, e))
+                    if not isinstance(e, BodyMismatchException):
+                        self.invalid.update(branch[i:])
+                    while self.current_hash != fork:
+                        self.disconnect_tip()
+                    self.reorganize(old_tip, validate=False)
+                    return False
+            self.connect_block(h, blk)
+        return True
+
+    def connect_block(self, h, blk):
+        self.undo[h] = self.apply_block(h, blk)
+        if self.address_index is not None:
+            self.address_index.connect(h, blk, self.undo[h])
+        if len(self.undo) > self.UNDO_DEPTH:
+            self.undo.popitem(last=False)
+        self.index.push(h)
+        if self.store is not None:
+            self.store.set_tip(h, self.utxos)
+
+    def disconnect_tip(self):
+        # Undo the last block on the main chain
+        h = self.current_hash
+        blk = self.blocks[h]
+        undo = self.undo.pop(h, None)
+        if undo is None:
+            undo = self.rebuild_undo(blk)
+        if self.address_index is not None:
+            self.address_index.disconnect(h, blk, undo)
+        self.unapply_block(self.utxos, h, blk, undo)
+        self.index.pop()
+        if self.store is not None:
+            self.store.set_tip(self.current_hash, self.utxos)
+
+    def unapply_block(self, utxos, h, blk, undo):
+        # The reverse of apply_block, on utxos
+        for tx_index, tx in enumerate(blk.txs):
+            for output_index in range(len(tx.outputs)):
+                del utxos[(h, tx_index, output_index)]
+            utxos.pop((h, tx_index, self.FEE_INDEX), None)
+        for output_id, utxo in undo:
+            utxos[output_id] = utxo
+
+    def utxos_at(self, block_hash):
+        # The unspent outputs as of main chain block block_hash, worked back
+        #   from those at the tip
+        if not self.index.on_main_chain(block_hash):
+            raise ValueError("Block {} is not on the main chain".format(fmt_h(block_hash)))
+        utxos = dict(self.utxos.items())
+        for h in self.hash_iter():
+            if h == block_hash:
+                break
+            blk = self.blocks[h]
+            undo = self.undo.get(h)
+            if undo is None:
+                undo = self.rebuild_undo(blk)
+            self.unapply_block(utxos, h, blk, undo)
+        return utxos
+
+    def rebuild_undo(self, blk):
+        # The outputs a block spent, recovered from the blocks that created them
+        undo = []
+        for tx in blk.txs:
+            for inp in tx.inputs:
+                source = self.blocks[inp.block_hash]
+                if inp.tx_out_index == self.FEE_INDEX:
+                    out_addr = source.miner()
+                else:
+                    out_addr = source.txs[inp.tx_index].outputs[inp.tx_out_index].out_addr
+                undo.append((inp.outpoint(), (out_addr, self.output_size(inp))))
+        return undo
         
+    def apply_block(self, block_hash, blk):
+        # Move the unspent output set forward past an already validated block,
+        #   returning the outputs it spent
+        undo = []
+        for tx_index, tx in enumerate(blk.txs):
+            amt_in = 0.0
+            for inp in tx.inputs:
+                output_id = inp.outpoint()
+                utxo = self.utxos.pop(output_id)
+                undo.append((output_id, utxo))
+                amt_in += utxo[1]
+            for output_index, outp in enumerate(tx.outputs):
+                self.utxos[(block_hash, tx_index, output_index)] = (outp.out_addr, outp.amount)
+            # Transaction fees
+            if amt_in > tx.amt_out():
+                self.utxos[(block_hash, tx_index, self.FEE_INDEX)] = (blk.miner(), amt_in - tx.amt_out())
+        return undo
+
     def validate_coinbase(self, tx):
         if tx.amt_out() != COINBASE_AMT:
             raise InvalidTransactionException("Coinbase includes incorrect payout")
     
-    def validate_tx(self, tx):
+    def validate_tx(self, tx, spent=None, bad_signatures=None):
         if tx.is_coinbase():
             self.validate_coinbase(tx)
         else:
-            self.validate_transaction(tx)
+            self.validate_transaction(tx, spent, bad_signatures)
     
-    def validate_transaction(self, tx):
-        tx.validate()
-        valid_inputs = self.find_inputs()
-        if not all(inp in valid_inputs[tx.from_addr] for inp in tx.inputs):
-            raise InvalidTransactionException("Transaction includes invalid/double-spend inputs".format(tx))
-        if sum(self.output_size(i) for i in tx.inputs) < tx.amt_out():
+    def validate_transaction(self, tx, spent=None, bad_signatures=None):
+        # `spent` collects outputs consumed so far, so that validating a whole
+        # block also catches double spends between its own transactions.
+        # Signatures are checked here unless verify_signatures already has
+        if spent is None:
+            spent = set()
+        if bad_signatures is None:
+            tx.validate()
+        elif tx.txid() in bad_signatures:
+            raise InvalidTransactionException("Invalid signature")
+        amt_in = 0.0
+        for inp in tx.inputs:
+            output_id = inp.outpoint()
+            utxo = self.utxos.get(output_id)
+            if utxo is None or utxo[0] != tx.from_addr or output_id in spent:
+                raise InvalidTransactionException("Transaction includes invalid/double-spend inputs")
+            spent.add(output_id)
+            amt_in += utxo[1]
+        if amt_in < tx.amt_out():
             raise InvalidTransactionException("Transaction outputs are more than inputs")
             
     def __repr__(self):
-        s = "Chain:\n" + "\n".join("\t{}: {}".format(str(hash_(blk))[:8], str(blk)) for blk in self.block_iter())
+        s = "Chain:\n" + "\n".join("\t{}: {}".format(str(blk.hash())[:8], str(blk)) for blk in self.block_iter())
         s += "\n"
         return s
@@ -1,51 +1,176 @@
+import itertools
 import random
 import time
 import traceback
 from threading import Thread, RLock
 from .chain import DIFFICULTY, BlockChain, BlockStruct, InvalidTransactionException
-from .tx import Tx, TxOutput
+from .tx import Tx, TxInput, TxOutput
 from .serialization import serialize
-from .hashing import hash_
-from .signature import create_signature
+from .signature import create_signature, verified
+from .mining import MiningPool
+from .verify import VerifierPool
+from .store import BlockStore
+from .mempool import Mempool
+from .template import BlockTemplate
+from .sync import HeaderSync, SnapshotValidation
+from .utxosnapshot import UtxoSnapshot, SnapshotError
+from .metrics import metrics, TimedLock
 from . import network as nw
 
 
 class Client:
     GOSSIP_INTERVAL = 10
+    # Most blocks sent or requested in a single GETBLOCKS exchange
+    BLOCK_BATCH = 500
+    # Most headers sent or requested in a single GETHEADERS exchange
+    HEADER_BATCH = 2000
+    # How far behind the best peer the initial sync has to be to fetch
+    #   headers first and then blocks from all peers (see sync.py)
+    HEADERS_FIRST_MIN = BLOCK_BATCH
+    # Most bytes of unconfirmed txs kept in the tx pool
+    MEMPOOL_BYTES = Mempool.MAX_BYTES
+    # Most bytes of txs in the blocks we mine
+    MAX_BLOCK_BYTES = BlockTemplate.MAX_BYTES
+    # Seconds a changed block template waits before the miner switches to
+    #   it, so that a burst of txs costs one restart rather than many
+    TEMPLATE_DEBOUNCE = 0.5
+    # Nonces tried between checks for a new template when mining in-process
+    NONCE_BATCH = 1000
 
-    def __init__(self, pubkey, privkey, peers, listen_addr):
+    # Most outputs or txs sent in one page of an ADDRESS or HISTORY reply
+    PAGE_LIMIT = 1000
+
+    def __init__(self, pubkey, privkey, peers, listen_addr, workers=0, datadir=None, verifiers=0, address_index=False,
+                 snapshot=None, snapshot_commitment=None, validate_snapshot=True):
         self.address = listen_addr
         self.pubkey = pubkey
         self.privkey = privkey
-        self.current_txs = []
+        self.mempool = Mempool(self.MEMPOOL_BYTES)
+        self.template = BlockTemplate(self.mempool, self.MAX_BLOCK_BYTES)
+        # When the template first changed since the miner last picked it up
+        self.template_changed_at = None
         self.chain = None
+        # Snapshot of the chain as of its current tip, for lock-free reads
+        self.published = None
         if peers:
             self.peers = peers
         else:
             self.peers = []
         self.keep_mining = True
         self.keep_gossiping = True
+        # Cleared to stop the mining thread, and with it the node
+        self.running = True
+        # Create lock for the state, recording how long threads wait for it
+        self.chain_lock = TimedLock(RLock(), metrics, "chain_lock")
+        # Peers we are currently pulling blocks/txs from
+        self.pulling = set()
+        # Nonces tried by the mining thread itself, and seconds spent mining
+        #   so far: the hashrate in STATS is one over the other
+        self.hashes = 0
+        self.mining_seconds = 0.0
+        self.mining_since = None
+        # With no workers, mining runs in the mining thread itself
+        if workers:
+            self.miner = MiningPool(workers)
+        else:
+            self.miner = None
+        # Directory to keep the chain in across restarts; in memory only if None
+        self.datadir = datadir
+        # Whether to keep balances and tx history by address (see addrindex.py)
+        self.address_index = address_index
+        # A UTXO snapshot file to start from instead of genesis, the
+        #   commitment it must have if given, and whether to check it
+        #   against the blocks before it once running (see utxosnapshot.py)
+        self.snapshot_path = snapshot
+        self.snapshot_commitment = snapshot_commitment
+        self.validate_snapshot = validate_snapshot
+        self.snapshot_validation = None
+        # With no verifiers, signatures are checked in the validating thread
+        if verifiers:
+            self.verifier = VerifierPool(verifiers)
+        else:
+            self.verifier = None
 
     def start(self):
+        # Fork mining and verifying processes before any other threads exist
+        if self.miner is not None:
+            self.miner.start()
+        if self.verifier is not None:
+            self.verifier.start()
         # Initialize state
-        if self.peers:
-            self.get_initial_state()
+        snapshot = None
+        if self.snapshot_path is not None:
+            snapshot = UtxoSnapshot.load(self.snapshot_path, self.snapshot_commitment)
+        if self.datadir is not None:
+            store = BlockStore(self.datadir)
+            if snapshot is not None:
+                stored = store.read_snapshot()
+                if store.tip() is None and stored is None:
+                    store.write_snapshot(snapshot.encode())
+                elif stored != snapshot.encode():
+                    print("Not starting from the UTXO snapshot: {} already holds a chain".format(self.datadir))
+            self.chain = BlockChain.from_store(store)
+            if self.chain.snapshot_base is not None:
+                # Possibly a snapshot still being validated when we last stopped
+                snapshot = UtxoSnapshot.decode(store.read_snapshot())
+        elif snapshot is not None:
+            self.chain = BlockChain.from_snapshot(snapshot)
         else:
             self.chain = BlockChain.empty()
-        # Create lock for the state
-        self.chain_lock = RLock()
+        self.chain.verifier = self.verifier
+        if self.address_index:
+            self.chain.enable_address_index()
+        self.publish_snapshot()
+        if self.peers:
+            self.get_initial_state()
+        if self.chain.snapshot_base is not None and self.validate_snapshot and self.peers:
+            self.snapshot_validation = SnapshotValidation(self, self.peers, snapshot)
+            Thread(target=self.snapshot_validation_thread, daemon=True).start()
         # Start listening thread
-        listener = nw.JoCoinListener(self, self.address)
-        self.listener = Thread(target=listener.start)
+        self.server = nw.JoCoinListener(self, self.address)
+        self.listener = Thread(target=self.server.start)
         self.listener.start()
         # Start gossiping
-        self.gossiper = Thread(target=self.gossip_thread)
+        self.gossiper = Thread(target=self.gossip_thread, daemon=True)
         self.gossiper.start()
         # Start mining
-        self.mining_thread()
+        try:
+            self.mining_thread()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        print("Shutting down")
+        self.keep_gossiping = False
+        self.keep_mining = False
+        self.server.stop()
+        if self.miner is not None:
+            self.miner.stop()
+        if self.verifier is not None:
+            self.verifier.stop()
+        with self.chain_lock:
+            self.chain.flush()
+
+    def snapshot_validation_thread(self):
+        # Retries while peers can't send the blocks; stops the node if they
+        #   show the snapshot to be wrong, as everything since builds on it
+        while self.keep_gossiping:
+            try:
+                self.snapshot_validation.run()
+                print("UTXO snapshot validated")
+                return
+            except SnapshotError as e:
+                print("UTXO snapshot is invalid, shutting down: {}".format(e))
+                self.running = False
+                self.keep_mining = False
+                return
+            except Exception as e:
+                print("Error validating UTXO snapshot: {}".format(e))
+                traceback.print_exc()
+            time.sleep(self.GOSSIP_INTERVAL)
 
     def mining_thread(self):
-        while True:
+        while self.running:
             print("Entering mining loop:")
             self.print_current_state()
             self.keep_mining = True
@@ -54,27 +179,54 @@ class Client:
             block = self.mine()
             if block:
                 print("New block found! Broadcasting to peers.")
-                self.add_block(block)
+                metrics.count("blocks.found")
+                with self.chain_lock:
+                    if self.add_block(block):
+                        metrics.count("blocks.accepted")
                 self.broadcast()
 
     def gossip_thread(self):
+        # The chain lock is only taken around local state changes, never
+        # while waiting on a peer, as the peer may be asking us for blocks
         while self.keep_gossiping:
-            with self.chain_lock:
-                self.gossip()
+            self.gossip()
             time.sleep(self.GOSSIP_INTERVAL)
         
     def dispatch_incoming_message(self, message, data):
+        with metrics.timed("message." + nw.message_name(message)):
+            return self.handle_message(message, data)
+
+    def handle_message(self, message, data):
+        # Queries about the chain state are answered from the latest
+        #   snapshot, so they neither wait for nor hold up block processing.
+        #   So are STATS, which would be no help if the lock were stuck
+        if message == nw.BALANCE:
+            pubkey = tuple(data)
+            return self.holdings_for(pubkey)
+        elif message == nw.INPUTS:
+            pubkey = tuple(data)
+            return self.inputs_for(pubkey)
+        elif message == nw.ADDRESS:
+            return self.address_page(tuple(data["address"]), data["offset"], data["limit"])
+        elif message == nw.STATS:
+            return self.stats()
         with self.chain_lock:
             # Incoming data is already deserialized, but may be in nonstandard formats
             # (e.g. keys deserialize to lists instead of tuples)
             if message == nw.GOSSIP:
                 return self.handle_peer_data(data)
-            elif message == nw.BALANCE:
-                pubkey = tuple(data)
-                return self.holdings_for(pubkey)
-            elif message == nw.INPUTS:
-                pubkey = tuple(data)
-                return self.inputs_for(pubkey)
+            elif message == nw.INV:
+                return self.handle_peer_inventory(data)
+            elif message == nw.GETBLOCKS:
+                return self.chain.blocks_after(data["locator"], min(data["limit"], self.BLOCK_BATCH))
+            elif message == nw.GETHEADERS:
+                return self.chain.headers_after(data["locator"], min(data["limit"], self.HEADER_BATCH))
+            elif message == nw.GETDATA:
+                return [self.chain.blocks[h] for h in data[:self.BLOCK_BATCH] if h in self.chain.blocks]
+            elif message == nw.GETTXS:
+                return [self.mempool.get(txid) for txid in data if txid in self.mempool]
+            elif message == nw.HISTORY:
+                return self.history_page(tuple(data["address"]), data["offset"], data["limit"])
             elif message == nw.TRANSFER:
                 tx = Tx.from_json(data)
                 if self.add_tx(tx):
@@ -95,25 +247,47 @@ class Client:
     def get_initial_state(self):
         while True:
             try:
-                peer = self.random_peer()
-                other = nw.gossip_with(peer, None)
-                if other:
-                    self.merge_history(other)
-                    break
-                else:
-                    continue
+                self.initial_sync()
+                break
             except ConnectionError as e:
-                print("Error connecting to peer {}: {}".format(peer, e))
+                print("Error connecting to peers: {}".format(e))
                 traceback.print_exc()
             except Exception as e:
-                print("Error merging peer history for peer {}: {}".format(peer, e))
+                print("Error merging peer history: {}".format(e))
                 traceback.print_exc()
             time.sleep(1)
 
+    def initial_sync(self):
+        # Ask every peer what it has, then catch up with the one furthest
+        #   ahead. A long way behind, blocks come from all peers at once
+        with self.chain_lock:
+            inventory = self.inventory()
+        replies = [(peer, other) for peer, other in nw.exchange_inventories(self.peers, inventory) if not isinstance(other, Exception)]
+        if not replies:
+            raise ConnectionError("No peer could be reached")
+        with self.chain_lock:
+            for peer, other in replies:
+                self.merge_peers(other["peers"])
+            peer, best = max(replies, key=lambda reply: reply[1]["height"])
+            behind = best["height"] - self.chain.height()
+        if behind >= self.HEADERS_FIRST_MIN:
+            HeaderSync(self, [p for p, other in replies]).run(peer)
+        # Whatever else the peer has: txs, and blocks found in the meantime
+        self.pull_from_peer(peer, best)
+
     def broadcast(self):
-        # For newly-found blocks, blast to all known peers
-        for peer in self.peers:
-            self.gossip_with_peer(peer, self.get_all_state())
+        # For newly-found blocks, announce our new tip to all known peers at
+        # once, who then pull the block from us
+        with self.chain_lock:
+            inventory = self.inventory()
+            peers = list(self.peers)
+        for peer, other in nw.exchange_inventories(peers, inventory):
+            try:
+                if isinstance(other, Exception):
+                    raise other
+                self.merge_inventory(peer, other)
+            except Exception as e:
+                print("Error gossiping with peer {}: {}".format(peer, e))
 
     def random_peer(self):
         if self.peers:
@@ -123,15 +297,111 @@ class Client:
         peer = self.random_peer()
         if peer is not None:
             print("Gossiping with {}".format(peer))
-            return self.gossip_with_peer(peer, self.get_all_state())
+            return self.gossip_with_peer(peer)
 
-    def gossip_with_peer(self, peer, history):
+    def gossip_with_peer(self, peer):
         try:
-            other = nw.gossip_with(peer, history)
-            self.handle_peer_data(other)
+            self.sync_with_peer(peer)
         except Exception as e:
             print("Error gossiping with peer {}: {}".format(peer, e))
 
+    def inventory(self):
+        # What we have, in summary: peers can work out from this what they are missing
+        return {
+            "address": self.address,
+            "peers": [self.address] + self.peers,
+            "tip": self.chain.current_hash,
+            "height": self.chain.height(),
+            "txs": self.mempool.txids()
+        }
+
+    def sync_with_peer(self, peer):
+        with self.chain_lock:
+            inventory = self.inventory()
+        other = nw.exchange_inventory(peer, inventory)
+        self.merge_inventory(peer, other)
+
+    def merge_inventory(self, peer, other):
+        # Act on a peer's reply to our inventory
+        with self.chain_lock:
+            self.merge_peers(other["peers"])
+        self.pull_from_peer(peer, other)
+
+    def handle_peer_inventory(self, inventory):
+        self.merge_peers(inventory["peers"])
+        peer = tuple(inventory["address"])
+        if peer not in self.pulling and (self.is_behind(inventory) or self.missing_txs(inventory)):
+            # Pull in the background: the peer is waiting for our reply
+            Thread(target=self.pull_in_background, args=(peer, inventory), daemon=True).start()
+        return self.inventory()
+
+    def is_behind(self, inventory):
+        return inventory["height"] > self.chain.height() and inventory["tip"] not in self.chain.blocks
+
+    def missing_txs(self, inventory):
+        return [txid for txid in inventory["txs"] if txid not in self.mempool]
+
+    def pull_in_background(self, peer, inventory):
+        try:
+            self.pull_from_peer(peer, inventory)
+        except Exception as e:
+            print("Error pulling from peer {}: {}".format(peer, e))
+
+    def pull_from_peer(self, peer, inventory):
+        # Fetch only the blocks and txs advertised by the peer that we lack.
+        #   Errors are left to the caller, so that the initial sync can retry
+        with self.chain_lock:
+            if peer in self.pulling:
+                return
+            self.pulling.add(peer)
+        try:
+            with self.chain_lock:
+                behind = self.is_behind(inventory)
+                missing = self.missing_txs(inventory)
+                locator = self.chain.locator()
+            # Ask for the first batch of blocks and the txs together
+            requests = []
+            if behind:
+                requests.append(nw.blocks_request(locator, self.BLOCK_BATCH))
+            if missing:
+                requests.append(nw.txs_request(missing))
+            if not requests:
+                return
+            replies = nw.send_pipelined(peer, requests)
+            if behind:
+                self.fetch_blocks(peer, locator, replies[0])
+            if missing:
+                txs = [Tx.from_json(tx) for tx in replies[-1]]
+                with self.chain_lock:
+                    self.merge_txs(txs)
+        finally:
+            with self.chain_lock:
+                self.pulling.discard(peer)
+
+    def fetch_blocks(self, peer, locator, batch):
+        # Merge a batch of blocks and carry on from its last block while
+        #   the peer sends full batches
+        while True:
+            batch = [BlockStruct.from_json(b) for b in batch]
+            if batch:
+                # Apply each batch as it arrives, holding the lock only for
+                #   the merge, then continue from the last block received
+                with self.chain_lock:
+                    self.merge_blocks(batch)
+                locator = [batch[-1].hash()] + locator
+            if len(batch) < self.BLOCK_BATCH:
+                break
+            batch = nw.request_blocks(peer, locator, self.BLOCK_BATCH)
+
+    def merge_blocks(self, blocks):
+        # The chain keeps side branches and switches to whichever has the
+        # most work, so blocks on a fork can be added like any other
+        tip = self.chain.current_hash
+        for block in blocks:
+            self.add_block(block)
+        if self.chain.current_hash != tip:
+            self.keep_mining = False
+
     def handle_peer_data(self, data):
         if data:
             self.merge_history(data)
@@ -139,7 +409,8 @@ class Client:
 
     def merge_history(self, other):
         self.merge_peers(other["peers"])
-        self.merge_chain(BlockChain.from_json(other["chain"]))
+        blocks = [BlockStruct.from_json(b) for b in other["chain"]["blocks"].values()]
+        self.merge_blocks(sorted(blocks, key=lambda b: b.id))
         # Tx merge must happen after blockchain merge so that txs can be pruned
         self.merge_txs([Tx.from_json(tx) for tx in other["txs"]])
 
@@ -147,69 +418,199 @@ class Client:
         self.peers = list(set().union(self.peers, map(tuple, other_peers)) - set([self.address]))
 
     def merge_txs(self, other_txs):
-        # Merge transaction lists
-        current_txs = list(set().union(self.current_txs, other_txs))
-        # Prune spent and invalid transactions
-        self.current_txs = []
-        for tx in current_txs:
-            self.add_tx(tx)
-
-    def merge_chain(self, other_chain):
-        if self.chain is None:
-            self.chain = other_chain
+        # Txs already in the pool are kept as they are: block changes
+        #   prune the pool as they happen (see update_mempool)
+        for tx in other_txs:
+            if tx.txid() not in self.mempool:
+                self.add_tx(tx)
+
+    def update_mempool(self, old_tip):
+        # Bring the tx pool and block template in line with a new tip
+        fork = self.chain.fork_point(old_tip, self.chain.current_hash)
+        if fork == old_tip:
+            # The chain only grew: drop what the new blocks spent
+            for h in self.chain.hash_iter(self.chain.current_hash):
+                if h == fork:
+                    break
+                self.mempool.remove_for_block(self.chain.blocks[h])
         else:
-            # Lots of ways to optimize this
-            # Basically here we're just taking the longest of the two (valid) chains
-            if other_chain.length() > self.chain.length():
-                self.keep_mining = False
-                self.chain = other_chain
+            # A reorganization: the txs of the blocks that left the main chain
+            #   go back into the pool, and every tx is checked against the new chain
+            disconnected = []
+            for h in self.chain.hash_iter(old_tip):
+                if h == fork:
+                    break
+                disconnected += [tx for tx in self.chain.blocks[h].txs if not tx.is_coinbase()]
+            for tx in disconnected + self.mempool.clear():
+                self.add_tx(tx)
+        self.template.rebuild()
 
     def get_all_state(self):
         return {
             "peers": [self.address] + self.peers,
-            "txs": [tx.as_json() for tx in self.current_txs],
+            "txs": [tx.as_json() for tx in self.mempool],
             "chain": self.chain.as_json()
         }
 
     def add_tx(self, tx):
-        # Add transaction to list of candidates
+        # Add transaction to the pool of candidates
+        if tx.txid() in self.mempool:
+            return True
         try:
+            if tx.is_coinbase():
+                # Each miner adds its own coinbase to the end of the block
+                raise InvalidTransactionException("Coinbase outside of a block")
+            if self.mempool.conflicts(tx):
+                raise InvalidTransactionException("Spends an output already spent by a tx in the pool")
             self.chain.validate_tx(tx)
-            self.current_txs.append(tx)
-            return True
+            added = self.mempool.add(tx, self.chain.fee(tx))
+            if added and self.template.add(tx) and self.template_changed_at is None:
+                self.template_changed_at = time.time()
+            return added
         except InvalidTransactionException as e:
             print("Invalid transaction {}: {}".format(tx, e))
             return False
     
     def emit_txs(self):
         # Export transaction candidates with coinbase for block mining
-        return self.current_txs[:] + [Tx.coinbase(self.pubkey)]
+        self.template_changed_at = None
+        return self.template.txs() + [Tx.coinbase(self.pubkey)]
+
+    def template_due(self):
+        # Whether the miner should restart on a newer block template
+        changed = self.template_changed_at
+        return changed is not None and time.time() - changed >= self.TEMPLATE_DEBOUNCE
+
+    def keep_going(self):
+        return self.keep_mining and not self.template_due()
         
     def mine(self):
-        # Find a valid block based on candidates
+        # Find a valid block based on candidates. Returns None if the tip
+        #   changed, or new txs made it into the template, first
+        self.mining_since = time.time()
+        try:
+            return self.search_nonce()
+        finally:
+            self.mining_seconds += time.time() - self.mining_since
+            self.mining_since = None
+
+    def search_nonce(self):
         hash_max = self.calculate_difficulty()
         nonce = 0x0
         with self.chain_lock:
             txs = self.emit_txs()
             last = self.chain.last_block()
-        bs = BlockStruct(last.id + 1, hash_(last), txs, nonce)
-        while self.keep_mining:
-            h = hash_(bs)        
-            if h < hash_max:
-                return bs
-            bs.nonce += 1
+        bs = BlockStruct(last.id + 1, last.hash(), txs, nonce)
+        if self.miner is not None:
+            # merge_blocks clears keep_mining when the tip changes, which cancels the workers
+            nonce = self.miner.mine(bs, hash_max, self.keep_going)
+            if nonce is not None:
+                return bs.with_nonce(nonce)
+            return None
+        hasher = bs.nonce_hasher()
+        while self.keep_going():
+            for i in range(self.NONCE_BATCH):
+                if hasher(nonce) < hash_max:
+                    self.hashes += i + 1
+                    return bs.with_nonce(nonce)
+                nonce += 1
+            self.hashes += self.NONCE_BATCH
+        return None
             
     def calculate_difficulty(self):
         # TODO calculate difficulty
         return DIFFICULTY
     
     def add_block(self, blk):
-        return self.chain.add_block(blk)
+        tip = self.chain.current_hash
+        added = self.chain.add_block(blk)
+        if self.chain.current_hash != tip:
+            self.update_mempool(tip)
+            self.publish_snapshot()
+        return added
+
+    def publish_snapshot(self):
+        # Called with the chain lock held, whenever the tip changes
+        self.published = self.chain.snapshot()
+        return self.published
+
+    def snapshot(self):
+        snapshot = self.published
+        if snapshot is None:
+            with self.chain_lock:
+                snapshot = self.publish_snapshot()
+        return snapshot
 
     def inputs_for(self, pubkey):
-        return self.chain.valid_inputs_for(pubkey)
+        return self.snapshot().valid_inputs_for(pubkey)
+
+    def address_page(self, pubkey, offset, limit):
+        # The balance of pubkey and a page of its unspent outputs
+        snapshot = self.snapshot()
+        outputs = snapshot.outputs_for(pubkey)
+        page = itertools.islice(outputs.items(), offset, offset + min(limit, self.PAGE_LIMIT))
+        return {
+            "tip": snapshot.tip,
+            "balance": snapshot.holdings_for(pubkey),
+            "total": len(outputs),
+            "outputs": [(TxInput(*output_id), amount) for output_id, amount in page]
+        }
+
+    def history_page(self, pubkey, offset, limit):
+        # A page of the txs paying to or spending from pubkey, oldest
+        #   first. Needs the address index, and the chain lock
+        if self.chain.address_index is None:
+            return None
+        history = self.chain.address_index.history_for(pubkey)
+        page = history[offset:offset + min(limit, self.PAGE_LIMIT)]
+        return {
+            "tip": self.chain.current_hash,
+            "total": len(history),
+            "txs": [self.history_entry(h, i) for h, i in page]
+        }
+
+    def history_entry(self, block_hash, tx_index):
+        # With the fee and who it went to, which a wallet can't work out
+        #   from the tx alone
+        blk = self.chain.blocks[block_hash]
+        tx = blk.txs[tx_index]
+        return {
+            "block_hash": block_hash,
+            "height": self.chain.index[block_hash].height,
+            "tx_index": tx_index,
+            "tx": tx,
+            "fee": 0.0 if tx.is_coinbase() else self.chain.fee(tx),
+            "miner": blk.miner()
+        }
+
+    def stats(self):
+        # Everything in metrics.py, and the node's state as of now
+        snapshot = self.snapshot()
+        since = self.mining_since
+        seconds = self.mining_seconds + (time.time() - since if since is not None else 0.0)
+        hashes = self.miner.hashes.value if self.miner is not None else self.hashes
+        stats = metrics.stats()
+        stats.update({
+            "height": snapshot.height,
+            "tip": snapshot.tip,
+            "peers": len(self.peers),
+            "mining": {"hashes": hashes, "seconds": seconds, "hashrate": hashes / seconds if seconds else 0.0},
+            "mempool": {"txs": len(self.mempool), "bytes": self.mempool.size},
+            "signature_cache": verified.stats(),
+            "snapshot": self.snapshot_stats()
+        })
+        return stats
+
+    def snapshot_stats(self):
+        # None unless the node started from a UTXO snapshot
+        #   Read without the chain lock, like the rest of STATS
+        validation = self.snapshot_validation
+        base = self.chain.snapshot_base
+        if validation is None:
+            return {"base": base, "validated": False} if base is not None else None
+        return {"base": validation.snapshot.base.hash(), "validated": validation.valid, "progress": validation.fetcher.progress}
 
     def holdings_for(self, pubkey):
-        return self.chain.holdings().get(pubkey, 0.0)
+        return self.snapshot().holdings_for(pubkey)
 
         
@@ -1,3 +1,5 @@
+import functools
+import math
 import random
 
 
@@ -23,26 +25,37 @@ def mod_mult_inv(a, m):
 def lcm(a, b):
     return a * (b // gcd(a, b))
 
+# Primes below this make up the table e is picked from
+PRIME_LIMIT = 100000
+# Candidate primes are first checked for factors below this, which rules
+#   out most composites for the price of one gcd
+TRIAL_LIMIT = 2000
+# Candidates each worker tries before checking in, when searching in parallel
+SEARCH_BATCH = 64
+
 def sieve(n):
-    primes = [2]
-    candidates = list(range(3, n, 2))
-    while True:
-        p = candidates.pop(0)
-        if p > (n ** (1/2)):
-            primes.append(p)
-            break
-        candidates = [c for c in candidates if c % p != 0]
-        primes.append(p)
-    return primes + candidates
-        
-PRIMES = sieve(100000)
+    # The primes below n
+    is_prime = bytearray([1]) * n
+    is_prime[:2] = bytes(min(n, 2))
+    for p in range(2, math.isqrt(max(n - 1, 0)) + 1):
+        if is_prime[p]:
+            is_prime[p * p::p] = bytes(len(range(p * p, n, p)))
+    return [p for p in range(n) if is_prime[p]]
+
+@functools.lru_cache(maxsize=None)
+def prime_table():
+    # Built on first use rather than on import, which every CLI command pays
+    return tuple(sieve(PRIME_LIMIT))
+
+@functools.lru_cache(maxsize=None)
+def small_primes_product():
+    return math.prod(p for p in prime_table() if p < TRIAL_LIMIT)
 
 def find_coprime(t):
-    random.shuffle(PRIMES)
-    for p in PRIMES:
-        if t % p != 0:
-            return p
-    raise ValueError("No p!")
+    coprime = [p for p in prime_table() if t % p != 0]
+    if not coprime:
+        raise ValueError("No p!")
+    return random.choice(coprime)
 
 def power_of_two_div(n):
     c = 0
@@ -70,31 +83,79 @@ def likely_prime(w, iterations=64):
                 return False
             if z == w - 1:
                 cont = True
+                break
         if not cont:
             return False
     return True
 
+def random_candidate(length):
+    # A random odd number of exactly `length` bits
+    return random.getrandbits(length) | (1 << (length - 1)) | 1
+
+def passes_trial_division(candidate):
+    if candidate < TRIAL_LIMIT:
+        return candidate in prime_table()
+    return math.gcd(candidate, small_primes_product()) == 1
+
 def generate_prime(length):
     while True:
-        candidate = random.getrandbits(length)
-        if candidate.bit_length() == length:
-            if likely_prime(candidate):
-                return candidate
-
-def gen_keys(length=512):
-    p = generate_prime(length)
-    q = generate_prime(length)
+        candidate = random_candidate(length)
+        if passes_trial_division(candidate) and likely_prime(candidate):
+            return candidate
+
+def search_prime(length, tries):
+    # A prime from up to `tries` candidates, or None. Run in worker
+    #   processes, which would otherwise inherit the parent's random state
+    random.seed()
+    for i in range(tries):
+        candidate = random_candidate(length)
+        if passes_trial_division(candidate) and likely_prime(candidate):
+            return candidate
+    return None
+
+def generate_primes(length, count, workers=0):
+    # `count` distinct primes, searched for on `workers` processes, or in
+    #   this one if workers is 0 or 1
+    primes = set()
+    if workers <= 1:
+        while len(primes) < count:
+            primes.add(generate_prime(length))
+        return list(primes)
+    # Imported here, as it takes longer than the rest of this module
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    with ProcessPoolExecutor(workers) as pool:
+        searches = {pool.submit(search_prime, length, SEARCH_BATCH) for i in range(workers)}
+        while len(primes) < count:
+            done, searches = wait(searches, return_when=FIRST_COMPLETED)
+            primes.update(search.result() for search in done if search.result() is not None)
+            if len(primes) < count:
+                searches.update(pool.submit(search_prime, length, SEARCH_BATCH) for search in done)
+        for search in searches:
+            search.cancel()
+    return list(primes)[:count]
+
+def gen_keys(length=512, workers=0):
+    p, q = generate_primes(length, 2, workers)
     n = p * q
     totient = lcm(p-1, q-1)
     e = find_coprime(totient)
     d = mod_mult_inv(e, totient)
-    return {"pubkey": (n, e), "privkey": (n, d)}
+    # p, q and the CRT exponents and coefficient let encrypt work mod p and
+    #   q instead of mod n. Keys with just (n, d) still work, more slowly
+    return {"pubkey": (n, e), "privkey": (n, d, p, q, d % (p - 1), d % (q - 1), mod_mult_inv(q, p))}
 
 def encrypt(m, privkey):
-    n, d = privkey
+    n, d = privkey[:2]
     if m < 0 or m >= n:
         raise ValueError("Attempting to encrypt a message larger than N")
-    return pow(m, d, n)
+    if len(privkey) == 2:
+        return pow(m, d, n)
+    # Chinese remainder theorem: the same result from two exponentiations
+    #   with half-size numbers
+    n, d, p, q, dp, dq, qinv = privkey
+    mp = pow(m, dp, p)
+    mq = pow(m, dq, q)
+    return mq + q * (qinv * (mp - mq) % p)
     
 def decrypt(c, pubkey):
     n, e = pubkey
@@ -0,0 +1,176 @@
+import struct
+
+# Binary encoding of txs, blocks and messages, used for hashing, for the
+#   block store and (optionally) on the wire. Every top-level encoding
+#   starts with this, so the format can change without ambiguity
+VERSION = 1
+
+HASH_SIZE = 32
+DOUBLE = struct.Struct(">d")
+
+
+class DecodeError(Exception):
+    pass
+
+
+def varint_bytes(value):
+    # Unsigned LEB128: 7 bits per byte, high bit set on all but the last
+    if value < 0:
+        raise ValueError("varint must not be negative: {}".format(value))
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+class Writer:
+    def __init__(self):
+        self.buf = bytearray()
+
+    def getvalue(self):
+        return bytes(self.buf)
+
+    def raw(self, data):
+        self.buf += data
+
+    def byte(self, value):
+        self.buf.append(value)
+
+    def varint(self, value):
+        self.buf += varint_bytes(value)
+
+    def signed(self, value):
+        # Zigzag, so that small negative numbers stay small
+        self.varint(value * 2 if value >= 0 else -value * 2 - 1)
+
+    def bigint(self, value):
+        # Length-prefixed big-endian bytes, for RSA-sized numbers
+        if value < 0:
+            raise ValueError("bigint must not be negative: {}".format(value))
+        self.bytes_(value.to_bytes((value.bit_length() + 7) // 8, 'big'))
+
+    def hash(self, value):
+        self.buf += value.to_bytes(HASH_SIZE, 'big')
+
+    def double(self, value):
+        self.buf += DOUBLE.pack(value)
+
+    def bytes_(self, data):
+        self.varint(len(data))
+        self.buf += data
+
+    def str_(self, value):
+        self.bytes_(value.encode('utf-8'))
+
+    def optional(self, write, value):
+        # A flag byte, then the value unless it is None
+        if value is None:
+            self.byte(0)
+        else:
+            self.byte(1)
+            write(value)
+
+
+class Reader:
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.pos = 0
+
+    def at_end(self):
+        return self.pos == len(self.data)
+
+    def raw(self, n):
+        end = self.pos + n
+        if end > len(self.data):
+            raise DecodeError("Unexpected end of data")
+        data = self.data[self.pos:end]
+        self.pos = end
+        return data
+
+    def byte(self):
+        try:
+            value = self.data[self.pos]
+        except IndexError:
+            raise DecodeError("Unexpected end of data")
+        self.pos += 1
+        return value
+
+    def varint(self):
+        data, pos = self.data, self.pos
+        value = shift = 0
+        try:
+            while True:
+                b = data[pos]
+                pos += 1
+                value |= (b & 0x7f) << shift
+                if b < 0x80:
+                    break
+                shift += 7
+        except IndexError:
+            raise DecodeError("Unexpected end of data")
+        self.pos = pos
+        return value
+
+    def signed(self):
+        value = self.varint()
+        return value // 2 if not value & 1 else -(value + 1) // 2
+
+    def bigint(self):
+        return int.from_bytes(self.bytes_(), 'big')
+
+    def hash(self):
+        return int.from_bytes(self.raw(HASH_SIZE), 'big')
+
+    def double(self):
+        return DOUBLE.unpack(self.raw(DOUBLE.size))[0]
+
+    def bytes_(self):
+        return self.raw(self.varint())
+
+    def str_(self):
+        return self.bytes_().decode('utf-8')
+
+    def optional(self, read):
+        flag = self.byte()
+        if flag == 0:
+            return None
+        if flag != 1:
+            raise DecodeError("Invalid optional flag {}".format(flag))
+        return read()
+
+    def version(self):
+        version = self.byte()
+        if version != VERSION:
+            raise DecodeError("Unsupported encoding version {}".format(version))
+
+
+def write_pubkey(w, pubkey):
+    n, e = pubkey
+    w.bigint(n)
+    w.varint(e)
+
+def read_pubkey(r):
+    return (r.bigint(), r.varint())
+
+# Output addresses are public keys, but nothing else about a tx depends on
+#   that, so other kinds of address (plain names, in tests) are kept apart
+PUBKEY_ADDRESS = 1
+NAME_ADDRESS = 2
+
+def write_address(w, addr):
+    if isinstance(addr, str):
+        w.byte(NAME_ADDRESS)
+        w.str_(addr)
+    else:
+        w.byte(PUBKEY_ADDRESS)
+        write_pubkey(w, addr)
+
+def read_address(r):
+    kind = r.byte()
+    if kind == PUBKEY_ADDRESS:
+        return read_pubkey(r)
+    if kind == NAME_ADDRESS:
+        return r.str_()
+    raise DecodeError("Invalid address kind {}".format(kind))
@@ -6,5 +6,20 @@ from .serialization import serialize
 def hash_(obj):
     # Keep it simple: return (as integer) the sha256 hash of the 
     #   serialization of the object
-    ser = serialize(obj).encode('utf-8')
-    return int.from_bytes(hashlib.sha256(ser).digest(), 'big')
+    return hash_serialization(serialize(obj))
+
+def hash_serialization(ser):
+    return hash_bytes(ser.encode('utf-8'))
+
+def hash_bytes(data):
+    return int.from_bytes(hashlib.sha256(data).digest(), 'big')
+
+def prefix_hasher(prefix, encode_suffix):
+    # Returns f(value) == hash_bytes(prefix + encode_suffix(value)). The
+    #   prefix is fed into sha256 once; each call only copies that state
+    state = hashlib.sha256(prefix)
+    def hasher(value):
+        h = state.copy()
+        h.update(encode_suffix(value))
+        return int.from_bytes(h.digest(), 'big')
+    return hasher
@@ -0,0 +1,113 @@
+import heapq
+import itertools
+from collections import OrderedDict
+
+from .tx import InvalidTransactionException
+
+
+class Mempool:
+    # Unconfirmed txs, indexed by txid and by the outputs they spend, so
+    #   that a tx conflicting with one already in the pool is found with a
+    #   lookup. Once the encoded txs take up more than max_bytes, those
+    #   paying the lowest fee per byte are evicted
+    MAX_BYTES = 5 * 1024 * 1024
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        # txid -> tx, in arrival order
+        self.txs = OrderedDict()
+        self.fees = {}
+        # (block_hash, tx_index, out_index) -> txid of the pool tx spending it
+        self.spends = {}
+        self.size = 0
+        # Eviction candidates, lowest fee rate first: (fee rate, seq, txid).
+        #   Entries for txs since removed are skipped when they come up
+        self.by_rate = []
+        self.seqs = {}
+        self.counter = itertools.count()
+
+    def __contains__(self, txid):
+        return txid in self.txs
+
+    def __len__(self):
+        return len(self.txs)
+
+    def __iter__(self):
+        return iter(list(self.txs.values()))
+
+    def get(self, txid):
+        return self.txs.get(txid)
+
+    def txids(self):
+        return list(self.txs)
+
+    def fee(self, txid):
+        return self.fees[txid]
+
+    def conflicts(self, tx):
+        # Pool txs spending any of the same outputs as tx
+        return set(self.spends[inp.outpoint()] for inp in tx.inputs if inp.outpoint() in self.spends)
+
+    def add(self, tx, fee):
+        # tx must already be valid against the chain. Returns False if it
+        #   was evicted straight away for paying too little
+        if self.conflicts(tx):
+            raise InvalidTransactionException("Spends an output already spent by a tx in the pool")
+        txid = tx.txid()
+        if txid in self.txs:
+            return True
+        self.txs[txid] = tx
+        self.fees[txid] = fee
+        for inp in tx.inputs:
+            self.spends[inp.outpoint()] = txid
+        self.size += tx.size()
+        seq = next(self.counter)
+        self.seqs[txid] = seq
+        heapq.heappush(self.by_rate, (fee / tx.size(), seq, txid))
+        self.evict()
+        return txid in self.txs
+
+    def remove(self, txid):
+        tx = self.txs.pop(txid, None)
+        if tx is None:
+            return None
+        del self.fees[txid]
+        del self.seqs[txid]
+        for inp in tx.inputs:
+            del self.spends[inp.outpoint()]
+        self.size -= tx.size()
+        if len(self.by_rate) > 2 * len(self.txs) + 64:
+            self.by_rate = [entry for entry in self.by_rate if self.seqs.get(entry[2]) == entry[1]]
+            heapq.heapify(self.by_rate)
+        return tx
+
+    def evict(self):
+        while self.size > self.max_bytes and self.by_rate:
+            rate, seq, txid = heapq.heappop(self.by_rate)
+            if self.seqs.get(txid) == seq:
+                self.remove(txid)
+
+    def remove_for_block(self, blk):
+        # A newly connected block only affects the pool txs it includes and
+        #   those spending the same outputs; everything else stays valid
+        for tx in blk.txs:
+            self.remove(tx.txid())
+            for inp in tx.inputs:
+                txid = self.spends.get(inp.outpoint())
+                if txid is not None:
+                    self.remove(txid)
+
+    def clear(self):
+        # Empty the pool, returning what was in it
+        txs = list(self.txs.values())
+        self.txs.clear()
+        self.fees.clear()
+        self.spends.clear()
+        self.seqs.clear()
+        self.by_rate = []
+        self.size = 0
+        return txs
+
+    def by_fee_rate(self):
+        # Candidates for the next block, best paying first
+        return sorted(self.txs.values(), key=lambda tx: self.fees[tx.txid()] / tx.size(), reverse=True)
@@ -0,0 +1,56 @@
+from .hashing import hash_bytes
+
+# Root of a tree with no leaves (e.g. the genesis block)
+EMPTY_ROOT = 0
+# Leaves and inner nodes are hashed with different prefixes, so an inner
+#   node can never be passed off as a leaf (or the other way round)
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+
+def hash_leaf(leaf):
+    return hash_bytes(LEAF_PREFIX + leaf.to_bytes(32, 'big'))
+
+def hash_pair(left, right):
+    return hash_bytes(NODE_PREFIX + left.to_bytes(32, 'big') + right.to_bytes(32, 'big'))
+
+def next_level(level):
+    # The last node of an odd level is carried up as is rather than paired
+    #   with itself, so [a, b, c] and [a, b, c, c] have different roots
+    paired = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        paired.append(level[-1])
+    return paired
+
+def merkle_root(leaves):
+    level = [hash_leaf(leaf) for leaf in leaves]
+    if not level:
+        return EMPTY_ROOT
+    while len(level) > 1:
+        level = next_level(level)
+    return level[0]
+
+def merkle_proof(leaves, index):
+    # Sibling hashes from leaf to root, each paired with whether the
+    #   sibling sits on the right
+    level = [hash_leaf(leaf) for leaf in leaves]
+    if not 0 <= index < len(level):
+        raise IndexError("Leaf index out of range")
+    proof = []
+    while len(level) > 1:
+        sibling = index ^ 1
+        # A carried up node has no sibling on this level
+        if sibling < len(level):
+            proof.append((level[sibling], sibling > index))
+        level = next_level(level)
+        index //= 2
+    return proof
+
+def verify_proof(leaf, proof, root):
+    h = hash_leaf(leaf)
+    for sibling, on_right in proof:
+        if on_right:
+            h = hash_pair(h, sibling)
+        else:
+            h = hash_pair(sibling, h)
+    return h == root
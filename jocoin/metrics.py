@@ -0,0 +1,136 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+# Bucket upper bounds for latencies, in seconds, and for sizes, in bytes
+LATENCY_BOUNDS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+SIZE_BOUNDS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    # Counts of values falling in fixed buckets, from which percentiles can
+    #   be estimated without keeping the values themselves
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One more than there are bounds, for values above the last
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        # The upper bound of the bucket holding the p-th percentile value
+        rank = p * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def stats(self):
+        buckets = {"<={}".format(bound): n for bound, n in zip(self.bounds, self.buckets)}
+        buckets["more"] = self.buckets[-1]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+            "buckets": buckets
+        }
+
+
+class Metrics:
+    # Counters and histograms for a running node, shared by all its threads
+    #   and read through the STATS message. Names are dotted, e.g.
+    #   "message.GOSSIP" for the seconds spent handling GOSSIP messages
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = defaultdict(int)
+        self.histograms = {}
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def observe(self, name, value, bounds=LATENCY_BOUNDS):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bounds)
+            histogram.observe(value)
+
+    def observe_size(self, name, size):
+        self.observe(name, size, SIZE_BOUNDS)
+
+    def timed(self, name):
+        return Timer(self, name)
+
+    def clear(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters.clear()
+            self.histograms.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "uptime": time.time() - self.started,
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.stats() for name, histogram in self.histograms.items()}
+            }
+
+
+class Timer:
+    # with metrics.timed(name): records the seconds the block took
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class TimedLock:
+    # A lock that records how often acquiring it had to wait, and for how
+    #   long. Uncontended acquisitions cost one extra non-blocking attempt
+    def __init__(self, lock, metrics, name):
+        self.lock = lock
+        self.metrics = metrics
+        self.name = name
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(blocking=False):
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self.lock.acquire(timeout=timeout)
+        self.metrics.observe(self.name + ".wait", time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# Shared by the listener, the client and the chain lock
+metrics = Metrics()
@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import queue
+
+
+def search(block, hash_max, start, stride, job_id, current_job, hashes, batch):
+    # Try nonces start, start + stride, ... until one hashes below hash_max
+    #   or the job is superseded
+    hasher = block.nonce_hasher()
+    nonce = start
+    while current_job.value == job_id:
+        for i in range(batch):
+            if hasher(nonce) < hash_max:
+                return nonce
+            nonce += stride
+        with hashes.get_lock():
+            hashes.value += batch
+    return None
+
+
+def worker(jobs, results, current_job, hashes, batch):
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id, block, hash_max, start, stride = job
+        nonce = search(block, hash_max, start, stride, job_id, current_job, hashes, batch)
+        if nonce is not None:
+            results.put((job_id, nonce))
+
+
+class MiningPool:
+    # Nonces each worker tries between checks for cancellation
+    BATCH = 2000
+    # Seconds between checks of the caller's keep-going condition
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.results = multiprocessing.Queue()
+        self.jobs = [multiprocessing.Queue() for i in range(self.workers)]
+        # Workers abandon their job as soon as this no longer matches its id
+        self.current_job = multiprocessing.Value('q', 0)
+        # Running total of nonces tried, for hashrate reporting
+        self.hashes = multiprocessing.Value('Q', 0)
+        self.processes = []
+
+    def start(self):
+        for jobs in self.jobs:
+            p = multiprocessing.Process(target=worker, args=(jobs, self.results, self.current_job, self.hashes, self.BATCH), daemon=True)
+            p.start()
+            self.processes.append(p)
+
+    def stop(self):
+        self.cancel()
+        for jobs in self.jobs:
+            jobs.put(None)
+        for p in self.processes:
+            p.join()
+        self.processes = []
+
+    def cancel(self):
+        with self.current_job.get_lock():
+            self.current_job.value += 1
+
+    def mine(self, block, hash_max, keep_going):
+        # Partition the nonce space between the workers: worker i tries
+        #   i, i + workers, i + 2 * workers, ...
+        # Returns the winning nonce, or None if keep_going() turned False first
+        with self.current_job.get_lock():
+            self.current_job.value += 1
+            job_id = self.current_job.value
+        for i, jobs in enumerate(self.jobs):
+            jobs.put((job_id, block, hash_max, i, self.workers))
+        try:
+            while keep_going():
+                try:
+                    found_job, nonce = self.results.get(timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                # Results of cancelled jobs may still be in the queue
+                if found_job == job_id:
+                    return nonce
+            return None
+        finally:
+            self.cancel()
@@ -1,14 +1,51 @@
+import asyncio
 import socket
-import socketserver
 import enum
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from .serialization import serialize, deserialize
+from .wire import encode_message, decode_message
 from .tx import Tx
+from .metrics import metrics
 
 
 GOSSIP = "GOSSIP"
 BALANCE = "BALANCE"
 INPUTS = "INPUTS"
 TRANSFER = "TRANSFER"
+INV = "INV"
+GETBLOCKS = "GETBLOCKS"
+GETTXS = "GETTXS"
+GETHEADERS = "GETHEADERS"
+GETDATA = "GETDATA"
+ADDRESS = "ADDRESS"
+HISTORY = "HISTORY"
+STATS = "STATS"
+MESSAGES = (GOSSIP, BALANCE, INPUTS, TRANSFER, INV, GETBLOCKS, GETTXS, GETHEADERS, GETDATA, ADDRESS, HISTORY, STATS)
+
+# A message is a line naming its type, then its data. The data goes in a
+#   length-prefixed frame, as JSON if the type line ends in " JSON" or as
+#   a binary message (see wire.py) if it ends in " BIN", and the reply
+#   comes back in a frame the same way. Framed messages can follow one
+#   another on a connection, so connections are kept open and reused.
+#   Older nodes send a bare line of JSON instead, which is answered with a
+#   line of JSON before the connection is closed. BINARY_WIRE chooses
+#   between binary and JSON frames for what we send
+JSON_SUFFIX = " JSON"
+BINARY_SUFFIX = " BIN"
+BINARY_WIRE = False
+FRAME_LENGTH = struct.Struct(">I")
+
+# Seconds allowed to connect to a peer, and for each read or write on a
+#   connection, before giving up on it
+CONNECT_TIMEOUT = 5
+IO_TIMEOUT = 30
+# Seconds an open connection may sit unused before the node closes it
+IDLE_TIMEOUT = 60
+# Longest message line we accept: GOSSIP carries the whole chain
+MAX_LINE = 64 * 1024 * 1024
 
 def format_object_for_transmission(o):
     return format_string_for_transmission(serialize(o))
@@ -16,27 +53,152 @@ def format_object_for_transmission(o):
 def format_string_for_transmission(s):
     return bytes(s + "\n", "utf-8")
 
-class RAIISocket:
+def encode_json(o):
+    return bytes(serialize(o), "utf-8")
+
+CODECS = {
+    JSON_SUFFIX: (encode_json, deserialize),
+    BINARY_SUFFIX: (encode_message, decode_message),
+}
+
+def wire_suffix():
+    return BINARY_SUFFIX if BINARY_WIRE else JSON_SUFFIX
+
+def split_message_type(line):
+    # The message type and the suffix saying how its data is framed, or
+    #   None for a bare line of JSON
+    for suffix in CODECS:
+        if line.endswith(suffix):
+            return line[:-len(suffix)], suffix
+    return line, None
+
+def message_name(message):
+    # For metrics: message types peers can make up are lumped together
+    return message if message in MESSAGES else "unknown"
+
+def record_sizes(message, request, reply):
+    name = message_name(message)
+    metrics.observe_size("request_bytes." + name, len(request))
+    metrics.observe_size("reply_bytes." + name, len(reply))
+
+def format_frame(data):
+    return FRAME_LENGTH.pack(len(data)) + data
+
+def format_request(message_type, raw_data, suffix):
+    encode, decode = CODECS[suffix]
+    return format_string_for_transmission(message_type + suffix) + format_frame(encode(raw_data))
+
+
+class PeerConnection:
     def __init__(self, peer):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.peer = peer
+        self.sock = socket.create_connection(peer, CONNECT_TIMEOUT)
+        self.sock.settimeout(IO_TIMEOUT)
+        self.last_used = time.monotonic()
 
-    def __enter__(self):
-        self.sock.connect(self.peer)
-        return self.sock
+    def pipeline(self, requests):
+        # Send all the (type, data) requests before reading any reply: the
+        #   node answers them in order. Replies aren't read until every
+        #   request is sent, so this is for small requests
+        suffix = wire_suffix()
+        self.sock.sendall(b"".join(format_request(message_type, raw_data, suffix) for message_type, raw_data in requests))
+        return [self.receive(suffix) for request in requests]
 
-    def __exit__(self, type, value, traceback):
+    def receive(self, suffix):
+        length = FRAME_LENGTH.unpack(recv_exactly(self.sock, FRAME_LENGTH.size))[0]
+        encode, decode = CODECS[suffix]
+        return decode(recv_exactly(self.sock, length))
+
+    def close(self):
         self.sock.close()
 
+
+class ConnectionPool:
+    # Open connections, by peer, waiting to be reused. A connection is only
+    #   used by one thread at a time
+    MAX_IDLE = IDLE_TIMEOUT / 2
+
+    def __init__(self):
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, peer):
+        # A pooled connection if there is a fresh one, else None
+        with self.lock:
+            conns = self.idle.get(peer, [])
+            while conns:
+                conn = conns.pop()
+                if time.monotonic() - conn.last_used < self.MAX_IDLE:
+                    return conn
+                conn.close()
+        return None
+
+    def release(self, conn):
+        conn.last_used = time.monotonic()
+        with self.lock:
+            self.idle.setdefault(conn.peer, []).append(conn)
+
+    def request(self, peer, requests):
+        conn = self.acquire(peer)
+        if conn is not None:
+            try:
+                replies = conn.pipeline(requests)
+                self.release(conn)
+                return replies
+            except OSError:
+                # The node may have closed it while it sat in the pool. All
+                #   messages are safe to repeat, so try again on a new one
+                conn.close()
+        conn = PeerConnection(peer)
+        try:
+            replies = conn.pipeline(requests)
+        except:
+            conn.close()
+            raise
+        self.release(conn)
+        return replies
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle.clear()
+
+pool = ConnectionPool()
+
 def send_message(peer, message_type, raw_data):
-    msg_line = format_string_for_transmission(message_type)
-    data_line = format_object_for_transmission(raw_data)
-    with RAIISocket(peer) as sock:
-        sock.sendall(msg_line + data_line)
-        serialized_received = readline(sock)
-    received = deserialize(serialized_received)
-    return received
-    
+    return pool.request(peer, [(message_type, raw_data)])[0]
+
+def send_pipelined(peer, requests):
+    # Replies to a list of (type, data) requests, sent together
+    return pool.request(peer, requests)
+
+async def send_message_async(peer, message_type, raw_data):
+    # send_message for use on an event loop, so that many peers can be
+    #   talked to at once
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(*peer), CONNECT_TIMEOUT)
+    try:
+        suffix = wire_suffix()
+        writer.write(format_request(message_type, raw_data, suffix))
+        await asyncio.wait_for(writer.drain(), IO_TIMEOUT)
+        header = await asyncio.wait_for(reader.readexactly(FRAME_LENGTH.size), IO_TIMEOUT)
+        received = await asyncio.wait_for(reader.readexactly(FRAME_LENGTH.unpack(header)[0]), IO_TIMEOUT)
+        encode, decode = CODECS[suffix]
+        return decode(received)
+    finally:
+        writer.close()
+
+def send_to_all(peers, message_type, raw_data):
+    # Send the same message to every peer concurrently. Returns a list of
+    #   (peer, response) pairs, with the exception raised in place of the
+    #   response for peers that couldn't be reached
+    async def send_all():
+        return await asyncio.gather(*[send_message_async(peer, message_type, raw_data) for peer in peers], return_exceptions=True)
+    if not peers:
+        return []
+    return list(zip(peers, asyncio.run(send_all())))
+
 def request_transfer(peer, tx):
     return send_message(peer, TRANSFER, tx)
 
@@ -49,36 +211,146 @@ def request_inputs(peer, public_key):
 def gossip_with(peer, client_state):
     return send_message(peer, GOSSIP, client_state)
 
-def readline(sock, bufsize=4096):
-    buf = ''
-    data = True
-    while data:
-        data = str(sock.recv(bufsize), "utf-8")
-        buf += data
-        if '\n' in buf:
-            return buf.splitlines()[0]
+def exchange_inventory(peer, inventory):
+    return send_message(peer, INV, inventory)
+
+def exchange_inventories(peers, inventory):
+    return send_to_all(peers, INV, inventory)
+
+def blocks_request(locator, limit):
+    return (GETBLOCKS, {"locator": locator, "limit": limit})
 
+def txs_request(txids):
+    return (GETTXS, txids)
 
-class JoCoinServer(socketserver.StreamRequestHandler):
-    def handle(self):
-        message = self.get_message()
-        data = self.get_message_data()
-        response = self.server.client.dispatch_incoming_message(message, data)
-        self.wfile.write(format_object_for_transmission(response))
+def request_blocks(peer, locator, limit):
+    return send_message(peer, *blocks_request(locator, limit))
 
-    def get_message(self):
-        return str(self.rfile.readline().strip(), "utf-8")
+def request_txs(peer, txids):
+    return send_message(peer, *txs_request(txids))
 
-    def get_message_data(self):
-        req_line = self.rfile.readline()
-        return deserialize(req_line.strip())
+def request_address(peer, public_key, offset=0, limit=100):
+    return send_message(peer, ADDRESS, {"address": public_key, "offset": offset, "limit": limit})
+
+def request_history(peer, public_key, offset=0, limit=100):
+    return send_message(peer, HISTORY, {"address": public_key, "offset": offset, "limit": limit})
+
+def request_stats(peer):
+    return send_message(peer, STATS, None)
+
+def request_headers(peer, locator, limit):
+    return send_message(peer, GETHEADERS, {"locator": locator, "limit": limit})
+
+def request_block_data(peer, hashes):
+    return send_message(peer, GETDATA, hashes)
+
+def recv_exactly(sock, n):
+    # Read into a buffer of the known size, rather than growing one
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        read = sock.recv_into(view[pos:])
+        if not read:
+            raise ConnectionError("Connection closed mid-message")
+        pos += read
+    return bytes(buf)
+
+def readline(sock, bufsize=4096):
+    # Only each new chunk is searched for the end of the line
+    chunks = []
+    while True:
+        data = sock.recv(bufsize)
+        if not data:
+            raise ConnectionError("Connection closed mid-message")
+        end = data.find(b"\n")
+        if end >= 0:
+            chunks.append(data[:end])
+            return str(b"".join(chunks), "utf-8")
+        chunks.append(data)
 
 
 class JoCoinListener():
+    # Serves each connection as a task on an event loop of its own, so that
+    #   a slow peer only holds up itself. Handling a message takes the chain
+    #   lock and may mean validating blocks, so it runs on a pool of threads
+    HANDLER_THREADS = 8
+    # Connections waiting to be accepted, for bursts of clients
+    BACKLOG = 1024
+
     def __init__(self, client, listen_addr):
-        self.server = socketserver.TCPServer(listen_addr, JoCoinServer)
-        self.server.client = client
+        self.client = client
+        self.loop = asyncio.new_event_loop()
+        self.handlers = ThreadPoolExecutor(self.HANDLER_THREADS)
+        # Open connections: writer -> the task serving it
+        self.connections = {}
+        # Bind now, as TCPServer did, so that the address is known before start
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, *listen_addr, limit=MAX_LINE, backlog=self.BACKLOG))
+        self.address = self.server.sockets[0].getsockname()[:2]
 
     def start(self):
         print("Starting JoCoin server")
-        self.server.serve_forever()
+        self.loop.run_forever()
+
+    def stop(self):
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        else:
+            self.loop.run_until_complete(self.close())
+        self.handlers.shutdown(wait=False)
+
+    async def close(self):
+        self.server.close()
+        # Drop connections still open, so none outlive the handler threads
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    break
+                message, suffix = split_message_type(str(line.strip(), "utf-8"))
+                if suffix is None:
+                    data_line = await self.timed(reader.readline())
+                    writer.write(await self.dispatch(self.dispatch_line, message, data_line))
+                    await self.timed(writer.drain())
+                    break
+                header = await self.timed(reader.readexactly(FRAME_LENGTH.size))
+                payload = await self.timed(reader.readexactly(FRAME_LENGTH.unpack(header)[0]))
+                writer.write(await self.dispatch(self.dispatch_frame, message, payload, suffix))
+                await self.timed(writer.drain())
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError) as e:
+            print("Dropping connection: {!r}".format(e))
+        except Exception as e:
+            print("Error handling message: {!r}".format(e))
+        finally:
+            writer.close()
+            del self.connections[writer]
+
+    def timed(self, awaitable):
+        return asyncio.wait_for(awaitable, IO_TIMEOUT)
+
+    def dispatch(self, handler, *args):
+        return self.loop.run_in_executor(self.handlers, handler, *args)
+
+    def dispatch_line(self, message, data_line):
+        response = self.client.dispatch_incoming_message(message, deserialize(data_line.strip()))
+        reply = format_object_for_transmission(response)
+        record_sizes(message, data_line, reply)
+        return reply
+
+    def dispatch_frame(self, message, payload, suffix):
+        encode, decode = CODECS[suffix]
+        response = self.client.dispatch_incoming_message(message, decode(payload))
+        reply = format_frame(encode(response))
+        record_sizes(message, payload, reply)
+        return reply
@@ -1,3 +1,6 @@
+import threading
+from collections import OrderedDict
+
 from .hashing import hash_
 from .crypto import encrypt, decrypt
 
@@ -10,3 +13,43 @@ def is_valid_signature(m, signature, pubkey):
     h = hash_(m)
     return decrypt(signature, pubkey) == h
 
+
+class SignatureCache:
+    # Most recently used ids of txs whose signatures have been checked.
+    #   A txid covers the signature, the signer and what was signed, so a
+    #   hit means the very same tx was verified before
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, txid):
+        with self.lock:
+            if txid in self.entries:
+                self.entries.move_to_end(txid)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, txid):
+        with self.lock:
+            self.entries[txid] = True
+            self.entries.move_to_end(txid)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+# Shared by the tx pool and block validation
+SIGNATURE_CACHE_SIZE = 50000
+verified = SignatureCache(SIGNATURE_CACHE_SIZE)
@@ -0,0 +1,25 @@
+from .tx import TxInput
+
+
+class ChainSnapshot:
+    # The chain state as of one tip, published after every tip change so
+    #   that balance and input queries can be answered without the chain
+    #   lock. Never changes once made
+    def __init__(self, tip, height, by_addr, balances=None):
+        self.tip = tip
+        self.height = height
+        # out_addr -> {output_id: amount}, from UtxoSet.snapshot
+        self.by_addr = by_addr
+        # out_addr -> balance, if the chain keeps an AddressIndex
+        self.balances = balances
+
+    def outputs_for(self, out_addr):
+        return self.by_addr.get(out_addr, {})
+
+    def holdings_for(self, pubkey):
+        if self.balances is not None:
+            return self.balances.get(pubkey, 0.0)
+        return sum(self.outputs_for(pubkey).values())
+
+    def valid_inputs_for(self, pubkey):
+        return [(TxInput(*output_id), amount) for output_id, amount in self.outputs_for(pubkey).items()]
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import struct
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from .blockstruct import BlockStruct
+from .serialization import serialize, deserialize
+
+
+class CorruptStoreException(Exception):
+    pass
+
+
+def atomic_write(path, data):
+    # Write to a temporary file and rename it over the old one, so the file
+    #   is either entirely old or entirely new after a crash
+    tmp = path + ".tmp"
+    with open(tmp, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class BlockStore(MutableMapping):
+    # Blocks live in an append-only file of records
+    #   [4-byte length][32-byte sha256 of payload][binary encoded block]
+    # and are located through an append-only index file of fixed-size records
+    #   [32-byte block hash][32-byte last hash][8-byte offset]
+    # which is read into memory on open. Blocks are only read from disk on
+    # demand. The chain tip and unspent outputs are saved alongside.
+    RECORD_HEADER = struct.Struct(">I32s")
+    INDEX_RECORD = struct.Struct(">32s32sQ")
+    # Write the full chain state every this many tip changes; the blocks
+    #   in between are re-applied from the store on startup
+    CHAINSTATE_INTERVAL = 100
+    CACHE_SIZE = 256
+
+    def __init__(self, datadir, sync=True):
+        os.makedirs(datadir, exist_ok=True)
+        self.datadir = datadir
+        self.sync = sync
+        self.data_path = os.path.join(datadir, "blocks.dat")
+        self.index_path = os.path.join(datadir, "index.dat")
+        self.tip_path = os.path.join(datadir, "tip.json")
+        self.chainstate_path = os.path.join(datadir, "chainstate.json")
+        # The UTXO snapshot the chain started from, until it is validated
+        self.snapshot_path = os.path.join(datadir, "snapshot.dat")
+        self.offsets = {}
+        self.parents = {}
+        self.cache = OrderedDict()
+        self.tips_since_chainstate = 0
+        self.recover()
+        self.data = open(self.data_path, "ab")
+        self.index = open(self.index_path, "ab")
+
+    def recover(self):
+        # Load the index, then check the data file past the last indexed
+        #   record: complete records there are re-indexed and a torn write
+        #   at the end is truncated away
+        for path in [self.data_path, self.index_path]:
+            if not os.path.exists(path):
+                open(path, "wb").close()
+        data_size = os.path.getsize(self.data_path)
+        index_size = os.path.getsize(self.index_path)
+        valid_index_size = index_size - index_size % self.INDEX_RECORD.size
+        entries = []
+        with open(self.index_path, "rb") as f:
+            index = f.read(valid_index_size)
+        for i in range(0, len(index), self.INDEX_RECORD.size):
+            h, last_hash, offset = self.INDEX_RECORD.unpack_from(index, i)
+            entries.append((int.from_bytes(h, 'big'), int.from_bytes(last_hash, 'big'), offset))
+        with open(self.data_path, "r+b") as data:
+            # Drop index entries for records that did not make it to disk
+            while entries and self.read_record(data, entries[-1][2], data_size) is None:
+                entries.pop()
+            end = 0
+            if entries:
+                end = entries[-1][2] + self.RECORD_HEADER.size + self.read_length(data, entries[-1][2])
+            for h, last_hash, offset in entries:
+                self.add_index_entry(h, last_hash, offset)
+            # Re-index complete records written after the last index entry
+            new_entries = []
+            while True:
+                payload = self.read_record(data, end, data_size)
+                if payload is None:
+                    break
+                block = self.decode_payload(payload)
+                new_entries.append((block.hash(), block.last_hash, end))
+                self.add_index_entry(block.hash(), block.last_hash, end)
+                end += self.RECORD_HEADER.size + len(payload)
+            if end < data_size:
+                print("Truncating {} bytes of incomplete block data".format(data_size - end))
+                data.truncate(end)
+        if new_entries or len(entries) * self.INDEX_RECORD.size != index_size:
+            with open(self.index_path, "wb") as f:
+                for h, offset in self.offsets.items():
+                    f.write(self.pack_index_entry(h, self.parents[h], offset))
+
+    def read_length(self, data, offset):
+        data.seek(offset)
+        return self.RECORD_HEADER.unpack(data.read(self.RECORD_HEADER.size))[0]
+
+    def read_record(self, data, offset, data_size):
+        # The payload of the record at offset, or None if it is incomplete or corrupt
+        if offset + self.RECORD_HEADER.size > data_size:
+            return None
+        data.seek(offset)
+        length, checksum = self.RECORD_HEADER.unpack(data.read(self.RECORD_HEADER.size))
+        if offset + self.RECORD_HEADER.size + length > data_size:
+            return None
+        payload = data.read(length)
+        if hashlib.sha256(payload).digest() != checksum:
+            return None
+        return payload
+
+    def decode_payload(self, payload):
+        if payload.startswith(b"{"):
+            # Written before blocks were stored in their binary encoding
+            return BlockStruct.from_json(deserialize(payload))
+        return BlockStruct.from_bytes(payload)
+
+    def add_index_entry(self, h, last_hash, offset):
+        self.offsets[h] = offset
+        # Genesis has no parent, stored as 0
+        self.parents[h] = last_hash or None
+
+    def pack_index_entry(self, h, last_hash, offset):
+        return self.INDEX_RECORD.pack(h.to_bytes(32, 'big'), (last_hash or 0).to_bytes(32, 'big'), offset)
+
+    def flush_file(self, f):
+        f.flush()
+        if self.sync:
+            os.fsync(f.fileno())
+
+    def __getitem__(self, h):
+        if h in self.cache:
+            self.cache.move_to_end(h)
+            return self.cache[h]
+        offset = self.offsets[h]
+        with open(self.data_path, "rb") as data:
+            payload = self.read_record(data, offset, os.path.getsize(self.data_path))
+        if payload is None:
+            raise CorruptStoreException("Block {} is corrupt on disk".format(h))
+        block = self.decode_payload(payload)
+        self.cache_block(h, block)
+        return block
+
+    def __setitem__(self, h, block):
+        if h in self.offsets:
+            return
+        payload = block.encoded()
+        offset = self.data.tell()
+        self.data.write(self.RECORD_HEADER.pack(len(payload), hashlib.sha256(payload).digest()) + payload)
+        # The index entry is only written once the block itself is on disk
+        self.flush_file(self.data)
+        self.index.write(self.pack_index_entry(h, block.last_hash, offset))
+        self.flush_file(self.index)
+        self.add_index_entry(h, block.last_hash, offset)
+        self.cache_block(h, block)
+
+    def __delitem__(self, h):
+        raise TypeError("Blocks cannot be removed from an append-only store")
+
+    def __contains__(self, h):
+        return h in self.offsets
+
+    def __iter__(self):
+        return iter(list(self.offsets))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def cache_block(self, h, block):
+        self.cache[h] = block
+        if len(self.cache) > self.CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+    def tip(self):
+        if os.path.exists(self.tip_path):
+            with open(self.tip_path) as f:
+                return json.loads(f.read())
+        return None
+
+    def set_tip(self, h, utxos):
+        atomic_write(self.tip_path, json.dumps(h))
+        self.tips_since_chainstate += 1
+        if self.tips_since_chainstate >= self.CHAINSTATE_INTERVAL:
+            self.save_chainstate(h, utxos)
+
+    def save_chainstate(self, h, utxos):
+        state = {
+            "tip": h,
+            "utxos": [list(output_id) + [out_addr, amount] for output_id, (out_addr, amount) in utxos.items()]
+        }
+        atomic_write(self.chainstate_path, serialize(state))
+        self.tips_since_chainstate = 0
+
+    def load_chainstate(self):
+        # The last saved (tip, unspent outputs), or None
+        if not os.path.exists(self.chainstate_path):
+            return None
+        with open(self.chainstate_path) as f:
+            state = deserialize(f.read())
+        utxos = {(block_hash, tx_index, out_index): (tuple(out_addr), amount)
+                 for block_hash, tx_index, out_index, out_addr, amount in state["utxos"]}
+        return state["tip"], utxos
+
+    def read_snapshot(self):
+        # The encoded UtxoSnapshot the chain started from, or None
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, "rb") as f:
+            return f.read()
+
+    def write_snapshot(self, data):
+        atomic_write(self.snapshot_path, data)
+
+    def drop_snapshot(self):
+        # Once every block before the snapshot is in the store as well
+        if os.path.exists(self.snapshot_path):
+            os.remove(self.snapshot_path)
+
+    def close(self):
+        self.data.close()
+        self.index.close()
@@ -0,0 +1,176 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .blockstruct import BlockHeader, BlockStruct
+from .chain import BlockChain, InvalidBlockException, check_header
+from .utxosnapshot import SnapshotError, utxo_commitment
+from . import network as nw
+
+
+class SyncError(Exception):
+    pass
+
+
+class HeaderSync:
+    # Initial sync for a node a long way behind. First the header chain,
+    #   from one peer: checking its proof of work and linkage is cheap and
+    #   tells us exactly which blocks to get. Then the blocks, in ranges
+    #   fetched in parallel from all peers. Each range is checked against
+    #   its headers as it arrives, has its signatures verified while later
+    #   ranges download, and is connected once the ranges before it are in
+    RANGE_SIZE = 100
+    # Ranges downloading or waiting to be connected, per peer
+    RANGES_PER_PEER = 2
+    # Seconds between progress reports
+    REPORT_INTERVAL = 5
+
+    def __init__(self, client, peers):
+        self.client = client
+        self.peers = list(peers)
+        # (stage, done, total) as of the latest report
+        self.progress = None
+        self.started = self.last_report = time.time()
+
+    def run(self, header_peer):
+        # Returns the number of blocks connected
+        headers = self.fetch_headers(header_peer)
+        if headers:
+            self.fetch_blocks(headers)
+        return len(headers)
+
+    def fetch_headers(self, peer):
+        client = self.client
+        with client.chain_lock:
+            locator = client.chain.locator()
+        headers = []
+        while True:
+            batch = [BlockHeader.from_json(h) for h in nw.request_headers(peer, locator, client.HEADER_BATCH)]
+            self.check_headers(batch, headers[-1] if headers else None)
+            headers += batch
+            self.report("Headers", len(headers), None)
+            if len(batch) < client.HEADER_BATCH:
+                break
+            locator = [batch[-1].hash()] + locator
+        self.report("Headers", len(headers), None, force=True)
+        return headers
+
+    def check_headers(self, batch, prev):
+        for header in batch:
+            check_header(header)
+            if prev is None:
+                # The first header must follow a block we have
+                with self.client.chain_lock:
+                    parent = self.client.chain.blocks.get(header.last_hash)
+                if parent is None or header.id != parent.id + 1:
+                    raise InvalidBlockException("Header {} does not follow a known block".format(header.id))
+            elif header.last_hash != prev.hash() or header.id != prev.id + 1:
+                raise InvalidBlockException("Header {} does not follow the one before it".format(header.id))
+            prev = header
+
+    def fetch_blocks(self, headers):
+        ranges = [headers[i:i + self.RANGE_SIZE] for i in range(0, len(headers), self.RANGE_SIZE)]
+        pending = deque(enumerate(ranges))
+        in_flight = deque()
+        done = 0
+        self.started = time.time()
+        with ThreadPoolExecutor(len(self.peers)) as downloads:
+            while pending or in_flight:
+                while pending and len(in_flight) < len(self.peers) * self.RANGES_PER_PEER:
+                    in_flight.append(downloads.submit(self.fetch_range, *pending.popleft()))
+                blocks = in_flight.popleft().result()
+                self.connect_range(blocks)
+                done += len(blocks)
+                self.report("Blocks", done, len(headers))
+        self.report("Blocks", done, len(headers), force=True)
+
+    def fetch_range(self, i, headers):
+        # The blocks for `headers`, trying each peer in turn starting from
+        #   one that depends on i, to spread the ranges out
+        hashes = [header.hash() for header in headers]
+        errors = []
+        for j in range(len(self.peers)):
+            peer = self.peers[(i + j) % len(self.peers)]
+            try:
+                blocks = [BlockStruct.from_json(b) for b in nw.request_block_data(peer, hashes)]
+                self.check_range(blocks, hashes)
+                return blocks
+            except Exception as e:
+                errors.append("{}: {}".format(peer, e))
+        raise SyncError("No peer sent blocks {}-{}: {}".format(headers[0].id, headers[-1].id, "; ".join(errors)))
+
+    def check_range(self, blocks, hashes):
+        if [block.hash() for block in blocks] != hashes:
+            raise SyncError("Blocks do not match their headers")
+        for block in blocks:
+            if block.merkle_root != block.compute_merkle_root():
+                raise SyncError("Block {} does not match its merkle root".format(block.id))
+
+    def connect_range(self, blocks):
+        client = self.client
+        # Outside the lock: verified signatures are remembered (see
+        #   signature.py), so connecting the blocks only checks the rest
+        client.chain.verify_signatures(blocks)
+        with client.chain_lock:
+            client.merge_blocks(blocks)
+            rejected = [block for block in blocks if block.hash() not in client.chain.blocks or block.hash() in client.chain.invalid]
+        if rejected:
+            raise SyncError("Block {} was rejected".format(rejected[0].id))
+
+    def report(self, stage, done, total, force=False):
+        self.progress = (stage, done, total)
+        now = time.time()
+        if not force and now - self.last_report < self.REPORT_INTERVAL:
+            return
+        self.last_report = now
+        rate = done / max(now - self.started, 1e-6)
+        if total is None:
+            print("Sync: {} {} ({:.0f}/s)".format(stage, done, rate))
+        else:
+            print("Sync: {} {}/{} ({:.0%}, {:.0f}/s)".format(stage, done, total, done / total, rate))
+
+
+class SnapshotValidation:
+    # For a node started from a UtxoSnapshot: fetches the blocks before the
+    #   snapshot's base block from peers and replays them on a chain of
+    #   its own, in the background. If they end at the snapshot's unspent
+    #   outputs, the snapshot was right, and the blocks are kept so that
+    #   the node can serve them and reorganize past the base block
+    def __init__(self, client, peers, snapshot):
+        self.client = client
+        self.peers = list(peers)
+        self.snapshot = snapshot
+        # None until run finishes, then whether the snapshot was right.
+        #   Failing to get the blocks raises SyncError and leaves it None,
+        #   blocks showing the snapshot to be wrong raise SnapshotError
+        self.valid = None
+        self.fetcher = HeaderSync(client, peers)
+
+    def run(self):
+        headers = self.snapshot.headers
+        chain = BlockChain.empty()
+        chain.verifier = self.client.verifier
+        size = self.fetcher.RANGE_SIZE
+        try:
+            for i, start in enumerate(range(0, len(headers), size)):
+                blocks = self.fetcher.fetch_range(i, headers[start:start + size])
+                chain.verify_signatures(blocks)
+                for block in blocks:
+                    if not chain.add_block(block):
+                        raise SnapshotError("Block {} before the snapshot is invalid".format(block.id))
+                self.fetcher.report("Snapshot blocks", start + len(blocks), len(headers))
+            base_hash = self.snapshot.base.hash()
+            if utxo_commitment(base_hash, dict(chain.utxos.items())) != self.snapshot.commitment:
+                raise SnapshotError("The blocks before the snapshot do not add up to its unspent outputs")
+        except SnapshotError:
+            self.valid = False
+            raise
+        with self.client.chain_lock:
+            blocks = self.client.chain.blocks
+            for h in chain.hash_iter():
+                if h not in blocks:
+                    blocks[h] = chain.blocks[h]
+            self.client.chain.snapshot_base = None
+            if self.client.chain.store is not None:
+                self.client.chain.store.drop_snapshot()
+        self.valid = True
@@ -0,0 +1,62 @@
+import bisect
+
+from .blockstruct import BlockStruct
+from .tx import Tx
+
+
+class BlockTemplate:
+    # The txs for the next block we mine: the best paying from the tx pool,
+    #   by fee per byte, up to max_bytes of encoded txs. Kept sorted best
+    #   first so that a new tx can be slotted in without going over the
+    #   whole pool again
+    MAX_BYTES = 1024 * 1024
+
+    def __init__(self, mempool, max_bytes=None):
+        self.mempool = mempool
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.rebuild()
+
+    def rate(self, tx):
+        return self.mempool.fee(tx.txid()) / tx.size()
+
+    def rebuild(self):
+        # Start over from the pool, e.g. when the tip changes
+        self.selected = []
+        # Negated fee rates of self.selected, ascending, for bisect
+        self.keys = []
+        self.size = 0
+        for tx in self.mempool.by_fee_rate():
+            if self.size + tx.size() <= self.max_bytes:
+                self.selected.append(tx)
+                self.keys.append(-self.rate(tx))
+                self.size += tx.size()
+
+    def add(self, tx):
+        # Slot in a tx newly added to the pool, pushing out the worst paying
+        #   txs if there isn't room, unless they pay at least as well.
+        #   Returns whether the template changed
+        rate = self.rate(tx)
+        dropped = []
+        while self.size + tx.size() > self.max_bytes:
+            if not self.selected or -self.keys[-1] >= rate:
+                # tx doesn't make it in: put back anything dropped for it
+                for old, key in reversed(dropped):
+                    self.selected.append(old)
+                    self.keys.append(key)
+                    self.size += old.size()
+                return False
+            old = self.selected.pop()
+            self.size -= old.size()
+            dropped.append((old, self.keys.pop()))
+        i = bisect.bisect_right(self.keys, -rate)
+        self.selected.insert(i, tx)
+        self.keys.insert(i, -rate)
+        self.size += tx.size()
+        return True
+
+    def txs(self):
+        return list(self.selected)
+
+    def block(self, last, pubkey):
+        # The block to mine on top of `last`, paying the reward to pubkey
+        return BlockStruct(last.id + 1, last.hash(), self.txs() + [Tx.coinbase(pubkey)], 0)
@@ -1,32 +1,48 @@
+from . import signature
 from .signature import is_valid_signature
-from .hashing import hash_
+from .hashing import hash_bytes
 from .serialization import fmt_h
-from .util import ValueComparable
+from .encoding import VERSION, Writer, DecodeError, write_pubkey, read_pubkey, write_address, read_address
+from .util import Immutable, ValueComparable
 
 COINBASE_CONSTANT = ("__COINBASE__", 0)
 COINBASE_AMT = 10.0
 
 class TxOutput(ValueComparable):
+    __slots__ = ["out_addr", "amount"]
+    FIELDS = __slots__
+
     def __init__(self, out_addr, amount):
-        self.out_addr = out_addr
-        self.amount = amount
+        self.set_fields(out_addr=out_addr, amount=amount)
 
     def as_json(self):
-        return self.__dict__
+        return {
+            "out_addr": self.out_addr,
+            "amount": self.amount
+        }
 
     @classmethod
     def from_json(cls, data):
         data["out_addr"] = tuple(data["out_addr"])
         return cls(**data)
 
+    def encode(self, w):
+        write_address(w, self.out_addr)
+        w.double(self.amount)
+
+    @classmethod
+    def decode(cls, r):
+        return cls(read_address(r), r.double())
+
     def __repr__(self):
         return "TxOutput<{}>".format(str(self.as_json()))
 
 class TxInput(ValueComparable):
+    __slots__ = ["block_hash", "tx_index", "tx_out_index"]
+    FIELDS = __slots__
+
     def __init__(self, block_hash, tx_index, tx_out_index):
-        self.block_hash = block_hash
-        self.tx_index = tx_index
-        self.tx_out_index = tx_out_index
+        self.set_fields(block_hash=block_hash, tx_index=tx_index, tx_out_index=tx_out_index)
 
     def as_json(self):
         return {
@@ -35,26 +51,44 @@ class TxInput(ValueComparable):
             "tx_out_index": self.tx_out_index
         }
 
+    def outpoint(self):
+        return (self.block_hash, self.tx_index, self.tx_out_index)
+
     @classmethod
     def from_json(cls, data):
+        # Binary messages decode straight to inputs
+        if isinstance(data, cls):
+            return data
         return cls(**data)
 
+    def encode(self, w):
+        w.hash(self.block_hash)
+        w.varint(self.tx_index)
+        # Fee outputs have index -1
+        w.signed(self.tx_out_index)
+
+    @classmethod
+    def decode(cls, r):
+        return cls(r.hash(), r.varint(), r.signed())
+
     def __repr__(self):
         return "TxInput<{}>".format(str(self.as_json()))
 
 
-class Tx:
+class Tx(Immutable):
+    __slots__ = ["from_addr", "signature", "inputs", "outputs", "_txid", "_encoded"]
+    FIELDS = ["from_addr", "signature", "inputs", "outputs"]
+
     def __init__(self, from_addr, signature, inputs, outputs):
-        self.from_addr = from_addr
-        self.signature = signature
-        self.inputs = inputs
-        self.outputs = outputs
+        self.set_fields(from_addr=from_addr, signature=signature, inputs=tuple(inputs), outputs=tuple(outputs), _txid=None, _encoded=None)
 
     def __hash__(self):
-        return self.signature
+        return hash(self.txid())
 
     def __eq__(self, other):
-        return self.from_addr == other.from_addr and self.signature == other.signature and self.inputs == other.inputs and self.outputs == other.outputs
+        if isinstance(other, Tx):
+            return self.txid() == other.txid()
+        return NotImplemented
 
     @classmethod
     def coinbase(cls, out_addr):
@@ -73,20 +107,80 @@ class Tx:
 
     @classmethod
     def from_json(cls, data):
+        # Binary messages decode straight to txs
+        if isinstance(data, cls):
+            return data
         data["from_addr"] = tuple(data["from_addr"])
         data["inputs"] = [TxInput.from_json(i) for i in data["inputs"]]
         data["outputs"] = [TxOutput.from_json(o) for o in data["outputs"]]
         return cls(**data)
+
+    def encoded(self):
+        # The canonical encoding, built once: the txid is its hash, and
+        #   blocks embed it as is in the store and on the wire
+        if self._encoded is None:
+            w = Writer()
+            w.byte(VERSION)
+            if self.is_coinbase():
+                w.byte(0)
+            else:
+                w.byte(1)
+                write_pubkey(w, self.from_addr)
+            w.optional(w.bigint, self.signature)
+            w.varint(len(self.inputs))
+            for inp in self.inputs:
+                inp.encode(w)
+            w.varint(len(self.outputs))
+            for outp in self.outputs:
+                outp.encode(w)
+            self.set_fields(_encoded=w.getvalue())
+        return self._encoded
+
+    def encode(self, w):
+        w.raw(self.encoded())
+
+    @classmethod
+    def decode(cls, r):
+        # Not cached as the encoding: an equivalent but non-canonical input
+        #   (e.g. a padded varint) must not change the txid
+        r.version()
+        kind = r.byte()
+        if kind == 0:
+            from_addr = COINBASE_CONSTANT
+        elif kind == 1:
+            from_addr = read_pubkey(r)
+        else:
+            raise DecodeError("Invalid sender kind {}".format(kind))
+        signature = r.optional(r.bigint)
+        inputs = [TxInput.decode(r) for i in range(r.varint())]
+        outputs = [TxOutput.decode(r) for i in range(r.varint())]
+        return cls(from_addr, signature, inputs, outputs)
+
+    def txid(self):
+        if self._txid is None:
+            self.set_fields(_txid=hash_bytes(self.encoded()))
+        return self._txid
+
+    def size(self):
+        # Length of the canonical encoding
+        return len(self.encoded())
     
     def is_coinbase(self):
         return self.from_addr == COINBASE_CONSTANT
     
+    def check_signature(self):
+        return is_valid_signature((self.inputs, self.outputs), self.signature, self.from_addr)
+
     def validate(self):
-        if not is_valid_signature((self.inputs, self.outputs), self.signature, self.from_addr):
+        # A tx seen before, e.g. in the tx pool, is not checked again
+        if self.txid() in signature.verified:
+            return
+        if not self.check_signature():
             raise InvalidTransactionException("Invalid signature")
+        signature.verified.add(self.txid())
     
     def __repr__(self):
-        return "Tx<{}>[{} {} {}]".format(fmt_h(hash_(self)), self.from_addr, self.inputs, self.outputs)
+        return "Tx<{}>[{} {} {}]".format(fmt_h(self.txid()), self.from_addr, self.inputs, self.outputs)
 
 class InvalidTransactionException(Exception):
     pass
@@ -1,27 +1,97 @@
 from .tx import InvalidTransactionException, Tx, TxOutput
 from .signature import create_signature
 
+# Amounts are floats, so sums this close count as equal, and change
+#   smaller than this is left to the miner rather than sent back
+TOLERANCE = 1e-9
+# Subsets select_exact tries before giving up on an exact match
+EXACT_TRIES = 100000
+# Most inputs select_consolidate puts in one tx
+CONSOLIDATE_MAX = 50
 
-def find_inputs(all_inputs, out_total):
+
+# Coin selection: each strategy picks (input, amount) pairs from
+#   all_inputs covering out_total, or returns None if they can't
+
+def select_in_order(all_inputs, out_total):
     sum_total = 0.0
     inputs = []
     for i, amt in all_inputs:
         if sum_total < out_total:
-            inputs.append(i)
+            inputs.append((i, amt))
             sum_total += amt
         else:
             break
     if sum_total < out_total:
+        return None
+    return inputs
+
+def select_largest_first(all_inputs, out_total):
+    # Fewest inputs, but leaves the small ones to pile up
+    return select_in_order(sorted(all_inputs, key=lambda x: -x[1]), out_total)
+
+def select_exact(all_inputs, out_total):
+    # Branch and bound for inputs adding up to exactly out_total, so that
+    #   the tx needs no change output; largest-first if there are none
+    candidates = sorted(all_inputs, key=lambda x: -x[1])
+    # remaining[i]: the sum of candidates[i:]
+    remaining = [0.0] * (len(candidates) + 1)
+    for i in range(len(candidates) - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + candidates[i][1]
+    tries = 0
+    # Depth first, trying each candidate in before trying it out. A stack
+    #   entry is the next candidate, the sum so far and the indexes chosen
+    stack = [(0, 0.0, ())]
+    while stack and tries < EXACT_TRIES:
+        i, total, chosen = stack.pop()
+        tries += 1
+        if abs(total - out_total) <= TOLERANCE:
+            return [candidates[j] for j in chosen]
+        if i == len(candidates) or total > out_total or total + remaining[i] < out_total - TOLERANCE:
+            continue
+        # Leaving a candidate out means leaving out the equal ones after it
+        #   too, as putting one of those in instead finds nothing new
+        j = i + 1
+        while j < len(candidates) and candidates[j][1] == candidates[i][1]:
+            j += 1
+        stack.append((j, total, chosen))
+        stack.append((i + 1, total + candidates[i][1], chosen + (i,)))
+    return select_largest_first(all_inputs, out_total)
+
+def select_consolidate(all_inputs, out_total):
+    # Largest first, plus as many of the smallest as fit in
+    #   CONSOLIDATE_MAX inputs, to merge them into the change output
+    inputs = select_largest_first(all_inputs, out_total)
+    if inputs is None:
+        return None
+    chosen = set(i.outpoint() for i, amt in inputs)
+    for i, amt in sorted(all_inputs, key=lambda x: x[1]):
+        if len(inputs) >= CONSOLIDATE_MAX:
+            break
+        if i.outpoint() not in chosen:
+            inputs.append((i, amt))
+    return inputs
+
+STRATEGIES = {
+    "order": select_in_order,
+    "largest": select_largest_first,
+    "exact": select_exact,
+    "consolidate": select_consolidate,
+}
+
+def find_inputs(all_inputs, out_total, select=select_in_order):
+    inputs = select(list(all_inputs), out_total)
+    if inputs is None:
         raise InvalidTransactionException("Requested amount is larger than available funds")
-    return (inputs, sum_total - out_total)
+    return ([i for i, amt in inputs], sum(amt for i, amt in inputs) - out_total)
 
 def make_tx(all_inputs, privkey, pubkey, outputs):
     return make_tx_with_fee(all_inputs, privkey, pubkey, outputs, 0.0)
 
-def make_tx_with_fee(all_inputs, privkey, pubkey, outputs, fee):
+def make_tx_with_fee(all_inputs, privkey, pubkey, outputs, fee, select=select_in_order):
     out_total = fee + sum(x.amount for x in outputs)
-    inputs, remainder = find_inputs(all_inputs, out_total)
-    if remainder > 0.0:
+    inputs, remainder = find_inputs(all_inputs, out_total, select)
+    if remainder > TOLERANCE:
         outputs.append(TxOutput(pubkey, remainder))
     sig = create_signature((inputs, outputs), privkey)
     return Tx(pubkey, sig, inputs, outputs)
@@ -1,14 +1,51 @@
 import threading
+from operator import attrgetter
 
 
-class ValueComparable:
+class Immutable:
+    # Attributes are set once, through set_fields in __init__, and never
+    #   again. FIELDS lists the constructor arguments, which is all that is
+    #   needed to copy or pickle the object; other slots are caches
+    __slots__ = ()
+    FIELDS = ()
+    get_fields = staticmethod(lambda obj: ())
+
+    def set_fields(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is immutable".format(self.__class__.__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{} is immutable".format(self.__class__.__name__))
+
+    def __init_subclass__(cls, **kwargs):
+        # attrgetter fetches all the fields in one (C-level) call
+        super().__init_subclass__(**kwargs)
+        if len(cls.FIELDS) > 1:
+            cls.get_fields = staticmethod(attrgetter(*cls.FIELDS))
+        elif cls.FIELDS:
+            get_field = attrgetter(cls.FIELDS[0])
+            cls.get_fields = staticmethod(lambda obj: (get_field(obj),))
+
+    def field_values(self):
+        return self.get_fields(self)
+
+    def __reduce__(self):
+        return (self.__class__, self.field_values())
+
+
+class ValueComparable(Immutable):
+    __slots__ = ()
+
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.field_values() == other.field_values()
         return NotImplemented
 
     def __ne__(self, other):
         return not self == other
 
     def __hash__(self):
-        return hash(tuple(sorted(self.__dict__.items())))
+        return hash(self.field_values())
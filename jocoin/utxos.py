@@ -0,0 +1,65 @@
+from collections.abc import MutableMapping
+
+
+class UtxoSet(MutableMapping):
+    # Unspent outputs: (block_hash, tx_index, out_index) -> (out_addr, amount),
+    #   also indexed by address so that one address's outputs can be found
+    #   without scanning the whole set
+    def __init__(self, utxos=()):
+        self.utxos = {}
+        # out_addr -> {output_id: amount}
+        self.by_addr = {}
+        # Addresses whose dict in by_addr was made since the last snapshot,
+        #   and so can be changed in place
+        self.owned = set()
+        self.update(utxos)
+
+    def __getitem__(self, output_id):
+        return self.utxos[output_id]
+
+    def __setitem__(self, output_id, utxo):
+        if output_id in self.utxos:
+            del self[output_id]
+        self.utxos[output_id] = utxo
+        self.writable(utxo[0])[output_id] = utxo[1]
+
+    def __delitem__(self, output_id):
+        out_addr, amount = self.utxos.pop(output_id)
+        outputs = self.writable(out_addr)
+        del outputs[output_id]
+        if not outputs:
+            del self.by_addr[out_addr]
+
+    def __iter__(self):
+        return iter(self.utxos)
+
+    def __len__(self):
+        return len(self.utxos)
+
+    def __contains__(self, output_id):
+        return output_id in self.utxos
+
+    def get(self, output_id, default=None):
+        return self.utxos.get(output_id, default)
+
+    def outputs_for(self, out_addr):
+        # {output_id: amount} for the outputs owned by out_addr
+        return self.by_addr.get(out_addr, {})
+
+    def balance(self, out_addr):
+        return sum(self.outputs_for(out_addr).values())
+
+    def writable(self, out_addr):
+        # The outputs of out_addr, copied first if a snapshot may share them
+        outputs = self.by_addr.get(out_addr)
+        if outputs is None or out_addr not in self.owned:
+            outputs = self.by_addr[out_addr] = dict(outputs or {})
+            self.owned.add(out_addr)
+        return outputs
+
+    def snapshot(self):
+        # out_addr -> {output_id: amount} as things are now. Later changes
+        #   copy an address's outputs before touching them, so what this
+        #   returns never changes and can be read without a lock
+        self.owned = set()
+        return dict(self.by_addr)
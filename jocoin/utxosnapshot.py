@@ -0,0 +1,116 @@
+import hashlib
+
+from .encoding import VERSION, Writer, Reader, DecodeError, write_address, read_address
+from .blockstruct import BlockHeader, BlockStruct
+
+# A snapshot file is
+#   MAGIC, VERSION
+#   the headers of the main chain after genesis, up to the base block's
+#   the base block itself
+#   the unspent outputs as of the base block, sorted by output id
+#   the commitment: sha256 of the base block hash and the outputs
+# so its size depends on the number of unspent outputs, not on the length
+#   of the chain's history, apart from the headers
+MAGIC = b"JOCUTXO"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def write_utxo(w, output_id, utxo):
+    block_hash, tx_index, out_index = output_id
+    out_addr, amount = utxo
+    w.hash(block_hash)
+    w.varint(tx_index)
+    # Fee outputs have index -1
+    w.signed(out_index)
+    write_address(w, out_addr)
+    w.double(amount)
+
+def read_utxo(r):
+    output_id = (r.hash(), r.varint(), r.signed())
+    return output_id, (read_address(r), r.double())
+
+def utxo_commitment(base_hash, utxos):
+    # Hex sha256 of the outputs in output id order, so that any two nodes
+    #   holding the same outputs at the same block get the same value
+    w = Writer()
+    w.hash(base_hash)
+    for output_id in sorted(utxos):
+        write_utxo(w, output_id, utxos[output_id])
+    return hashlib.sha256(w.getvalue()).hexdigest()
+
+
+class UtxoSnapshot:
+    # The chain state as of one block: enough for a node to start from that
+    #   block without fetching and replaying the blocks before it (see
+    #   BlockChain.from_snapshot)
+    def __init__(self, headers, base, utxos):
+        # Headers of the main chain after genesis, ending with the base block's
+        self.headers = headers
+        self.base = base
+        # output_id -> (out_addr, amount)
+        self.utxos = utxos
+        self.commitment = utxo_commitment(base.hash(), utxos)
+
+    @classmethod
+    def from_chain(cls, chain, block_hash=None):
+        # The snapshot at main chain block block_hash, the tip if None
+        if block_hash is None:
+            block_hash = chain.current_hash
+        if not chain.index.on_main_chain(block_hash):
+            raise SnapshotError("Block {} is not on the main chain".format(block_hash))
+        hashes = list(chain.hash_iter(block_hash))[::-1][1:]
+        if not hashes:
+            raise SnapshotError("Cannot take a snapshot at the genesis block")
+        headers = [chain.blocks[h].header() for h in hashes]
+        return cls(headers, chain.blocks[block_hash], chain.utxos_at(block_hash))
+
+    def encode(self):
+        w = Writer()
+        w.raw(MAGIC)
+        w.byte(VERSION)
+        w.varint(len(self.headers))
+        for header in self.headers:
+            header.encode(w)
+        w.bytes_(self.base.encoded())
+        w.varint(len(self.utxos))
+        for output_id in sorted(self.utxos):
+            write_utxo(w, output_id, self.utxos[output_id])
+        w.raw(bytes.fromhex(self.commitment))
+        return w.getvalue()
+
+    @classmethod
+    def decode(cls, data, commitment=None):
+        # Checks the file against the commitment it carries and, if given,
+        #   the commitment it should have, e.g. from the snapshot's publisher
+        try:
+            r = Reader(data)
+            if r.raw(len(MAGIC)) != MAGIC:
+                raise SnapshotError("Not a UTXO snapshot")
+            if r.byte() != VERSION:
+                raise SnapshotError("Unknown snapshot version")
+            headers = [BlockHeader.decode(r) for i in range(r.varint())]
+            base = BlockStruct.from_bytes(r.bytes_())
+            utxos = dict(read_utxo(r) for i in range(r.varint()))
+            stored = r.raw(hashlib.sha256().digest_size).hex()
+            if not r.at_end():
+                raise SnapshotError("Trailing data after snapshot")
+        except DecodeError as e:
+            raise SnapshotError("Corrupt snapshot: {}".format(e))
+        snapshot = cls(headers, base, utxos)
+        if snapshot.commitment != stored:
+            raise SnapshotError("Snapshot does not match its commitment")
+        if commitment is not None and snapshot.commitment != commitment:
+            raise SnapshotError("Snapshot commitment is {}, not {}".format(snapshot.commitment, commitment))
+        return snapshot
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.encode())
+
+    @classmethod
+    def load(cls, path, commitment=None):
+        with open(path, "rb") as f:
+            return cls.decode(f.read(), commitment)
@@ -0,0 +1,33 @@
+import multiprocessing
+import os
+
+def verify_signature(tx):
+    return tx.check_signature()
+
+
+class VerifierPool:
+    # Fewer txs than this are checked in the calling process, as sending
+    #   them to the workers would cost more than it saves
+    MIN_BATCH = 8
+    # Chunks per worker, so that a slow chunk doesn't hold up the others
+    CHUNKS_PER_WORKER = 4
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.pool = None
+
+    def start(self):
+        self.pool = multiprocessing.Pool(self.workers)
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def verify(self, txs):
+        # Whether each tx's signature is valid, in order
+        if self.pool is None or len(txs) < self.MIN_BATCH:
+            return [verify_signature(tx) for tx in txs]
+        chunksize = max(1, len(txs) // (self.workers * self.CHUNKS_PER_WORKER))
+        return self.pool.map(verify_signature, txs, chunksize)
@@ -0,0 +1,137 @@
+import json
+import os
+import time
+
+from .chain import BlockChain
+from .store import atomic_write
+from .tx import Tx, TxInput
+from .user import make_tx_with_fee, select_exact
+from . import network as nw
+
+
+class Wallet:
+    # One address's unspent outputs, kept in a file between client.py runs
+    #   and brought up to date from a node's HISTORY pages, starting where
+    #   the last sync stopped. Outputs spent by txs we sent are held back
+    #   until the spend shows up in a block, so that back-to-back transfers
+    #   don't try to spend them twice
+    # Txs requested per HISTORY or ADDRESS page
+    PAGE_SIZE = 1000
+    # Seconds after which an unconfirmed spend is given up on, and its
+    #   outputs can be spent again
+    PENDING_TIMEOUT = 3600
+
+    def __init__(self, pubkey, path=None):
+        self.pubkey = tuple(pubkey)
+        self.path = path
+        self.reset()
+        # output_id -> when a tx we sent spent it
+        self.pending = {}
+
+    def reset(self):
+        # (block_hash, tx_index, out_index) -> amount
+        self.outputs = {}
+        # HISTORY entries applied so far, and the last of them
+        self.synced = 0
+        self.last = None
+        self.tip = None
+
+    @classmethod
+    def load(cls, pubkey, path):
+        wallet = cls(pubkey, path)
+        if not os.path.exists(path):
+            return wallet
+        with open(path) as f:
+            state = json.loads(f.read())
+        if tuple(state["pubkey"]) != wallet.pubkey:
+            # A cache for some other key; start afresh
+            return wallet
+        wallet.outputs = {tuple(entry[:3]): entry[3] for entry in state["outputs"]}
+        wallet.pending = {tuple(entry[:3]): entry[3] for entry in state["pending"]}
+        wallet.synced = state["synced"]
+        wallet.last = tuple(state["last"]) if state["last"] is not None else None
+        wallet.tip = state["tip"]
+        return wallet
+
+    def save(self):
+        state = {
+            "pubkey": self.pubkey,
+            "outputs": [list(output_id) + [amount] for output_id, amount in self.outputs.items()],
+            "pending": [list(output_id) + [spent_at] for output_id, spent_at in self.pending.items()],
+            "synced": self.synced,
+            "last": self.last,
+            "tip": self.tip
+        }
+        atomic_write(self.path, json.dumps(state))
+
+    def sync(self, peer):
+        while True:
+            # Ask again for the last entry we applied, to check that it is
+            #   still on the node's main chain
+            offset = max(self.synced - 1, 0)
+            page = nw.request_history(peer, self.pubkey, offset, self.PAGE_SIZE)
+            if page is None:
+                # The node keeps no address index
+                self.sync_outputs(peer)
+                break
+            entries = page["txs"]
+            if self.synced:
+                if not entries or (entries[0]["block_hash"], entries[0]["tx_index"]) != self.last:
+                    # A reorganization took out txs we had applied
+                    self.reset()
+                    continue
+                entries = entries[1:]
+            for entry in entries:
+                self.apply(entry)
+            self.tip = page["tip"]
+            if self.synced >= page["total"] or not entries:
+                break
+        self.expire_pending()
+
+    def apply(self, entry):
+        h, tx_index = entry["block_hash"], entry["tx_index"]
+        tx = Tx.from_json(entry["tx"])
+        if tx.from_addr == self.pubkey:
+            for inp in tx.inputs:
+                self.outputs.pop(inp.outpoint(), None)
+                self.pending.pop(inp.outpoint(), None)
+        for out_index, outp in enumerate(tx.outputs):
+            if outp.out_addr == self.pubkey:
+                self.outputs[(h, tx_index, out_index)] = outp.amount
+        if entry["fee"] > 0 and tuple(entry["miner"]) == self.pubkey:
+            self.outputs[(h, tx_index, BlockChain.FEE_INDEX)] = entry["fee"]
+        self.synced += 1
+        self.last = (h, tx_index)
+
+    def sync_outputs(self, peer):
+        # All our outputs, from ADDRESS pages. Pages may be from different
+        #   tips, which at worst picks an input the node then rejects
+        self.reset()
+        offset = 0
+        while True:
+            page = nw.request_address(peer, self.pubkey, offset, self.PAGE_SIZE)
+            for inp, amount in page["outputs"]:
+                self.outputs[TxInput.from_json(inp).outpoint()] = amount
+            offset += len(page["outputs"])
+            self.tip = page["tip"]
+            if offset >= page["total"] or not page["outputs"]:
+                break
+        self.pending = {output_id: spent_at for output_id, spent_at in self.pending.items() if output_id in self.outputs}
+
+    def expire_pending(self):
+        now = time.time()
+        self.pending = {output_id: spent_at for output_id, spent_at in self.pending.items()
+                        if now - spent_at < self.PENDING_TIMEOUT}
+
+    def spendable(self):
+        return [(TxInput(*output_id), amount) for output_id, amount in self.outputs.items() if output_id not in self.pending]
+
+    def balance(self):
+        return sum(self.outputs.values())
+
+    def make_tx(self, privkey, outputs, fee=0.0, select=select_exact):
+        tx = make_tx_with_fee(self.spendable(), privkey, self.pubkey, outputs, fee, select)
+        now = time.time()
+        for inp in tx.inputs:
+            self.pending[inp.outpoint()] = now
+        return tx
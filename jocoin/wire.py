@@ -0,0 +1,103 @@
+from .encoding import VERSION, Writer, Reader, DecodeError
+from .blockstruct import BlockHeader, BlockStruct
+from .tx import Tx
+
+# Binary encoding of whole messages: JSON-like values, each preceded by a
+#   one byte tag, except that txs, blocks and headers are sent in their own
+#   compact encoding rather than as dicts
+NONE = 0
+TRUE = 1
+FALSE = 2
+INT = 3
+FLOAT = 4
+STR = 5
+LIST = 6
+DICT = 7
+TX = 8
+BLOCK = 9
+HEADER = 10
+
+
+def write_value(w, value):
+    if value is None:
+        w.byte(NONE)
+    elif value is True:
+        w.byte(TRUE)
+    elif value is False:
+        w.byte(FALSE)
+    elif isinstance(value, int):
+        w.byte(INT)
+        w.signed(value)
+    elif isinstance(value, float):
+        w.byte(FLOAT)
+        w.double(value)
+    elif isinstance(value, str):
+        w.byte(STR)
+        w.str_(value)
+    elif isinstance(value, (list, tuple)):
+        w.byte(LIST)
+        w.varint(len(value))
+        for item in value:
+            write_value(w, item)
+    elif isinstance(value, dict):
+        w.byte(DICT)
+        w.varint(len(value))
+        for k, v in value.items():
+            write_value(w, k)
+            write_value(w, v)
+    elif isinstance(value, Tx):
+        w.byte(TX)
+        value.encode(w)
+    elif isinstance(value, BlockStruct):
+        w.byte(BLOCK)
+        value.encode(w)
+    elif isinstance(value, BlockHeader):
+        w.byte(HEADER)
+        value.encode(w)
+    else:
+        # Anything else goes as its JSON form, as with serialize
+        write_value(w, value.as_json())
+
+def read_value(r):
+    tag = r.byte()
+    if tag == NONE:
+        return None
+    elif tag == TRUE:
+        return True
+    elif tag == FALSE:
+        return False
+    elif tag == INT:
+        return r.signed()
+    elif tag == FLOAT:
+        return r.double()
+    elif tag == STR:
+        return r.str_()
+    elif tag == LIST:
+        return [read_value(r) for i in range(r.varint())]
+    elif tag == DICT:
+        d = {}
+        for i in range(r.varint()):
+            k = read_value(r)
+            d[k] = read_value(r)
+        return d
+    elif tag == TX:
+        return Tx.decode(r)
+    elif tag == BLOCK:
+        return BlockStruct.decode(r)
+    elif tag == HEADER:
+        return BlockHeader.decode(r)
+    raise DecodeError("Unknown tag {}".format(tag))
+
+def encode_message(value):
+    w = Writer()
+    w.byte(VERSION)
+    write_value(w, value)
+    return w.getvalue()
+
+def decode_message(data):
+    r = Reader(data)
+    r.version()
+    value = read_value(r)
+    if not r.at_end():
+        raise DecodeError("Trailing data after message")
+    return value
@@ -1,7 +1,9 @@
+import os
 import sys
 import json
 from optparse import OptionParser
 from jocoin.client import Client
+import jocoin.network as nw
 from jocoin.crypto import gen_keys
 
 def read_keyfile(fn):
@@ -15,21 +17,33 @@ if __name__ == "__main__":
                       help="public/private keyfile", metavar="FILE")
     parser.add_option("-H", "--host", help="server address", dest="server_addr", default="localhost")
     parser.add_option("-p", "--port", help="server port", type="int", dest="server_port", default=9999)
+    parser.add_option("-d", "--datadir", help="directory to store the chain in between runs", dest="datadir", metavar="DIR")
+    parser.add_option("-w", "--workers", help="mining processes (0 mines in the node process)", type="int", dest="workers", default=os.cpu_count())
+    parser.add_option("-v", "--verifiers", help="signature checking processes (0 checks in the node process)", type="int", dest="verifiers", default=os.cpu_count())
+    parser.add_option("-b", "--binary", help="send messages to peers in the binary encoding", action="store_true", dest="binary", default=False)
+    parser.add_option("-i", "--index", help="keep balances and tx history by address, for the history command", action="store_true", dest="address_index", default=False)
+    parser.add_option("-S", "--snapshot", help="start from a UTXO snapshot made with utxo.py rather than from genesis", dest="snapshot", metavar="FILE")
+    parser.add_option("-C", "--commitment", help="refuse the snapshot unless it has this commitment", dest="commitment", metavar="HEX")
+    parser.add_option("--assume-valid", help="don't check the snapshot against the blocks before it", action="store_false", dest="validate_snapshot", default=True)
 
     (options, args) = parser.parse_args()
+    if options.snapshot and options.address_index:
+        parser.error("an address index needs every block, so -i cannot be used with -S")
 
     if options.keyfile:
         keys = read_keyfile(options.keyfile)
     else:
         print("TEST MODE: using random keys")
-        keys = gen_keys()
+        keys = gen_keys(workers=options.workers)
 
     listen_addr = (options.server_addr, options.server_port)
+    nw.BINARY_WIRE = options.binary
     
     if args:
         peer_addr, peer_port = args
         peers = [(peer_addr, int(peer_port))]
     else:
         peers = []
-    c = Client(tuple(keys["pubkey"]), tuple(keys["privkey"]), peers, listen_addr)
+    c = Client(tuple(keys["pubkey"]), tuple(keys["privkey"]), peers, listen_addr, options.workers, options.datadir, options.verifiers, options.address_index,
+               options.snapshot, options.commitment, options.validate_snapshot)
     c.start()
@@ -0,0 +1,65 @@
+import unittest
+from unittest import mock
+
+import jocoin.crypto as jc
+from jocoin.chain import BlockChain
+from jocoin.blockstruct import BlockStruct
+from jocoin.tx import Tx, TxInput, TxOutput, COINBASE_AMT
+from jocoin.user import make_tx_with_fee
+
+
+class TestAddressIndex(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("jocoin.chain.DIFFICULTY", 1 << 256)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.alice = jc.gen_keys(256)
+        self.bob = jc.gen_keys(256)
+        self.chain = BlockChain.empty()
+        self.chain.enable_address_index()
+        self.add(self.block_on(self.chain.current_hash, [], self.alice))
+
+    def block_on(self, parent_hash, txs, miner):
+        parent = self.chain.blocks[parent_hash]
+        return BlockStruct(parent.id + 1, parent_hash, txs + [Tx.coinbase(miner["pubkey"])], 0)
+
+    def add(self, block):
+        self.assertTrue(self.chain.add_block(block))
+        return block.hash()
+
+    def spend(self, sender, receiver, amount, fee=0.5, inputs=None):
+        if inputs is None:
+            inputs = self.chain.valid_inputs_for(sender["pubkey"])
+        return make_tx_with_fee(inputs, sender["privkey"], sender["pubkey"], [TxOutput(receiver["pubkey"], amount)], fee)
+
+    def assert_matches_rebuilt(self):
+        index = self.chain.address_index
+        for key in [self.alice, self.bob]:
+            self.assertAlmostEqual(index.balance(key["pubkey"]), self.chain.holdings_for(key["pubkey"]))
+        self.chain.enable_address_index()
+        self.assertEqual(index.history, self.chain.address_index.history)
+
+    def test_balances_and_history(self):
+        first = self.chain.current_hash
+        tx = self.spend(self.alice, self.bob, 3.0)
+        second = self.add(self.block_on(first, [tx], self.bob))
+        index = self.chain.address_index
+        self.assertEqual(index.balance(self.alice["pubkey"]), COINBASE_AMT - 3.5)
+        # The transfer, the fee and the coinbase
+        self.assertEqual(index.balance(self.bob["pubkey"]), 3.0 + 0.5 + COINBASE_AMT)
+        self.assertEqual(index.history_for(self.alice["pubkey"]), [(first, 0), (second, 0)])
+        self.assertEqual(index.history_for(self.bob["pubkey"]), [(second, 0), (second, 1)])
+        self.assert_matches_rebuilt()
+
+    def test_follows_reorganizations(self):
+        fork = self.chain.current_hash
+        a1 = self.add(self.block_on(fork, [self.spend(self.alice, self.bob, 3.0)], self.alice))
+        self.add(self.block_on(a1, [self.spend(self.bob, self.alice, 1.0)], self.bob))
+        self.chain.UNDO_DEPTH = 0
+        b1 = self.add(self.block_on(fork, [], self.bob))
+        b2 = self.add(self.block_on(b1, [], self.bob))
+        # Spends b1's coinbase, so only valid once the chain has switched
+        tx = self.spend(self.bob, self.alice, 2.0, fee=0.0, inputs=[(TxInput(b1, 0, 0), COINBASE_AMT)])
+        b3 = self.add(self.block_on(b2, [tx], self.bob))
+        self.assertEqual(self.chain.current_hash, b3)
+        self.assert_matches_rebuilt()
@@ -0,0 +1,45 @@
+import random
+import unittest
+
+from jocoin.blockindex import BlockIndex
+
+
+class TestBlockIndex(unittest.TestCase):
+    def setUp(self):
+        # A bushy tree: each block extends one of the 20 most recent
+        random.seed(1)
+        self.index = BlockIndex()
+        self.index.add(0, None, 0)
+        self.index.push(0)
+        for h in range(1, 2000):
+            self.index.add(h, random.randint(max(0, h - 20), h - 1), 1)
+
+    def path(self, h):
+        # Hashes from genesis to h, the slow way
+        path = []
+        entry = self.index[h]
+        while entry is not None:
+            path.append(entry.hash)
+            entry = entry.parent
+        return path[::-1]
+
+    def test_ancestor(self):
+        for h in random.sample(range(2000), 100):
+            path = self.path(h)
+            for height in random.sample(range(len(path)), min(10, len(path))):
+                self.assertEqual(self.index[h].ancestor(height).hash, path[height])
+            self.assertIsNone(self.index[h].ancestor(len(path)))
+
+    def test_fork_point(self):
+        for i in range(100):
+            a, b = random.randint(0, 1999), random.randint(0, 1999)
+            common = [x for x, y in zip(self.path(a), self.path(b)) if x == y]
+            self.assertEqual(self.index.fork_point(a, b).hash, common[-1])
+
+    def test_main_chain(self):
+        for h in random.sample(range(2000), 50):
+            self.index.set_tip(h)
+            path = self.path(h)
+            self.assertEqual(self.index.main_chain, path)
+            self.assertEqual(self.index.tip_height(), len(path) - 1)
+            self.assertTrue(all(self.index.on_main_chain(x) for x in path))
@@ -0,0 +1,44 @@
+import unittest
+
+import jocoin.crypto as jc
+from jocoin.blockstruct import BlockStruct
+from jocoin.hashing import hash_bytes
+from jocoin.merkle import verify_proof
+from jocoin.tx import Tx, TxInput, TxOutput
+from jocoin.user import make_tx
+
+
+class TestBlockStruct(unittest.TestCase):
+    def setUp(self):
+        keys = jc.gen_keys(256)
+        inputs = [(TxInput(1234, 0, 0), 10.0)]
+        tx = make_tx(inputs, keys["privkey"], keys["pubkey"], [TxOutput(keys["pubkey"], 2.5)])
+        self.block = BlockStruct(2, BlockStruct.genesis().hash(), [tx, Tx.coinbase(keys["pubkey"])], 0)
+
+    def test_nonce_hasher(self):
+        hasher = self.block.nonce_hasher()
+        for nonce in [0, 1, 9, 10, 12345, 2 ** 70]:
+            self.assertEqual(hasher(nonce), self.block.with_nonce(nonce).hash())
+
+    def test_hash_covers_header_only(self):
+        h = self.block.hash()
+        self.assertEqual(h, self.block.header().hash())
+        # Changing the txs without the merkle root leaves the hash alone...
+        block = BlockStruct(self.block.id, self.block.last_hash, self.block.txs[1:], self.block.nonce, self.block.merkle_root)
+        self.assertEqual(h, block.hash())
+        # ...but no longer matches the committed root
+        self.assertNotEqual(block.merkle_root, block.compute_merkle_root())
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            self.block.nonce = 1
+        with self.assertRaises(AttributeError):
+            self.block.txs[0].signature = 1
+        with self.assertRaises(AttributeError):
+            self.block.txs[0].outputs[0].amount = 100.0
+
+    def test_tx_proof(self):
+        for i, tx in enumerate(self.block.txs):
+            proof = self.block.tx_proof(i)
+            self.assertTrue(verify_proof(tx.txid(), proof, self.block.merkle_root))
+            self.assertEqual(tx.txid(), hash_bytes(tx.encoded()))
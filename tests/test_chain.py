@@ -0,0 +1,191 @@
+import unittest
+from unittest import mock
+
+import jocoin.crypto as jc
+import jocoin.signature as signature
+from jocoin.chain import BlockChain, InvalidBlockException
+from jocoin.blockstruct import BlockStruct
+from jocoin.serialization import serialize, deserialize
+from jocoin.tx import Tx, TxOutput, COINBASE_AMT
+from jocoin.user import make_tx_with_fee
+
+
+@mock.patch("jocoin.chain.DIFFICULTY", 1 << 256)
+class TestChain(unittest.TestCase):
+    def setUp(self):
+        self.alice = jc.gen_keys(256)
+        self.bob = jc.gen_keys(256)
+
+    def next_block(self, chain, txs, miner):
+        last = chain.last_block()
+        return BlockStruct(last.id + 1, last.hash(), txs + [Tx.coinbase(miner["pubkey"])], 0)
+
+    def transfer(self, chain, sender, receiver, amount, fee=0.0):
+        inputs = chain.valid_inputs_for(sender["pubkey"])
+        outputs = [TxOutput(receiver["pubkey"], amount)]
+        return make_tx_with_fee(inputs, sender["privkey"], sender["pubkey"], outputs, fee)
+
+    def test_holdings(self):
+        chain = BlockChain.empty()
+        self.assertTrue(chain.add_block(self.next_block(chain, [], self.alice)))
+        tx = self.transfer(chain, self.alice, self.bob, 4.0, fee=1.0)
+        self.assertTrue(chain.add_block(self.next_block(chain, [tx], self.bob)))
+        holdings = chain.holdings()
+        self.assertEqual(holdings[self.alice["pubkey"]], COINBASE_AMT - 5.0)
+        # Bob gets the transfer, the coinbase and the fee
+        self.assertEqual(holdings[self.bob["pubkey"]], 4.0 + COINBASE_AMT + 1.0)
+        for key in [self.alice, self.bob]:
+            self.assertEqual(chain.holdings_for(key["pubkey"]), holdings[key["pubkey"]])
+        fee_inputs = [i for i, amt in chain.valid_inputs_for(self.bob["pubkey"]) if i.tx_out_index == BlockChain.FEE_INDEX]
+        self.assertEqual(len(fee_inputs), 1)
+
+    def test_spent_inputs_rejected(self):
+        chain = BlockChain.empty()
+        chain.add_block(self.next_block(chain, [], self.alice))
+        tx = self.transfer(chain, self.alice, self.bob, 4.0)
+        chain.add_block(self.next_block(chain, [tx], self.alice))
+        self.assertFalse(chain.add_block(self.next_block(chain, [tx], self.alice)))
+
+    def test_double_spend_in_block_rejected(self):
+        chain = BlockChain.empty()
+        chain.add_block(self.next_block(chain, [], self.alice))
+        tx1 = self.transfer(chain, self.alice, self.bob, 4.0)
+        tx2 = self.transfer(chain, self.alice, self.bob, 5.0)
+        with self.assertRaises(InvalidBlockException):
+            chain.validate_block(self.next_block(chain, [tx1, tx2], self.alice))
+
+    def test_duplicated_tail_rejected(self):
+        # CVE-2012-2459: repeating the last txs must not give a block with
+        #   the same header (and so the same hash) as the original
+        chain = BlockChain.empty()
+        chain.add_block(self.next_block(chain, [], self.alice))
+        tx = self.transfer(chain, self.alice, self.bob, 4.0)
+        block = self.next_block(chain, [tx], self.alice)
+        last = chain.last_block()
+        mutated = BlockStruct(block.id, block.last_hash, list(block.txs) + [block.txs[-1]], 0, block.merkle_root)
+        self.assertNotEqual(mutated.compute_merkle_root(), block.merkle_root)
+        self.assertEqual(mutated.hash(), block.hash())
+        with self.assertRaises(InvalidBlockException):
+            chain.check_block(mutated)
+        duplicate = BlockStruct(block.id, last.hash(), [tx, tx, Tx.coinbase(self.alice["pubkey"])], 1)
+        with self.assertRaises(InvalidBlockException):
+            chain.check_block(duplicate)
+
+    def test_forged_body_does_not_block_real_block(self):
+        chain = BlockChain.empty()
+        chain.add_block(self.next_block(chain, [], self.alice))
+        tx = self.transfer(chain, self.alice, self.bob, 4.0)
+        block = self.next_block(chain, [tx], self.alice)
+        forged = BlockStruct(block.id, block.last_hash, block.txs[1:], block.nonce, block.merkle_root)
+        self.assertEqual(forged.hash(), block.hash())
+        self.assertFalse(chain.add_block(forged))
+        self.assertTrue(chain.add_block(block))
+        self.assertEqual(chain.current_hash, block.hash())
+
+    def test_single_coinbase_last(self):
+        chain = BlockChain.empty()
+        last = chain.last_block()
+        coinbase = Tx.coinbase(self.alice["pubkey"])
+        for txs in ([], [coinbase, coinbase], [coinbase, Tx.coinbase(self.bob["pubkey"])]):
+            with self.assertRaises(InvalidBlockException):
+                chain.check_block(BlockStruct(last.id + 1, last.hash(), txs, 0))
+        chain.add_block(self.next_block(chain, [], self.alice))
+        tx = self.transfer(chain, self.alice, self.bob, 4.0)
+        last = chain.last_block()
+        with self.assertRaises(InvalidBlockException):
+            chain.check_block(BlockStruct(last.id + 1, last.hash(), [coinbase, tx], 0))
+
+    def test_known_txs_skip_signature_checks(self):
+        chain = BlockChain.empty()
+        chain.add_block(self.next_block(chain, [], self.alice))
+        tx = self.transfer(chain, self.alice, self.bob, 4.0)
+        # As when the tx entered the tx pool
+        chain.validate_tx(tx)
+        block = self.next_block(chain, [tx], self.alice)
+        hits = signature.verified.hits
+        with mock.patch("jocoin.tx.is_valid_signature", side_effect=AssertionError("RSA work")):
+            self.assertTrue(chain.add_block(block))
+        self.assertGreater(signature.verified.hits, hits)
+
+    def test_revalidation_matches(self):
+        chain = BlockChain.empty()
+        chain.add_block(self.next_block(chain, [], self.alice))
+        chain.add_block(self.next_block(chain, [self.transfer(chain, self.alice, self.bob, 2.5, fee=0.5)], self.bob))
+        copy = BlockChain.from_json(deserialize(serialize(chain)))
+        self.assertEqual(copy.utxos, chain.utxos)
+        self.assertEqual(copy.current_hash, chain.current_hash)
+
+
+class TestForks(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("jocoin.chain.DIFFICULTY", 1 << 256)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.alice = jc.gen_keys(256)
+        self.bob = jc.gen_keys(256)
+        self.chain = BlockChain.empty()
+        self.add(self.block_on(self.chain.current_hash, [], self.alice))
+
+    def block_on(self, parent_hash, txs, miner):
+        parent = self.chain.blocks[parent_hash]
+        return BlockStruct(parent.id + 1, parent_hash, txs + [Tx.coinbase(miner["pubkey"])], 0)
+
+    def add(self, block):
+        self.assertTrue(self.chain.add_block(block))
+        return block.hash()
+
+    def spend(self, sender, receiver, amount):
+        inputs = self.chain.valid_inputs_for(sender["pubkey"])
+        return make_tx_with_fee(inputs, sender["privkey"], sender["pubkey"], [TxOutput(receiver["pubkey"], amount)], 0.5)
+
+    def replay(self):
+        # A chain built from scratch along the current main chain
+        blocks = {h: self.chain.blocks[h] for h in self.chain.hash_iter()}
+        return BlockChain(self.chain.current_hash, blocks)
+
+    def test_side_branch_kept_until_it_has_more_work(self):
+        fork = self.chain.current_hash
+        a1 = self.add(self.block_on(fork, [self.spend(self.alice, self.bob, 3.0)], self.alice))
+        b1 = self.add(self.block_on(fork, [], self.bob))
+        self.assertEqual(self.chain.current_hash, a1)
+        self.assertIn(b1, self.chain.blocks)
+        b2 = self.add(self.block_on(b1, [], self.bob))
+        self.assertEqual(self.chain.current_hash, b2)
+        self.assertEqual(self.chain.utxos, self.replay().utxos)
+        # And back again
+        a2 = self.add(self.block_on(a1, [], self.alice))
+        a3 = self.add(self.block_on(a2, [], self.alice))
+        self.assertEqual(self.chain.current_hash, a3)
+        self.assertEqual(self.chain.utxos, self.replay().utxos)
+        self.assertEqual(self.chain.holdings_for(self.bob["pubkey"]), self.chain.holdings()[self.bob["pubkey"]])
+
+    def test_rebuilt_undo_data(self):
+        self.chain.UNDO_DEPTH = 0
+        fork = self.chain.current_hash
+        a1 = self.add(self.block_on(fork, [self.spend(self.alice, self.bob, 3.0)], self.bob))
+        a2 = self.add(self.block_on(a1, [self.spend(self.bob, self.alice, 10.0)], self.alice))
+        b1 = self.add(self.block_on(fork, [], self.bob))
+        b2 = self.add(self.block_on(b1, [], self.bob))
+        b3 = self.add(self.block_on(b2, [], self.bob))
+        self.assertEqual(self.chain.current_hash, b3)
+        self.assertEqual(self.chain.utxos, self.replay().utxos)
+
+    def test_orphans_connect_when_parent_arrives(self):
+        b1 = self.block_on(self.chain.current_hash, [], self.bob)
+        b2 = BlockStruct(b1.id + 1, b1.hash(), [Tx.coinbase(self.bob["pubkey"])], 0)
+        self.assertFalse(self.chain.add_block(b2))
+        self.add(b1)
+        self.assertEqual(self.chain.current_hash, b2.hash())
+
+    def test_invalid_branch_rolls_back(self):
+        fork = self.chain.current_hash
+        tx = self.spend(self.alice, self.bob, 3.0)
+        a1 = self.add(self.block_on(fork, [tx], self.alice))
+        b1 = self.add(self.block_on(fork, [], self.bob))
+        utxos = dict(self.chain.utxos)
+        # Spends an output that only exists on the other branch
+        b2 = self.block_on(b1, [self.spend(self.bob, self.alice, 1.0)], self.bob)
+        self.assertFalse(self.chain.add_block(b2))
+        self.assertEqual(self.chain.current_hash, a1)
+        self.assertEqual(self.chain.utxos, utxos)
+        self.assertFalse(self.chain.add_block(self.block_on(b2.hash(), [], self.bob)))
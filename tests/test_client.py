@@ -0,0 +1,300 @@
+import threading
+import unittest
+from unittest import mock
+
+import jocoin.crypto as jc
+import jocoin.network as nw
+from jocoin.client import Client
+from jocoin.metrics import metrics
+from jocoin.chain import BlockChain
+from jocoin.serialization import serialize, deserialize
+from jocoin.wire import encode_message, decode_message
+from jocoin.blockstruct import BlockStruct
+from jocoin.tx import Tx, TxOutput
+from jocoin.user import make_tx
+from jocoin.sync import SnapshotValidation
+from jocoin.utxosnapshot import UtxoSnapshot, SnapshotError
+
+EASY = 1 << 256
+
+
+class LocalNetwork:
+    # Delivers messages straight to the addressed client, through the
+    # same serialization as the real network
+    def __init__(self, encode=serialize, decode=deserialize):
+        self.clients = {}
+        self.sent = []
+        self.encode = encode
+        self.decode = decode
+
+    def add(self, client):
+        self.clients[client.address] = client
+        client.chain = BlockChain.empty()
+
+    def send_message(self, peer, message_type, raw_data):
+        data = self.encode(raw_data)
+        self.sent.append((message_type, len(data)))
+        response = self.clients[peer].dispatch_incoming_message(message_type, self.decode(data))
+        return self.decode(self.encode(response))
+
+    def send_pipelined(self, peer, requests):
+        return [self.send_message(peer, message_type, raw_data) for message_type, raw_data in requests]
+
+    async def send_message_async(self, peer, message_type, raw_data):
+        return self.send_message(peer, message_type, raw_data)
+
+
+@mock.patch("jocoin.chain.DIFFICULTY", EASY)
+@mock.patch("jocoin.client.DIFFICULTY", EASY)
+class TestGossip(unittest.TestCase):
+    def make_network(self):
+        return LocalNetwork()
+
+    def setUp(self):
+        self.network = self.make_network()
+        patcher = mock.patch("jocoin.network.send_message", self.network.send_message)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("jocoin.network.send_pipelined", self.network.send_pipelined)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("jocoin.network.send_message_async", self.network.send_message_async)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Pulls triggered by incoming messages run in the caller's thread
+        patcher = mock.patch("jocoin.client.Thread", InlineThread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.keys = [jc.gen_keys(256) for i in range(2)]
+        self.a = self.make_client(0, ("a", 1), [("b", 2)])
+        self.b = self.make_client(1, ("b", 2), [("a", 1)])
+
+    def make_client(self, i, address, peers):
+        client = Client(self.keys[i]["pubkey"], self.keys[i]["privkey"], peers, address)
+        self.network.add(client)
+        return client
+
+    def mine_blocks(self, client, n):
+        for i in range(n):
+            client.keep_mining = True
+            self.assertTrue(client.add_block(client.mine()))
+
+    def test_pulls_missing_blocks(self):
+        self.mine_blocks(self.a, 3)
+        self.b.gossip()
+        self.assertEqual(self.b.chain.current_hash, self.a.chain.current_hash)
+        self.assertEqual(self.b.chain.utxos, self.a.chain.utxos)
+
+    def test_broadcast_is_pulled_by_peers(self):
+        self.mine_blocks(self.a, 2)
+        self.a.broadcast()
+        self.assertEqual(self.b.chain.current_hash, self.a.chain.current_hash)
+
+    def test_sends_only_new_blocks(self):
+        self.mine_blocks(self.a, 20)
+        self.b.gossip()
+        self.mine_blocks(self.a, 1)
+        self.network.sent = []
+        self.b.gossip()
+        self.assertEqual(self.b.chain.current_hash, self.a.chain.current_hash)
+        self.assertEqual([m for m, size in self.network.sent], [nw.INV, nw.GETBLOCKS])
+
+    def test_fork_switches_to_longer_chain(self):
+        self.mine_blocks(self.a, 2)
+        self.b.gossip()
+        self.mine_blocks(self.a, 2)
+        self.mine_blocks(self.b, 1)
+        self.b.gossip()
+        self.assertEqual(self.b.chain.current_hash, self.a.chain.current_hash)
+
+    def test_pulls_missing_txs(self):
+        self.mine_blocks(self.a, 1)
+        self.b.gossip()
+        inputs = self.a.chain.valid_inputs_for(self.a.pubkey)
+        tx = make_tx(inputs, self.a.privkey, self.a.pubkey, [TxOutput(self.b.pubkey, 1.0)])
+        self.assertTrue(self.a.add_tx(tx))
+        self.b.gossip()
+        self.assertEqual(self.b.mempool.txids(), [tx.txid()])
+
+    def test_mempool_follows_chain(self):
+        self.mine_blocks(self.a, 1)
+        self.b.gossip()
+        inputs = self.a.chain.valid_inputs_for(self.a.pubkey)
+        tx = make_tx(inputs, self.a.privkey, self.a.pubkey, [TxOutput(self.b.pubkey, 1.0)])
+        self.assertTrue(self.a.add_tx(tx))
+        # A second spend of the same output is a conflict
+        conflict = make_tx(inputs, self.a.privkey, self.a.pubkey, [TxOutput(self.b.pubkey, 2.0)])
+        self.assertFalse(self.a.add_tx(conflict))
+        self.mine_blocks(self.a, 1)
+        self.assertEqual(len(self.a.mempool), 0)
+        # A longer branch without the tx puts it back in the pool
+        self.mine_blocks(self.b, 2)
+        self.a.gossip()
+        self.assertEqual(self.a.chain.current_hash, self.b.chain.current_hash)
+        self.assertEqual(self.a.mempool.txids(), [tx.txid()])
+
+    def test_new_tx_restarts_mining(self):
+        self.mine_blocks(self.a, 1)
+        self.a.TEMPLATE_DEBOUNCE = 0
+        inputs = self.a.chain.valid_inputs_for(self.a.pubkey)
+        tx = make_tx(inputs, self.a.privkey, self.a.pubkey, [TxOutput(self.b.pubkey, 1.0)])
+        result = []
+        with mock.patch("jocoin.client.DIFFICULTY", 0):
+            # Never finds a block; stops for the new template
+            self.a.keep_mining = True
+            started = threading.Event()
+            emit_txs = self.a.emit_txs
+            self.a.emit_txs = lambda: started.set() or emit_txs()
+            miner = threading.Thread(target=lambda: result.append(self.a.mine()), daemon=True)
+            miner.start()
+            started.wait(5)
+            with self.a.chain_lock:
+                self.a.add_tx(tx)
+            miner.join(5)
+        self.assertFalse(miner.is_alive())
+        self.assertEqual(result, [None])
+        self.mine_blocks(self.a, 1)
+        self.assertIn(tx, self.a.chain.last_block().txs)
+
+    def test_queries_do_not_wait_for_chain_lock(self):
+        self.mine_blocks(self.a, 2)
+        result = []
+        with self.a.chain_lock:
+            query = threading.Thread(target=lambda: result.append(self.a.dispatch_incoming_message(nw.BALANCE, list(self.a.pubkey))))
+            query.start()
+            query.join(5)
+        self.assertEqual(result, [self.a.chain.holdings_for(self.a.pubkey)])
+
+    def test_address_and_history_pages(self):
+        self.mine_blocks(self.a, 3)
+        self.a.chain.enable_address_index()
+        self.a.publish_snapshot()
+        page = nw.request_address(("a", 1), self.a.pubkey, offset=1, limit=1)
+        self.assertEqual(page["balance"], self.a.chain.holdings_for(self.a.pubkey))
+        self.assertEqual(page["total"], 3)
+        self.assertEqual(len(page["outputs"]), 1)
+        page = nw.request_history(("a", 1), self.a.pubkey, offset=1)
+        self.assertEqual(page["total"], 3)
+        hashes = list(self.a.chain.hash_iter())[::-1][2:]
+        self.assertEqual([(entry["block_hash"], entry["height"], entry["tx_index"]) for entry in page["txs"]],
+                         [(h, self.a.chain.index[h].height, 0) for h in hashes])
+        self.assertEqual(Tx.from_json(page["txs"][0]["tx"]), self.a.chain.blocks[hashes[0]].txs[0])
+        self.assertIsNone(nw.request_history(("b", 2), self.a.pubkey))
+
+    def test_stats(self):
+        metrics.clear()
+        self.mine_blocks(self.a, 2)
+        self.b.gossip()
+        with self.a.chain_lock:
+            # Answered even while the chain lock is held
+            result = []
+            query = threading.Thread(target=lambda: result.append(nw.request_stats(("a", 1))))
+            query.start()
+            query.join(5)
+        stats = result[0]
+        self.assertEqual(stats["height"], self.a.chain.height())
+        self.assertGreater(stats["mining"]["hashes"], 0)
+        self.assertEqual(stats["mempool"]["txs"], 0)
+        self.assertIn("message.INV", stats["histograms"])
+
+    def test_fetches_in_batches(self):
+        self.mine_blocks(self.a, 5)
+        self.b.BLOCK_BATCH = 2
+        merged = []
+        merge_blocks = self.b.merge_blocks
+        self.b.merge_blocks = lambda blocks: merged.append(len(blocks)) or merge_blocks(blocks)
+        self.b.gossip()
+        self.assertEqual(self.b.chain.current_hash, self.a.chain.current_hash)
+        self.assertEqual(merged, [2, 2, 1])
+
+    def test_initial_sync_retries_failed_fetch(self):
+        self.mine_blocks(self.a, 2)
+        send_pipelined = nw.send_pipelined
+        failures = [ConnectionError("dropped")]
+        def flaky_send_pipelined(*args):
+            if failures:
+                raise failures.pop()
+            return send_pipelined(*args)
+        with mock.patch("jocoin.network.send_pipelined", flaky_send_pipelined), mock.patch("jocoin.client.time.sleep"):
+            self.b.get_initial_state()
+        self.assertEqual(failures, [])
+        self.assertEqual(self.b.chain.current_hash, self.a.chain.current_hash)
+
+    def test_headers_first_sync(self):
+        c = self.make_client(0, ("c", 3), [("a", 1), ("b", 2)])
+        self.mine_blocks(self.a, 7)
+        self.b.gossip()
+        c.HEADER_BATCH = 3
+        c.HEADERS_FIRST_MIN = 5
+        requests = []
+        request_block_data = nw.request_block_data
+        def recording_request_block_data(peer, hashes):
+            requests.append((peer, len(hashes)))
+            return request_block_data(peer, hashes)
+        with mock.patch("jocoin.sync.HeaderSync.RANGE_SIZE", 2), mock.patch("jocoin.network.request_block_data", recording_request_block_data):
+            c.get_initial_state()
+        self.assertEqual(c.chain.current_hash, self.a.chain.current_hash)
+        self.assertEqual(c.chain.utxos, self.a.chain.utxos)
+        self.assertEqual(sorted(n for peer, n in requests), [1, 2, 2, 2])
+        self.assertEqual(set(peer for peer, n in requests), {("a", 1), ("b", 2)})
+
+    def test_headers_first_sync_skips_bad_peer(self):
+        c = self.make_client(0, ("c", 3), [("a", 1), ("b", 2)])
+        self.mine_blocks(self.a, 4)
+        self.b.gossip()
+        c.HEADERS_FIRST_MIN = 2
+        request_block_data = nw.request_block_data
+        def forging_request_block_data(peer, hashes):
+            blocks = request_block_data(peer, hashes)
+            if peer == ("b", 2):
+                # Right headers, wrong txs
+                blocks = [BlockStruct(b.id, b.last_hash, b.txs[:-1] + (Tx.coinbase(self.keys[1]["pubkey"]),), b.nonce, b.merkle_root) for b in blocks]
+            return blocks
+        with mock.patch("jocoin.sync.HeaderSync.RANGE_SIZE", 1), mock.patch("jocoin.network.request_block_data", forging_request_block_data):
+            c.get_initial_state()
+        self.assertEqual(c.chain.current_hash, self.a.chain.current_hash)
+
+    def test_snapshot_validation(self):
+        self.mine_blocks(self.a, 5)
+        snapshot = UtxoSnapshot.from_chain(self.a.chain)
+        c = self.make_client(0, ("c", 3), [("a", 1)])
+        c.chain = BlockChain.from_snapshot(snapshot)
+        self.assertEqual(c.stats()["snapshot"], {"base": snapshot.base.hash(), "validated": False})
+        c.snapshot_validation = SnapshotValidation(c, c.peers, snapshot)
+        with mock.patch("jocoin.sync.HeaderSync.RANGE_SIZE", 2):
+            c.snapshot_validation.run()
+        self.assertTrue(c.snapshot_validation.valid)
+        self.assertIsNone(c.chain.snapshot_base)
+        self.assertTrue(c.stats()["snapshot"]["validated"])
+        # Now it can serve the blocks from before the snapshot
+        genesis = list(c.chain.hash_iter())[-1]
+        self.assertEqual(len(c.chain.blocks_after([genesis], 10)), 5)
+
+    def test_tampered_snapshot_fails_validation(self):
+        self.mine_blocks(self.a, 3)
+        snapshot = UtxoSnapshot.from_chain(self.a.chain)
+        output_id, (out_addr, amount) = next(iter(snapshot.utxos.items()))
+        utxos = dict(snapshot.utxos)
+        utxos[output_id] = (out_addr, amount * 2)
+        tampered = UtxoSnapshot(snapshot.headers, snapshot.base, utxos)
+        c = self.make_client(0, ("c", 3), [("a", 1)])
+        c.chain = BlockChain.from_snapshot(tampered)
+        validation = SnapshotValidation(c, c.peers, tampered)
+        with self.assertRaises(SnapshotError):
+            validation.run()
+        self.assertFalse(validation.valid)
+        self.assertIsNotNone(c.chain.snapshot_base)
+
+
+class TestBinaryGossip(TestGossip):
+    def make_network(self):
+        return LocalNetwork(encode_message, decode_message)
+
+
+class InlineThread:
+    def __init__(self, target, args=(), daemon=None):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        self.target(*self.args)
@@ -1,5 +1,5 @@
 import unittest
-from jocoin.crypto import sieve, gen_keys, likely_prime, generate_prime, encrypt, decrypt
+from jocoin.crypto import sieve, gen_keys, likely_prime, generate_prime, generate_primes, passes_trial_division, encrypt, decrypt
 import random
 
 def validate_prime(p):
@@ -37,12 +37,43 @@ class TestCrypto(unittest.TestCase):
         self.assertTrue(decrypt(cypher, pub) == m)
         
 
+    def test_crt_matches_plain_encryption(self):
+        keys = gen_keys(self.BITLENGTH)
+        priv = keys["privkey"]
+        self.assertEqual(len(priv), 7)
+        for m in [0, 1, priv[0] - 1] + [random.randint(0, priv[0] - 1) for i in range(100)]:
+            self.assertEqual(encrypt(m, priv), encrypt(m, priv[:2]))
+
+    def test_old_format_key(self):
+        keys = gen_keys(self.BITLENGTH)
+        # As read from an old keyfile
+        priv = list(keys["privkey"][:2])
+        m = random.randint(0, priv[0] - 1)
+        self.assertEqual(decrypt(encrypt(m, priv), keys["pubkey"]), m)
+
     def test_prime_generation(self):
         for i in range(1000):
             self.assertTrue(validate_prime(generate_prime(16)))
 
     def test_likely_prime(self):
         self.assertFalse(likely_prime(221))
+        # Carmichael numbers fool the Fermat test, but not this one
+        self.assertFalse(likely_prime(561))
+        # p - 1 has a large power of two in it
+        self.assertTrue(likely_prime(65537))
+
+    def test_trial_division(self):
+        self.assertTrue(passes_trial_division(97))
+        self.assertFalse(passes_trial_division(91))
+        self.assertFalse(passes_trial_division(1999 * 100003))
+        self.assertTrue(passes_trial_division(100003))
+
+    def test_parallel_prime_generation(self):
+        primes = generate_primes(32, 3, workers=2)
+        self.assertEqual(len(set(primes)), 3)
+        for p in primes:
+            self.assertEqual(p.bit_length(), 32)
+            self.assertTrue(validate_prime(p))
 
     def test_sieve(self):
         primes = [2,3,5,7,11,13,17,19,23,29,31,37,41,43,47,53,59,61,67,71,73,79,83,89,97]
@@ -0,0 +1,93 @@
+import unittest
+from threading import Thread
+from unittest import mock
+
+import jocoin.crypto as jc
+import jocoin.network as nw
+from jocoin.blockstruct import BlockStruct
+from jocoin.encoding import Writer, Reader, DecodeError
+from jocoin.serialization import serialize
+from jocoin.tx import Tx, TxInput, TxOutput
+from jocoin.user import make_tx_with_fee
+from jocoin.wire import encode_message, decode_message
+
+
+class TestEncoding(unittest.TestCase):
+    def setUp(self):
+        self.keys = jc.gen_keys(256)
+        inputs = [(TxInput(1234, 0, 0), 10.0), (TxInput(5678, 1, -1), 0.5)]
+        self.tx = make_tx_with_fee(inputs, self.keys["privkey"], self.keys["pubkey"], [TxOutput(self.keys["pubkey"], 2.5)], 0.25)
+        self.block = BlockStruct(2, BlockStruct.genesis().hash(), [self.tx, Tx.coinbase(self.keys["pubkey"])], 2 ** 40)
+
+    def test_primitives(self):
+        w = Writer()
+        values = [0, 1, 127, 128, 300, 2 ** 64, 2 ** 300]
+        for v in values:
+            w.varint(v)
+            w.bigint(v)
+        for v in [0, -1, 1, -64, 64, -2 ** 70]:
+            w.signed(v)
+        w.double(0.1)
+        w.str_("joé")
+        w.optional(w.hash, None)
+        w.optional(w.hash, 2 ** 255)
+        r = Reader(w.getvalue())
+        for v in values:
+            self.assertEqual(r.varint(), v)
+            self.assertEqual(r.bigint(), v)
+        for v in [0, -1, 1, -64, 64, -2 ** 70]:
+            self.assertEqual(r.signed(), v)
+        self.assertEqual(r.double(), 0.1)
+        self.assertEqual(r.str_(), "joé")
+        self.assertIsNone(r.optional(r.hash))
+        self.assertEqual(r.optional(r.hash), 2 ** 255)
+        self.assertTrue(r.at_end())
+
+    def test_tx_round_trip(self):
+        for tx in [self.tx, Tx.coinbase(self.keys["pubkey"])]:
+            decoded = Tx.decode(Reader(tx.encoded()))
+            self.assertEqual(decoded.field_values(), tx.field_values())
+            self.assertEqual(decoded.txid(), tx.txid())
+        self.assertLess(self.tx.size(), len(serialize(self.tx)))
+
+    def test_block_round_trip(self):
+        for block in [self.block, BlockStruct.genesis()]:
+            decoded = BlockStruct.from_bytes(block.encoded())
+            self.assertEqual(decoded, block)
+            self.assertEqual(decoded.hash(), block.hash())
+
+    def test_truncated_and_unknown_version(self):
+        data = self.block.encoded()
+        with self.assertRaises(DecodeError):
+            BlockStruct.from_bytes(data[:-1])
+        with self.assertRaises(DecodeError):
+            BlockStruct.from_bytes(data + b"\x00")
+        with self.assertRaises(DecodeError):
+            BlockStruct.from_bytes(b"\x02" + data[1:])
+
+    def test_message_round_trip(self):
+        message = {"tip": 2 ** 255, "height": 7, "txs": [self.tx.txid()], "peers": [("a", 1)], "ok": True, "none": None}
+        self.assertEqual(decode_message(encode_message(message)), {**message, "peers": [["a", 1]]})
+        blocks = decode_message(encode_message([self.block]))
+        self.assertEqual(BlockStruct.from_json(blocks[0]), self.block)
+        headers = decode_message(encode_message([self.block.header()]))
+        self.assertEqual(headers[0].hash(), self.block.hash())
+
+
+class EchoClient:
+    def dispatch_incoming_message(self, message, data):
+        return [message, data]
+
+
+class TestWire(unittest.TestCase):
+    def setUp(self):
+        self.listener = nw.JoCoinListener(EchoClient(), ("localhost", 0))
+        self.peer = self.listener.address
+        Thread(target=self.listener.start, daemon=True).start()
+        self.addCleanup(self.listener.stop)
+
+    def test_json_and_binary(self):
+        data = {"locator": [2 ** 255, 3], "limit": 500}
+        self.assertEqual(nw.send_message(self.peer, nw.GETBLOCKS, data), [nw.GETBLOCKS, {"locator": [2 ** 255, 3], "limit": 500}])
+        with mock.patch("jocoin.network.BINARY_WIRE", True):
+            self.assertEqual(nw.send_message(self.peer, nw.GETBLOCKS, data), [nw.GETBLOCKS, data])
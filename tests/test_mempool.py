@@ -0,0 +1,47 @@
+import unittest
+
+from jocoin.blockstruct import BlockStruct
+from jocoin.mempool import Mempool
+from jocoin.tx import Tx, TxInput, TxOutput, InvalidTransactionException
+
+KEY = (3233, 17)
+
+
+def tx(*outpoints, amount=1.0):
+    # Signatures aren't checked by the pool itself
+    return Tx(KEY, 1, [TxInput(*o) for o in outpoints], [TxOutput("someone", amount)])
+
+
+class TestMempool(unittest.TestCase):
+    def test_conflicts_rejected(self):
+        pool = Mempool()
+        a = tx((1, 0, 0), (1, 0, 1))
+        self.assertTrue(pool.add(a, 0.0))
+        b = tx((1, 0, 1), amount=2.0)
+        self.assertEqual(pool.conflicts(b), {a.txid()})
+        with self.assertRaises(InvalidTransactionException):
+            pool.add(b, 1.0)
+        pool.remove(a.txid())
+        self.assertTrue(pool.add(b, 1.0))
+
+    def test_evicts_lowest_fee_rate(self):
+        txs = [tx((i, 0, 0)) for i in range(4)]
+        pool = Mempool(max_bytes=3 * txs[0].size())
+        for fee, t in zip([0.3, 0.1, 0.4, 0.2], txs):
+            pool.add(t, fee)
+        self.assertEqual(len(pool), 3)
+        self.assertNotIn(txs[1].txid(), pool)
+        self.assertEqual(pool.size, 3 * txs[0].size())
+        self.assertEqual(pool.by_fee_rate(), [txs[2], txs[0], txs[3]])
+        # Too cheap to get in at all
+        self.assertFalse(pool.add(tx((9, 0, 0)), 0.0))
+
+    def test_remove_for_block(self):
+        pool = Mempool()
+        included, conflicting, unrelated = tx((1, 0, 0)), tx((2, 0, 0)), tx((3, 0, 0))
+        for t in [included, conflicting, unrelated]:
+            pool.add(t, 0.0)
+        block = BlockStruct(2, 0, [included, tx((2, 0, 0), amount=5.0), Tx.coinbase(KEY)], 0)
+        pool.remove_for_block(block)
+        self.assertEqual(pool.txids(), [unrelated.txid()])
+        self.assertEqual(list(pool.spends), [(3, 0, 0)])
@@ -0,0 +1,35 @@
+import unittest
+
+from jocoin.merkle import merkle_root, merkle_proof, verify_proof, hash_pair, hash_leaf, EMPTY_ROOT
+
+
+class TestMerkle(unittest.TestCase):
+    def test_small_roots(self):
+        self.assertEqual(merkle_root([]), EMPTY_ROOT)
+        self.assertEqual(merkle_root([5]), hash_leaf(5))
+        self.assertEqual(merkle_root([1, 2]), hash_pair(hash_leaf(1), hash_leaf(2)))
+        self.assertEqual(merkle_root([1, 2, 3]), hash_pair(hash_pair(hash_leaf(1), hash_leaf(2)), hash_leaf(3)))
+
+    def test_duplicated_tail_changes_root(self):
+        self.assertNotEqual(merkle_root([1, 2, 3]), merkle_root([1, 2, 3, 3]))
+        self.assertNotEqual(merkle_root([1, 2, 3, 4, 5, 6]), merkle_root([1, 2, 3, 4, 5, 6, 5, 6]))
+
+    def test_inner_node_is_not_a_leaf(self):
+        leaves = [1, 2, 3, 4]
+        root = merkle_root(leaves)
+        inner = hash_pair(hash_leaf(1), hash_leaf(2))
+        proof = merkle_proof(leaves, 0)[1:]
+        self.assertFalse(verify_proof(inner, proof, root))
+
+    def test_proofs(self):
+        for n in range(1, 18):
+            leaves = list(range(100, 100 + n))
+            root = merkle_root(leaves)
+            for i, leaf in enumerate(leaves):
+                proof = merkle_proof(leaves, i)
+                self.assertTrue(verify_proof(leaf, proof, root))
+                self.assertFalse(verify_proof(leaf + 1, proof, root))
+
+    def test_proof_out_of_range(self):
+        with self.assertRaises(IndexError):
+            merkle_proof([1, 2], 2)
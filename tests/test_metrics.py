@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+
+from jocoin.metrics import Histogram, Metrics, TimedLock, LATENCY_BOUNDS, SIZE_BOUNDS
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram(SIZE_BOUNDS)
+        for size in [50] * 98 + [5000, 2000000]:
+            histogram.observe(size)
+        stats = histogram.stats()
+        self.assertEqual(stats["count"], 100)
+        # Upper bounds of the buckets they fall in
+        self.assertEqual(stats["p50"], 100)
+        self.assertEqual(stats["p99"], 10000)
+        self.assertEqual(stats["max"], 2000000)
+        self.assertEqual(stats["buckets"]["<=100"], 98)
+        self.assertEqual(stats["buckets"]["<=10000000"], 1)
+
+    def test_above_last_bound(self):
+        histogram = Histogram(LATENCY_BOUNDS)
+        histogram.observe(60)
+        self.assertEqual(histogram.stats()["buckets"]["more"], 1)
+        self.assertEqual(histogram.percentile(0.99), 60)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counters_and_timers(self):
+        metrics = Metrics()
+        metrics.count("blocks.found")
+        metrics.count("blocks.found", 2)
+        with metrics.timed("message.INV"):
+            pass
+        stats = metrics.stats()
+        self.assertEqual(stats["counters"], {"blocks.found": 3})
+        self.assertEqual(stats["histograms"]["message.INV"]["count"], 1)
+
+    def test_lock_records_only_contention(self):
+        metrics = Metrics()
+        lock = TimedLock(threading.RLock(), metrics, "chain_lock")
+        with lock:
+            with lock:
+                pass
+        self.assertNotIn("chain_lock.wait", metrics.stats()["histograms"])
+        lock.acquire()
+        waiter = threading.Thread(target=lambda: lock.acquire() and lock.release())
+        waiter.start()
+        time.sleep(0.05)
+        lock.release()
+        waiter.join(5)
+        wait = metrics.stats()["histograms"]["chain_lock.wait"]
+        self.assertEqual(wait["count"], 1)
+        self.assertGreaterEqual(wait["max"], 0.04)
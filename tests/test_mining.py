@@ -0,0 +1,26 @@
+import time
+import unittest
+
+from jocoin.blockstruct import BlockStruct
+from jocoin.mining import MiningPool
+
+
+class TestMiningPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = MiningPool(2)
+        self.pool.start()
+        self.block = BlockStruct(2, BlockStruct.genesis().hash(), [], 0)
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_finds_valid_nonce(self):
+        hash_max = 1 << 250
+        for i in range(3):
+            nonce = self.pool.mine(self.block, hash_max, lambda: True)
+            self.assertTrue(self.block.with_nonce(nonce).hash() < hash_max)
+
+    def test_cancel(self):
+        deadline = time.time() + 0.5
+        self.assertIsNone(self.pool.mine(self.block, 0, lambda: time.time() < deadline))
+        self.assertTrue(self.pool.hashes.value > 0)
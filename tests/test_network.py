@@ -0,0 +1,87 @@
+import socket
+import time
+import unittest
+from threading import Thread, Event
+from unittest import mock
+
+import jocoin.network as nw
+
+
+class SlowClient:
+    # Echoes messages back, holding GOSSIP until released
+    def __init__(self):
+        self.release = Event()
+
+    def dispatch_incoming_message(self, message, data):
+        if message == nw.GOSSIP:
+            self.release.wait(5)
+        return [message, data]
+
+
+class TestListener(unittest.TestCase):
+    def setUp(self):
+        self.client = SlowClient()
+        self.listener = nw.JoCoinListener(self.client, ("localhost", 0))
+        self.peer = self.listener.address
+        Thread(target=self.listener.start, daemon=True).start()
+        self.addCleanup(self.listener.stop)
+        self.addCleanup(self.client.release.set)
+
+    def test_half_sent_message_does_not_block(self):
+        with socket.create_connection(self.peer) as slow:
+            slow.sendall(b"GOSSIP\n{\"peers\": ")
+            self.assertEqual(nw.send_message(self.peer, nw.BALANCE, [1, 2]), [nw.BALANCE, [1, 2]])
+
+    def test_slow_handler_does_not_block(self):
+        gossip = Thread(target=nw.send_message, args=(self.peer, nw.GOSSIP, {}), daemon=True)
+        gossip.start()
+        self.assertEqual(nw.send_message(self.peer, nw.INPUTS, [1, 2]), [nw.INPUTS, [1, 2]])
+        self.assertTrue(gossip.is_alive())
+        self.client.release.set()
+        gossip.join(5)
+
+    def test_stalled_connection_is_dropped(self):
+        with mock.patch("jocoin.network.IO_TIMEOUT", 0.1):
+            with socket.create_connection(self.peer) as stalled:
+                stalled.settimeout(5)
+                stalled.sendall(b"BALANCE\n")
+                self.assertEqual(stalled.recv(1), b"")
+
+    def test_send_to_all(self):
+        with socket.socket() as closed:
+            closed.bind(("localhost", 0))
+            unreachable = closed.getsockname()
+        results = nw.send_to_all([self.peer, unreachable], nw.INV, {"tip": 3})
+        self.assertEqual(results[0], (self.peer, [nw.INV, {"tip": 3}]))
+        self.assertEqual(results[1][0], unreachable)
+        self.assertIsInstance(results[1][1], OSError)
+
+    def test_reuses_connections(self):
+        for i in range(3):
+            self.assertEqual(nw.send_message(self.peer, nw.BALANCE, [i]), [nw.BALANCE, [i]])
+        self.assertEqual(len(self.listener.connections), 1)
+
+    def test_pipelined_replies_in_order(self):
+        requests = [(nw.BALANCE, [i]) for i in range(20)]
+        self.assertEqual(nw.send_pipelined(self.peer, requests), [[nw.BALANCE, [i]] for i in range(20)])
+        with mock.patch("jocoin.network.BINARY_WIRE", True):
+            self.assertEqual(nw.send_pipelined(self.peer, requests), [[nw.BALANCE, [i]] for i in range(20)])
+
+    def test_retries_closed_connection(self):
+        nw.send_message(self.peer, nw.BALANCE, [1])
+        # The node drops the connection while it sits in the pool
+        for conn in nw.pool.idle[self.peer]:
+            conn.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(nw.send_message(self.peer, nw.BALANCE, [2]), [nw.BALANCE, [2]])
+
+    def test_line_message(self):
+        # As sent by nodes from before framing
+        with socket.create_connection(self.peer) as sock:
+            sock.sendall(b"BALANCE\n[1, 2]\n")
+            self.assertEqual(nw.readline(sock), '["BALANCE", [1, 2]]')
+            self.assertEqual(sock.recv(1), b"")
+
+    def test_many_concurrent_requests(self):
+        with mock.patch("jocoin.network.BINARY_WIRE", True):
+            results = nw.send_to_all([self.peer] * 200, nw.BALANCE, [1, 2])
+        self.assertEqual([response for peer, response in results], [[nw.BALANCE, [1, 2]]] * 200)
@@ -1,5 +1,5 @@
 import unittest
-from jocoin.signature import create_signature, is_valid_signature
+from jocoin.signature import create_signature, is_valid_signature, SignatureCache
 from jocoin.crypto import gen_keys
 import random
 import string
@@ -17,3 +17,15 @@ class TestSignature(unittest.TestCase):
             s = create_signature(m, keys["privkey"])
             self.assertTrue(is_valid_signature(m, s, keys["pubkey"]))
 
+
+class TestSignatureCache(unittest.TestCase):
+    def test_lru(self):
+        cache = SignatureCache(2)
+        cache.add(1)
+        cache.add(2)
+        self.assertIn(1, cache)
+        cache.add(3)
+        self.assertNotIn(2, cache)
+        self.assertIn(1, cache)
+        self.assertIn(3, cache)
+        self.assertEqual(cache.stats(), {"size": 2, "hits": 3, "misses": 1})
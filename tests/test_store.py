@@ -0,0 +1,110 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import jocoin.crypto as jc
+from jocoin.chain import BlockChain
+from jocoin.serialization import serialize
+from jocoin.blockstruct import BlockStruct
+from jocoin.store import BlockStore
+from jocoin.tx import Tx, TxOutput
+from jocoin.user import make_tx
+
+
+@mock.patch("jocoin.chain.DIFFICULTY", 1 << 256)
+class TestBlockStore(unittest.TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.datadir)
+        self.keys = jc.gen_keys(256)
+        self.other = jc.gen_keys(256)
+
+    def grow(self, chain, n):
+        for i in range(n):
+            last = chain.last_block()
+            txs = []
+            inputs = chain.valid_inputs_for(self.keys["pubkey"])
+            if inputs:
+                txs.append(make_tx(inputs, self.keys["privkey"], self.keys["pubkey"], [TxOutput(self.other["pubkey"], 1.0)]))
+            self.assertTrue(chain.add_block(BlockStruct(last.id + 1, last.hash(), txs + [Tx.coinbase(self.keys["pubkey"])], 0)))
+
+    def reopen(self, chain):
+        chain.store.close()
+        return BlockChain.from_store(BlockStore(self.datadir, sync=False))
+
+    def test_restart_resumes_chain(self):
+        chain = BlockChain.from_store(BlockStore(self.datadir, sync=False))
+        self.grow(chain, 5)
+        chain.flush()
+        restarted = self.reopen(chain)
+        self.assertEqual(restarted.current_hash, chain.current_hash)
+        self.assertEqual(restarted.utxos, chain.utxos)
+        self.assertEqual(restarted.last_block(), chain.last_block())
+
+    def test_replays_blocks_after_chainstate(self):
+        chain = BlockChain.from_store(BlockStore(self.datadir, sync=False))
+        self.grow(chain, 3)
+        chain.flush()
+        # No flush: these are re-applied from the block file
+        self.grow(chain, 4)
+        restarted = self.reopen(chain)
+        self.assertEqual(restarted.current_hash, chain.current_hash)
+        self.assertEqual(restarted.utxos, chain.utxos)
+
+    def test_restart_after_reorg(self):
+        chain = BlockChain.from_store(BlockStore(self.datadir, sync=False))
+        self.grow(chain, 2)
+        fork = chain.last_block()
+        self.grow(chain, 2)
+        chain.flush()
+        # A longer branch from the fork, connected after the chain state was saved
+        parent = fork
+        for i in range(3):
+            block = BlockStruct(parent.id + 1, parent.hash(), [Tx.coinbase(self.other["pubkey"])], 0)
+            chain.add_block(block)
+            parent = block
+        self.assertEqual(chain.current_hash, parent.hash())
+        restarted = self.reopen(chain)
+        self.assertEqual(restarted.current_hash, chain.current_hash)
+        self.assertEqual(restarted.utxos, chain.utxos)
+
+    def test_torn_write_truncated(self):
+        chain = BlockChain.from_store(BlockStore(self.datadir, sync=False))
+        self.grow(chain, 3)
+        chain.flush()
+        chain.store.close()
+        data_path = os.path.join(self.datadir, "blocks.dat")
+        size = os.path.getsize(data_path)
+        with open(data_path, "ab") as f:
+            f.write(b"\x00\x00\x10\x00partial")
+        store = BlockStore(self.datadir, sync=False)
+        self.assertEqual(os.path.getsize(data_path), size)
+        self.assertEqual(len(store), 4)
+        self.assertEqual(BlockChain.from_store(store).current_hash, chain.current_hash)
+
+    def test_unindexed_block_recovered(self):
+        chain = BlockChain.from_store(BlockStore(self.datadir, sync=False))
+        self.grow(chain, 2)
+        chain.store.close()
+        # Lose the last index entry, as if we crashed before writing it
+        index_path = os.path.join(self.datadir, "index.dat")
+        with open(index_path, "r+b") as f:
+            f.truncate(os.path.getsize(index_path) - BlockStore.INDEX_RECORD.size - 3)
+        store = BlockStore(self.datadir, sync=False)
+        self.assertIn(chain.current_hash, store)
+        self.assertEqual(store[chain.current_hash], chain.last_block())
+
+    def test_reads_json_records(self):
+        # Stores written before the binary encoding keep working
+        chain = BlockChain.from_store(BlockStore(self.datadir, sync=False))
+        self.grow(chain, 1)
+        last = chain.last_block()
+        block = BlockStruct(last.id + 1, last.hash(), [Tx.coinbase(self.other["pubkey"])], 0)
+        payload = serialize(block).encode('utf-8')
+        chain.store.data.write(BlockStore.RECORD_HEADER.pack(len(payload), hashlib.sha256(payload).digest()) + payload)
+        chain.store.close()
+        store = BlockStore(self.datadir, sync=False)
+        self.assertEqual(store[block.hash()], block)
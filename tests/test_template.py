@@ -0,0 +1,47 @@
+import unittest
+
+from jocoin.blockstruct import BlockStruct
+from jocoin.mempool import Mempool
+from jocoin.template import BlockTemplate
+from jocoin.tx import Tx, TxInput, TxOutput
+
+KEY = (3233, 17)
+
+
+def tx(i):
+    return Tx(KEY, 1, [TxInput(i, 0, 0)], [TxOutput("someone", 1.0)])
+
+
+class TestBlockTemplate(unittest.TestCase):
+    def setUp(self):
+        self.txs = [tx(i) for i in range(5)]
+        self.pool = Mempool()
+        self.template = BlockTemplate(self.pool, max_bytes=3 * self.txs[0].size())
+
+    def add(self, t, fee):
+        self.pool.add(t, fee)
+        return self.template.add(t)
+
+    def test_best_fee_rates_up_to_size(self):
+        for fee, t in zip([0.1, 0.5, 0.3, 0.2], self.txs):
+            self.pool.add(t, fee)
+        self.template.rebuild()
+        self.assertEqual(self.template.txs(), [self.txs[1], self.txs[2], self.txs[3]])
+
+    def test_incremental_add(self):
+        for fee, t in zip([0.1, 0.5, 0.3], self.txs):
+            self.assertTrue(self.add(t, fee))
+        self.assertEqual(self.template.txs(), [self.txs[1], self.txs[2], self.txs[0]])
+        # Pays better than the worst: pushes it out
+        self.assertTrue(self.add(self.txs[3], 0.4))
+        self.assertEqual(self.template.txs(), [self.txs[1], self.txs[3], self.txs[2]])
+        # Pays worse than everything already in
+        self.assertFalse(self.add(self.txs[4], 0.2))
+        self.assertEqual(self.template.size, 3 * self.txs[0].size())
+
+    def test_block(self):
+        self.add(self.txs[0], 0.1)
+        genesis = BlockStruct.genesis()
+        block = self.template.block(genesis, KEY)
+        self.assertEqual(block.last_hash, genesis.hash())
+        self.assertEqual(list(block.txs), [self.txs[0], Tx.coinbase(KEY)])
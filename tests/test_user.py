@@ -0,0 +1,43 @@
+import unittest
+
+from jocoin.tx import TxInput, InvalidTransactionException
+from jocoin.user import find_inputs, select_in_order, select_largest_first, select_exact, select_consolidate, CONSOLIDATE_MAX
+
+
+def coins(*amounts):
+    return [(TxInput(i + 1, 0, 0), amount) for i, amount in enumerate(amounts)]
+
+
+def amounts(inputs):
+    return sorted(amount for i, amount in inputs)
+
+
+class TestCoinSelection(unittest.TestCase):
+    def test_in_order(self):
+        self.assertEqual(amounts(select_in_order(coins(1.0, 1.0, 5.0), 1.5)), [1.0, 1.0])
+
+    def test_largest_first(self):
+        self.assertEqual(amounts(select_largest_first(coins(1.0, 1.0, 5.0), 1.5)), [5.0])
+
+    def test_exact(self):
+        self.assertEqual(amounts(select_exact(coins(5.0, 3.0, 2.5, 0.7, 0.5), 3.2)), [0.7, 2.5])
+        self.assertEqual(amounts(select_exact(coins(0.1, 0.2, 10.0), 0.3)), [0.1, 0.2])
+
+    def test_exact_falls_back_to_largest_first(self):
+        self.assertEqual(amounts(select_exact(coins(*[10.0] * 30 + [4.0]), 15.0)), [10.0, 10.0])
+
+    def test_consolidate(self):
+        inputs = coins(*[0.1] * (CONSOLIDATE_MAX + 10) + [5.0])
+        chosen = select_consolidate(inputs, 3.0)
+        self.assertEqual(len(chosen), CONSOLIDATE_MAX)
+        self.assertEqual(amounts(chosen), [0.1] * (CONSOLIDATE_MAX - 1) + [5.0])
+
+    def test_insufficient_funds(self):
+        for select in [select_in_order, select_largest_first, select_exact, select_consolidate]:
+            with self.assertRaises(InvalidTransactionException):
+                find_inputs(coins(1.0, 2.0), 3.5, select)
+
+    def test_remainder(self):
+        inputs, remainder = find_inputs(coins(1.0, 2.0), 2.5, select_largest_first)
+        self.assertEqual(len(inputs), 2)
+        self.assertAlmostEqual(remainder, 0.5)
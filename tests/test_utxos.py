@@ -0,0 +1,35 @@
+import unittest
+
+from jocoin.utxos import UtxoSet
+
+
+class TestUtxoSet(unittest.TestCase):
+    def test_index_follows_changes(self):
+        utxos = UtxoSet({(1, 0, 0): ("alice", 10.0), (1, 1, 0): ("bob", 4.0)})
+        utxos[(2, 0, 0)] = ("alice", 2.5)
+        self.assertEqual(utxos.balance("alice"), 12.5)
+        self.assertEqual(utxos.pop((1, 0, 0)), ("alice", 10.0))
+        self.assertEqual(utxos.outputs_for("alice"), {(2, 0, 0): 2.5})
+        del utxos[(1, 1, 0)]
+        self.assertEqual(utxos.balance("bob"), 0)
+        self.assertNotIn("bob", utxos.by_addr)
+        self.assertEqual(utxos, {(2, 0, 0): ("alice", 2.5)})
+
+    def test_overwrite_moves_output(self):
+        utxos = UtxoSet()
+        utxos[(1, 0, 0)] = ("alice", 10.0)
+        utxos[(1, 0, 0)] = ("bob", 10.0)
+        self.assertEqual(utxos.balance("alice"), 0)
+        self.assertEqual(utxos.balance("bob"), 10.0)
+
+    def test_snapshot_does_not_change(self):
+        utxos = UtxoSet({(1, 0, 0): ("alice", 10.0), (1, 1, 0): ("bob", 4.0)})
+        snapshot = utxos.snapshot()
+        utxos[(2, 0, 0)] = ("alice", 2.5)
+        del utxos[(1, 1, 0)]
+        utxos[(2, 1, 0)] = ("carol", 1.0)
+        self.assertEqual(snapshot, {"alice": {(1, 0, 0): 10.0}, "bob": {(1, 1, 0): 4.0}})
+        later = utxos.snapshot()
+        del utxos[(1, 0, 0)]
+        self.assertEqual(later, {"alice": {(1, 0, 0): 10.0, (2, 0, 0): 2.5}, "carol": {(2, 1, 0): 1.0}})
+        self.assertEqual(utxos.outputs_for("alice"), {(2, 0, 0): 2.5})
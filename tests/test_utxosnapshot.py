@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import jocoin.crypto as jc
+from jocoin.chain import BlockChain, InvalidBlockException
+from jocoin.blockstruct import BlockStruct
+from jocoin.store import BlockStore
+from jocoin.tx import Tx, TxOutput
+from jocoin.user import make_tx
+from jocoin.utxosnapshot import UtxoSnapshot, SnapshotError
+
+
+class TestUtxoSnapshot(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("jocoin.chain.DIFFICULTY", 1 << 256)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.keys = jc.gen_keys(256)
+        self.other = jc.gen_keys(256)
+        self.chain = BlockChain.empty()
+        self.grow(self.chain, 5)
+
+    def next_block(self, chain):
+        last = chain.last_block()
+        txs = []
+        inputs = chain.valid_inputs_for(self.keys["pubkey"])
+        if inputs:
+            txs.append(make_tx(inputs, self.keys["privkey"], self.keys["pubkey"], [TxOutput(self.other["pubkey"], 1.0)]))
+        return BlockStruct(last.id + 1, last.hash(), txs + [Tx.coinbase(self.keys["pubkey"])], 0)
+
+    def grow(self, chain, n):
+        for i in range(n):
+            self.assertTrue(chain.add_block(self.next_block(chain)))
+
+    def test_round_trip(self):
+        snapshot = UtxoSnapshot.from_chain(self.chain)
+        decoded = UtxoSnapshot.decode(snapshot.encode(), snapshot.commitment)
+        self.assertEqual(decoded.utxos, dict(self.chain.utxos.items()))
+        self.assertEqual(decoded.base, self.chain.last_block())
+        self.assertEqual([h.hash() for h in decoded.headers], list(self.chain.hash_iter())[-2::-1])
+        self.assertEqual(decoded.commitment, snapshot.commitment)
+
+    def test_corrupt_or_unexpected_snapshot_rejected(self):
+        snapshot = UtxoSnapshot.from_chain(self.chain)
+        data = snapshot.encode()
+        with self.assertRaises(SnapshotError):
+            UtxoSnapshot.decode(data[:-40] + bytes(8) + data[-32:])
+        with self.assertRaises(SnapshotError):
+            UtxoSnapshot.decode(data[:-1])
+        with self.assertRaises(SnapshotError):
+            UtxoSnapshot.decode(data, "00" * 32)
+
+    def test_snapshot_at_older_block(self):
+        h = list(self.chain.hash_iter())[2]
+        snapshot = UtxoSnapshot.from_chain(self.chain, h)
+        replayed = BlockChain(h, {b: self.chain.blocks[b] for b in self.chain.hash_iter(h)})
+        self.assertEqual(snapshot.utxos, dict(replayed.utxos.items()))
+        self.assertEqual(len(snapshot.headers), replayed.height())
+
+    def test_chain_from_snapshot_continues(self):
+        old = self.chain.current_hash
+        chain = BlockChain.from_snapshot(UtxoSnapshot.from_chain(self.chain))
+        self.assertEqual(chain.current_hash, old)
+        self.assertEqual(chain.height(), self.chain.height())
+        for i in range(3):
+            block = self.next_block(self.chain)
+            self.assertTrue(self.chain.add_block(block))
+            self.assertTrue(chain.add_block(block))
+        self.assertEqual(chain.utxos, self.chain.utxos)
+        # Blocks from before the snapshot can't be served
+        self.assertEqual(chain.blocks_after([old], 10), [self.chain.blocks[h] for h in list(self.chain.hash_iter())[2::-1]])
+        self.assertEqual(chain.blocks_after([self.chain.index.at_height(1)], 10), [])
+
+    def test_forged_header_rejected(self):
+        snapshot = UtxoSnapshot.from_chain(self.chain)
+        header = snapshot.headers[1]
+        snapshot.headers[1] = BlockStruct(header.id, header.last_hash, [Tx.coinbase(self.other["pubkey"])], 0).header()
+        with self.assertRaises(InvalidBlockException):
+            BlockChain.from_snapshot(snapshot)
+
+    def test_no_reorg_below_snapshot(self):
+        fork = self.chain.index.at_height(2)
+        chain = BlockChain.from_snapshot(UtxoSnapshot.from_chain(self.chain))
+        tip = chain.current_hash
+        parent = self.chain.blocks[fork]
+        for i in range(5):
+            block = BlockStruct(parent.id + 1, parent.hash(), [Tx.coinbase(self.other["pubkey"])], 0)
+            self.assertTrue(self.chain.add_block(block))
+            chain.add_block(block)
+            parent = block
+        self.assertEqual(self.chain.current_hash, parent.hash())
+        self.assertEqual(chain.current_hash, tip)
+
+    def test_address_index_needs_every_block(self):
+        chain = BlockChain.from_snapshot(UtxoSnapshot.from_chain(self.chain))
+        with self.assertRaises(ValueError):
+            chain.enable_address_index()
+
+    def test_resumes_from_stored_snapshot(self):
+        datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, datadir)
+        store = BlockStore(datadir, sync=False)
+        store.write_snapshot(UtxoSnapshot.from_chain(self.chain).encode())
+        chain = BlockChain.from_store(store)
+        for i in range(3):
+            block = self.next_block(self.chain)
+            self.assertTrue(self.chain.add_block(block))
+            self.assertTrue(chain.add_block(block))
+        store.close()
+        chain = BlockChain.from_store(BlockStore(datadir, sync=False))
+        self.assertIsNotNone(chain.snapshot_base)
+        self.assertEqual(chain.current_hash, self.chain.current_hash)
+        self.assertEqual(chain.utxos, self.chain.utxos)
+        # Once the blocks before the snapshot are stored too, it is dropped
+        for h in self.chain.hash_iter():
+            chain.blocks[h] = self.chain.blocks[h]
+        chain.store.drop_snapshot()
+        chain.flush()
+        chain.store.close()
+        self.assertFalse(os.path.exists(os.path.join(datadir, "snapshot.dat")))
+        chain = BlockChain.from_store(BlockStore(datadir, sync=False))
+        self.assertIsNone(chain.snapshot_base)
+        self.assertEqual(chain.current_hash, self.chain.current_hash)
+        self.assertEqual(chain.utxos, self.chain.utxos)
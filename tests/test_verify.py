@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+
+import jocoin.crypto as jc
+from jocoin.blockstruct import BlockStruct
+from jocoin.chain import BlockChain
+from jocoin.tx import Tx, TxInput, TxOutput
+from jocoin.user import make_tx
+from jocoin.verify import VerifierPool
+
+
+class TestVerifierPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = VerifierPool(2)
+        self.pool.start()
+        self.addCleanup(self.pool.stop)
+        self.keys = jc.gen_keys(256)
+
+    def tx(self, i):
+        inputs = [(TxInput(1000 + i, 0, 0), 10.0)]
+        return make_tx(inputs, self.keys["privkey"], self.keys["pubkey"], [TxOutput(self.keys["pubkey"], 1.0)])
+
+    def forge(self, tx):
+        return Tx(tx.from_addr, tx.signature + 1, tx.inputs, tx.outputs)
+
+    def test_verify_in_order(self):
+        txs = [self.tx(i) for i in range(20)]
+        txs[3] = self.forge(txs[3])
+        txs[17] = self.forge(txs[17])
+        expected = [i not in (3, 17) for i in range(20)]
+        self.assertEqual(self.pool.verify(txs), expected)
+        # Small batches stay in this process
+        self.assertEqual(self.pool.verify(txs[:4]), expected[:4])
+
+    @mock.patch("jocoin.chain.DIFFICULTY", 1 << 256)
+    def test_chain_rejects_bad_signature(self):
+        chain = BlockChain.empty()
+        chain.verifier = self.pool
+        last = chain.last_block()
+        chain.add_block(BlockStruct(last.id + 1, last.hash(), [Tx.coinbase(self.keys["pubkey"])], 0))
+        inputs = chain.valid_inputs_for(self.keys["pubkey"])
+        tx = make_tx(inputs, self.keys["privkey"], self.keys["pubkey"], [TxOutput(self.keys["pubkey"], 1.0)])
+        last = chain.last_block()
+        forged = BlockStruct(last.id + 1, last.hash(), [self.forge(tx), Tx.coinbase(self.keys["pubkey"])], 0)
+        self.assertFalse(chain.add_block(forged))
+        self.assertTrue(chain.add_block(BlockStruct(last.id + 1, last.hash(), [tx, Tx.coinbase(self.keys["pubkey"])], 0)))
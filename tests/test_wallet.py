@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import jocoin.crypto as jc
+import jocoin.network as nw
+from jocoin.client import Client
+from jocoin.tx import TxOutput
+from jocoin.wallet import Wallet
+from .test_client import LocalNetwork, EASY
+
+
+@mock.patch("jocoin.chain.DIFFICULTY", EASY)
+@mock.patch("jocoin.client.DIFFICULTY", EASY)
+class TestWallet(unittest.TestCase):
+    def setUp(self):
+        self.network = LocalNetwork()
+        patcher = mock.patch("jocoin.network.send_message", self.network.send_message)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.keys = [jc.gen_keys(256) for i in range(2)]
+        self.node = Client(self.keys[0]["pubkey"], self.keys[0]["privkey"], [], ("a", 1))
+        self.network.add(self.node)
+        self.node.chain.enable_address_index()
+        self.node.publish_snapshot()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "my.key.wallet")
+        self.wallet = Wallet(self.keys[0]["pubkey"], self.path)
+
+    def mine_blocks(self, n):
+        for i in range(n):
+            self.node.keep_mining = True
+            self.assertTrue(self.node.add_block(self.node.mine()))
+
+    def assert_in_sync(self, wallet):
+        expected = {inp.outpoint(): amount for inp, amount in self.node.chain.valid_inputs_for(wallet.pubkey)}
+        self.assertEqual(wallet.outputs, expected)
+
+    def transfer(self, amount, fee=0.0):
+        tx = self.wallet.make_tx(self.keys[0]["privkey"], [TxOutput(self.keys[1]["pubkey"], amount)], fee)
+        self.assertEqual(nw.request_transfer(("a", 1), tx), "SUCCESS")
+        return tx
+
+    def test_syncs_incrementally(self):
+        self.mine_blocks(3)
+        self.wallet.sync(("a", 1))
+        self.assert_in_sync(self.wallet)
+        self.mine_blocks(2)
+        self.network.sent.clear()
+        self.wallet.sync(("a", 1))
+        self.assert_in_sync(self.wallet)
+        self.assertEqual(self.network.sent[0][0], nw.HISTORY)
+        self.assertEqual(len(self.network.sent), 1)
+
+    def test_holds_back_unconfirmed_spends(self):
+        self.mine_blocks(2)
+        self.wallet.sync(("a", 1))
+        first = self.transfer(10.0)
+        # Another transfer before the first is mined spends something else
+        second = self.transfer(4.0)
+        self.assertFalse(set(first.inputs) & set(second.inputs))
+        self.assertEqual(len(self.wallet.spendable()), 0)
+        self.mine_blocks(1)
+        self.wallet.sync(("a", 1))
+        self.assert_in_sync(self.wallet)
+        self.assertEqual(self.wallet.pending, {})
+
+    def test_fee_outputs(self):
+        self.mine_blocks(2)
+        self.wallet.sync(("a", 1))
+        self.transfer(3.0, fee=0.5)
+        self.mine_blocks(1)
+        self.wallet.sync(("a", 1))
+        self.assert_in_sync(self.wallet)
+
+    def test_resyncs_after_reorganization(self):
+        self.mine_blocks(2)
+        self.wallet.sync(("a", 1))
+        # As if the block holding the last tx we saw was replaced
+        self.wallet.last = (self.wallet.last[0] + 1, 0)
+        self.wallet.outputs[(1, 0, 0)] = 100.0
+        self.mine_blocks(1)
+        self.wallet.sync(("a", 1))
+        self.assert_in_sync(self.wallet)
+
+    def test_saves_and_loads(self):
+        self.mine_blocks(2)
+        self.wallet.sync(("a", 1))
+        self.transfer(1.0)
+        self.wallet.save()
+        wallet = Wallet.load(self.keys[0]["pubkey"], self.path)
+        self.assertEqual(wallet.outputs, self.wallet.outputs)
+        self.assertEqual(wallet.pending, self.wallet.pending)
+        self.assertEqual((wallet.synced, wallet.last, wallet.tip), (self.wallet.synced, self.wallet.last, self.wallet.tip))
+        self.assertEqual(Wallet.load(self.keys[1]["pubkey"], self.path).outputs, {})
+
+    def test_node_without_index(self):
+        self.node.chain.address_index = None
+        self.node.publish_snapshot()
+        self.mine_blocks(3)
+        with mock.patch("jocoin.wallet.Wallet.PAGE_SIZE", 2):
+            self.wallet.sync(("a", 1))
+        self.assert_in_sync(self.wallet)
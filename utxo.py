@@ -0,0 +1,44 @@
+import optparse
+import sys
+from jocoin.chain import BlockChain
+from jocoin.store import BlockStore
+from jocoin.utxosnapshot import UtxoSnapshot, SnapshotError
+
+
+if __name__ == "__main__":
+    usage = """usage: %prog <command> [<args>]
+
+Available commands:
+    export <datadir> <file> [<block hash>]: Write the unspent outputs of the (stopped) node keeping its chain in <datadir>
+        as of <block hash>, or its tip, to <file>, for new nodes to start from with node.py -S <file>
+    info <file>: Show the block a snapshot was taken at, and its commitment"""
+
+    parser = optparse.OptionParser(usage=usage)
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.print_help()
+        sys.exit()
+
+    command = args[0]
+    if command == "export" and len(args) in (3, 4):
+        store = BlockStore(args[1])
+        chain = BlockChain.from_store(store)
+        block_hash = int(args[3]) if len(args) == 4 else None
+        try:
+            snapshot = UtxoSnapshot.from_chain(chain, block_hash)
+        except SnapshotError as e:
+            parser.error(str(e))
+        snapshot.save(args[2])
+        store.close()
+        print("Block {} at height {}, {} unspent outputs".format(snapshot.base.hash(), len(snapshot.headers), len(snapshot.utxos)))
+        print("Commitment: {}".format(snapshot.commitment))
+    elif command == "info" and len(args) == 2:
+        try:
+            snapshot = UtxoSnapshot.load(args[1])
+        except SnapshotError as e:
+            parser.error(str(e))
+        print("Block {} at height {}, {} unspent outputs".format(snapshot.base.hash(), len(snapshot.headers), len(snapshot.utxos)))
+        print("Commitment: {}".format(snapshot.commitment))
+    else:
+        parser.print_help()